@@ -0,0 +1,375 @@
+"""
+多数のファイルをスレッドプールで並列にコピーするモジュール
+
+コピー先に同じサイズ・同じ更新日時のファイルがあればコピーしない。
+Linux ではリフリンク（FICLONE、Btrfs・XFS などで内容を共有するコピー）と
+os.copy_file_range（カーネル内でのコピー）を順に試し、使えなければ shutil.copyfile でコピーする。
+
+コピー先の名前が重なったときの扱い（conflict）:
+    'tree'   : コピー元のフォルダ構成を保ってコピーする
+    'suffix' : コピー先のフォルダにまとめ、重なった名前には _1, _2 ... を付ける（ソート順で決まる）
+    'skip'   : コピー先のフォルダにまとめ、重なった名前はソート順で最初のファイルだけをコピーする
+
+内容が同じファイルの扱い（dedup）:
+    'hardlink' : ソート順で最初のファイルだけをコピーし、ほかはそのコピーへのハードリンクにする
+    'skip'     : ソート順で最初のファイルだけをコピーする
+内容が同じかどうかは、サイズ → 先頭と末尾の部分ハッシュ → 全体のハッシュの順に絞り込んで調べる。
+"""
+
+import errno
+import hashlib
+import os
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+CONFLICT_POLICIES = ('tree', 'suffix', 'skip')
+DEDUP_MODES = ('hardlink', 'skip')
+
+# Linux の FICLONE ioctl（fcntl.FICLONE は Python 3.12 以降にしかない）
+FICLONE = 0x40049409
+# copy_file_range で一度にコピーするバイト数
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+# 部分ハッシュで読む先頭と末尾のバイト数
+PARTIAL_HASH_SIZE = 64 * 1024
+# 全体のハッシュで一度に読むバイト数
+HASH_CHUNK_SIZE = 1024 * 1024
+# 高速なコピーが使えないときに返るエラー
+_UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF,
+                       errno.EPERM}
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# 高速なコピーが使えなかった (コピー元のデバイス, コピー先のデバイス) の組
+_reflink_unsupported = set()
+_copy_range_unsupported = set()
+_unsupported_lock = threading.Lock()
+
+
+def plan_destinations(sources, dest, conflict='suffix', source_root=None):
+    """
+    コピー元ごとのコピー先を決める
+
+    コピー元をソートしてから決めるので、何度実行しても同じファイルが同じ名前になる。
+
+    Args:
+        sources (list): コピー元のファイルのパスのリスト
+        dest (str): コピー先のフォルダ
+        conflict (str): 名前が重なったときの扱い（'tree', 'suffix', 'skip'）
+        source_root (str): 'tree' のときに相対パスの基準にするフォルダ
+
+    Returns:
+        tuple: ((コピー元, コピー先) のリスト, 名前が重なってスキップしたコピー元のリスト)
+    """
+    if conflict not in CONFLICT_POLICIES:
+        raise ValueError(f'対応していない conflict です: {conflict}')
+    if conflict == 'tree' and source_root is None:
+        raise ValueError("conflict='tree' には source_root が必要です")
+
+    pairs = []
+    skipped = []
+    used_names = set()
+    for src in sorted(sources):
+        if conflict == 'tree':
+            pairs.append((src, os.path.join(dest, os.path.relpath(src, source_root))))
+            continue
+
+        name = os.path.basename(src)
+        if name in used_names:
+            if conflict == 'skip':
+                skipped.append(src)
+                continue
+            stem, ext = os.path.splitext(name)
+            number = 1
+            while f'{stem}_{number}{ext}' in used_names:
+                number += 1
+            name = f'{stem}_{number}{ext}'
+        used_names.add(name)
+        pairs.append((src, os.path.join(dest, name)))
+    return pairs, skipped
+
+
+def _partial_hash(path, size):
+    """ファイルの先頭と末尾だけを読んだハッシュを返す"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        digest.update(f.read(PARTIAL_HASH_SIZE))
+        if size > PARTIAL_HASH_SIZE:
+            f.seek(max(size - PARTIAL_HASH_SIZE, PARTIAL_HASH_SIZE))
+            digest.update(f.read(PARTIAL_HASH_SIZE))
+    return digest.digest()
+
+
+def _full_hash(path):
+    """ファイル全体のハッシュを返す"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def _group_by(executor, paths, key_func):
+    """パスをキーごとに分け、2つ以上あるグループだけを返す（読めないファイルは除く）"""
+    groups = {}
+    futures = [(path, executor.submit(key_func, path)) for path in paths]
+    for path, future in futures:
+        try:
+            groups.setdefault(future.result(), []).append(path)
+        except OSError:
+            continue
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def find_duplicates(paths, workers=8):
+    """
+    内容が同じファイルを探す
+
+    サイズが同じファイルだけ部分ハッシュを計算し、部分ハッシュも同じファイルだけ全体のハッシュを計算する。
+
+    Args:
+        paths (list): ファイルのパスのリスト
+        workers (int): ハッシュの計算に使うスレッド数
+
+    Returns:
+        dict: 重複したファイルのパス → 同じ内容でソート順が最初のファイルのパス
+    """
+    by_size = {}
+    for path in paths:
+        try:
+            by_size.setdefault(os.stat(path).st_size, []).append(path)
+        except OSError:
+            continue
+
+    duplicates = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for size, group in by_size.items():
+            if len(group) < 2:
+                continue
+            if size == 0:
+                candidates = [group]
+            else:
+                candidates = []
+                for partial_group in _group_by(executor, group, lambda path: _partial_hash(path, size)):
+                    # 部分ハッシュで全体を読んだ小さいファイルは、全体のハッシュを計算しなくてよい
+                    if size <= PARTIAL_HASH_SIZE * 2:
+                        candidates.append(partial_group)
+                    else:
+                        candidates.extend(_group_by(executor, partial_group, _full_hash))
+            for same in candidates:
+                original, *others = sorted(same)
+                duplicates.update((other, original) for other in others)
+    return duplicates
+
+
+def is_up_to_date(src_stat, dst):
+    """コピー先がコピー元と同じサイズ・同じ更新日時ならTrueを返す"""
+    try:
+        dst_stat = os.stat(dst)
+    except OSError:
+        return False
+    return dst_stat.st_size == src_stat.st_size and dst_stat.st_mtime_ns == src_stat.st_mtime_ns
+
+
+def _try_reflink(src_file, dst_file, devices):
+    """リフリンクでコピーする。使えなければFalseを返す"""
+    if fcntl is None or not sys.platform.startswith('linux') or devices in _reflink_unsupported:
+        return False
+    try:
+        fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+        return True
+    except OSError as e:
+        if e.errno not in _UNSUPPORTED_ERRNOS:
+            raise
+        with _unsupported_lock:
+            _reflink_unsupported.add(devices)
+        return False
+
+
+def _try_copy_file_range(src_file, dst_file, size, devices):
+    """os.copy_file_range でコピーする。使えなければFalseを返す"""
+    if not hasattr(os, 'copy_file_range') or devices in _copy_range_unsupported:
+        return False
+    copied = 0
+    try:
+        while copied < size:
+            sent = os.copy_file_range(src_file.fileno(), dst_file.fileno(), min(COPY_CHUNK_SIZE, size - copied))
+            if sent == 0:
+                break
+            copied += sent
+        return True
+    except OSError as e:
+        # 途中まで書いていなければ他の方法でやり直せる
+        if e.errno not in _UNSUPPORTED_ERRNOS or copied:
+            raise
+        with _unsupported_lock:
+            _copy_range_unsupported.add(devices)
+        return False
+
+
+def copy_file_fast(src, dst, src_stat=None):
+    """
+    ファイルをコピーして更新日時などの属性も写す
+
+    一時ファイルに書いてから置き換えるので、途中で失敗してもコピー先が壊れたファイルにならない。
+
+    Args:
+        src (str): コピー元のファイル
+        dst (str): コピー先のファイル
+        src_stat (os.stat_result): コピー元の stat（省略した場合は調べる）
+
+    Returns:
+        str: 使った方法（'reflink', 'copy_file_range', 'copyfile'）
+    """
+    src_stat = src_stat or os.stat(src)
+    dst_dir = os.path.dirname(dst) or '.'
+    os.makedirs(dst_dir, exist_ok=True)
+    devices = (src_stat.st_dev, os.stat(dst_dir).st_dev)
+
+    tmp = f'{dst}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(src, 'rb') as src_file, open(tmp, 'wb') as dst_file:
+            if _try_reflink(src_file, dst_file, devices):
+                method = 'reflink'
+            elif _try_copy_file_range(src_file, dst_file, src_stat.st_size, devices):
+                method = 'copy_file_range'
+            else:
+                method = 'copyfile'
+        if method == 'copyfile':
+            shutil.copyfile(src, tmp)
+        shutil.copystat(src, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return method
+
+
+def _copy_one(src, dst):
+    """1つのファイルをコピーする（ワーカースレッドで実行される）"""
+    try:
+        src_stat = os.stat(src)
+        if is_up_to_date(src_stat, dst):
+            return src, dst, 'up_to_date', 0, None
+        method = copy_file_fast(src, dst, src_stat)
+        return src, dst, method, src_stat.st_size, None
+    except OSError as e:
+        return src, dst, 'failed', 0, f'{type(e).__name__}: {e}'
+
+
+def _link_duplicate(src, dst, original_dst):
+    """重複したファイルを、同じ内容のファイルのコピーへのハードリンクにする（ワーカースレッドで実行される）"""
+    try:
+        if os.path.exists(dst) and os.path.samefile(dst, original_dst):
+            return src, dst, 'up_to_date', 0, None
+        os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+        tmp = f'{dst}.{os.getpid()}.{threading.get_ident()}.tmp'
+        os.link(original_dst, tmp)
+        os.replace(tmp, dst)
+        return src, dst, 'hardlink', 0, None
+    except OSError:
+        # ハードリンクを作れないファイルシステムではコピーする
+        return _copy_one(src, dst)
+
+
+def _is_linked(result, original_dst):
+    """_link_duplicate の結果が、同じ内容のファイルのコピーへのハードリンクかどうか"""
+    src, dst, method, size, error = result
+    if error or method not in ('hardlink', 'up_to_date'):
+        return False
+    try:
+        return method == 'hardlink' or os.path.samefile(dst, original_dst)
+    except OSError:
+        return False
+
+
+def bulk_copy(sources, dest, conflict='suffix', source_root=None, workers=8, status_callback=None, dedup=None):
+    """
+    多数のファイルを並列にコピーする
+
+    Args:
+        sources (list): コピー元のファイルのパスのリスト
+        dest (str): コピー先のフォルダ
+        conflict (str): 名前が重なったときの扱い（'tree', 'suffix', 'skip'）
+        source_root (str): 'tree' のときに相対パスの基準にするフォルダ
+        workers (int): コピーに使うスレッド数
+        status_callback (function): (コピー元, コピー先, 結果) を受け取るコールバック関数
+        dedup (str): 内容が同じファイルの扱い（'hardlink', 'skip'）。省略した場合はすべてコピーする
+
+    Returns:
+        dict: コピーした数・変更がなくスキップした数・名前が重なってスキップした数・バイト数・
+              方法ごとの数・重複したファイル数と節約したバイト数・エラーのリスト・処理時間
+    """
+    if dedup is not None and dedup not in DEDUP_MODES:
+        raise ValueError(f'対応していない dedup です: {dedup}')
+    start = time.perf_counter()
+    pairs, conflicts = plan_destinations(sources, dest, conflict, source_root)
+    os.makedirs(dest, exist_ok=True)
+
+    duplicates = find_duplicates([src for src, _ in pairs], workers) if dedup else {}
+    destinations = dict(pairs)
+    failed = set()
+
+    summary = {
+        'copied': 0,
+        'up_to_date': 0,
+        'conflict_skipped': len(conflicts),
+        'bytes': 0,
+        'methods': {},
+        'duplicates': len(duplicates),
+        'bytes_saved': 0,
+        'errors': [],
+    }
+
+    def record(src, dst, result, size, error):
+        if error:
+            failed.add(src)
+            summary['errors'].append((src, error))
+        elif result == 'up_to_date':
+            summary['up_to_date'] += 1
+        else:
+            summary['copied'] += 1
+            summary['bytes'] += size
+            summary['methods'][result] = summary['methods'].get(result, 0) + 1
+        if status_callback:
+            status_callback(src, dst, error or result)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # 重複していないファイルと、同じ内容のファイルのうち最初のものを先にコピーする
+        originals = [(src, dst) for src, dst in pairs if src not in duplicates]
+        for result in executor.map(lambda pair: _copy_one(*pair), originals):
+            record(*result)
+
+        linked = []
+        for src, dst in pairs:
+            if src not in duplicates:
+                continue
+            original = duplicates[src]
+            if original in failed:
+                # 最初のファイルのコピーに失敗したときは、重複したファイルを普通にコピーする
+                linked.append((executor.submit(_copy_one, src, dst), 0))
+                continue
+            size = os.stat(original).st_size
+            if dedup == 'skip':
+                summary['bytes_saved'] += size
+                if status_callback:
+                    status_callback(src, dst, 'duplicate')
+                continue
+            linked.append((executor.submit(_link_duplicate, src, dst, destinations[original]), size))
+        for future, size in linked:
+            result = future.result()
+            record(*result)
+            # ハードリンクになったときだけ節約したバイト数に数える（コピーに切り替えたときや失敗したときは数えない）
+            if size and _is_linked(result, destinations[duplicates[result[0]]]):
+                summary['bytes_saved'] += size
+
+    summary['elapsed'] = round(time.perf_counter() - start, 3)
+    return summary
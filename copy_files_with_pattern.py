@@ -1,24 +1,187 @@
+"""
+ファイル名にパターンを含むファイルを探してコピーするツール
+
+複数のパターン・拡張子を1つのコンパイル済みの正規表現にまとめ、フォルダを1回たどるだけで探す。
+パターンは部分一致のほか、glob（fnmatch 形式）と正規表現でも指定できる（--mode）。
+パターンを指定しなければ、従来どおり入力を求めて test フォルダから new フォルダにコピーする。
+
+例:
+    python copy_files_with_pattern.py sales invoice -e .csv -e .tsv -s exports -d collected
+    python copy_files_with_pattern.py sales --list
+    python copy_files_with_pattern.py "sales_2024-??.csv" --mode glob
+    python copy_files_with_pattern.py "^(sales|invoice)_\d{6}" --mode regex -e "*"
+"""
+
+import argparse
+import fnmatch
 import os
-import shutil
+import re
+import sys
+
+from bulk_copier import CONFLICT_POLICIES, DEDUP_MODES, bulk_copy
+from file_name_index import SEARCH_MODES, FileNameIndex
+
+
+def compile_name_matcher(patterns, extensions=(".csv",), ignore_case=False, mode="substring"):
+    """
+    ファイル名がいずれかのパターンに一致し、いずれかの拡張子で終わるかを調べる関数を作る
+
+    パターンは1つの正規表現の選択（a|b|c）にまとめてコンパイルするので、
+    パターンの数が増えてもファイル名ごとの照合は1回で済む。
 
+    Args:
+        patterns (list): パターンのリスト
+        extensions (list): 拡張子のリスト。空の場合はすべて
+        ignore_case (bool): パターンの大文字と小文字を区別しないかどうか
+        mode (str): 'substring'（ファイル名に含まれる文字列）、'glob'（ファイル名全体に一致する fnmatch 形式）、
+            'regex'（ファイル名のどこかに一致する正規表現）
+
+    Returns:
+        function: ファイル名を受け取り、一致すればTrueを返す関数
+    """
+    flags = re.IGNORECASE if ignore_case else 0
+    if mode == "substring":
+        # 長いパターンを先に置くと、共通の先頭部分を持つパターンでも結果は同じで照合が速い
+        alternatives = sorted(set(patterns), key=len, reverse=True)
+        regex = re.compile('|'.join(map(re.escape, alternatives)), flags)
+    elif mode == "glob":
+        # fnmatch.translate の正規表現は末尾だけが固定されるので、先頭も固定してファイル名全体に一致させる
+        regex = re.compile('|'.join(f'\\A(?:{fnmatch.translate(pattern)})' for pattern in dict.fromkeys(patterns)),
+                           flags)
+    elif mode == "regex":
+        regex = re.compile('|'.join(f'(?:{pattern})' for pattern in dict.fromkeys(patterns)), flags)
+    else:
+        raise ValueError(f'対応していない検索方法です: {mode}')
+    suffixes = tuple(ext.lower() for ext in extensions) if extensions else None
+
+    def match(name):
+        if suffixes is not None and not name.lower().endswith(suffixes):
+            return False
+        return regex.search(name) is not None
 
-def copy_files_with_pattern(pattern_str):
+    return match
+
+
+def iter_matching_files(patterns, sources=("test",), extensions=(".csv",), use_index=True, ignore_case=False,
+                        mode="substring"):
+    """
+    パターンに一致するファイルを見つけた順に返すジェネレーター
+
+    Args:
+        patterns (list): パターンのリスト
+        sources (list): 検索するフォルダのリスト
+        extensions (list): 拡張子のリスト。空の場合はすべて
+        use_index (bool): ファイル名の索引を使うかどうか（False の場合は os.walk で探す）
+        ignore_case (bool): パターンの大文字と小文字を区別しないかどうか
+        mode (str): パターンの種類（'substring', 'glob', 'regex'）
+
+    Yields:
+        str: 一致したファイルのパス
+    """
+    match = compile_name_matcher(patterns, extensions, ignore_case, mode)
+
+    for source in sources:
+        if not use_index:
+            for root, dirs, files in os.walk(source):
+                for file in files:
+                    if match(file):
+                        yield os.path.join(root, file)
+            continue
+
+        with FileNameIndex(source) as index:
+            index.refresh()
+            if ignore_case:
+                # trigram の索引は大文字と小文字を区別するので、索引のすべての名前を1回だけ照合する
+                candidates = index.iter_paths(extensions)
+            else:
+                # すべてのパターンを1回の問い合わせで索引から絞り込む
+                candidates = index.search_any(patterns, mode=mode, extensions=extensions)
+            # 索引の GLOB と fnmatch の細かな違いが出ないように、候補をフォルダをたどる場合と同じ関数で照合する
+            for path in candidates:
+                if match(os.path.basename(path)):
+                    yield path
+
+
+def copy_files_with_pattern(pattern_str, use_index=True, conflict="suffix", workers=8, sources=("test",),
+                            dest="new", extensions=(".csv",), ignore_case=False, dedup=None, mode="substring"):
     """
     指定されたパターンを含むファイルをtestフォルダから探してnewフォルダにコピーする
 
+    newフォルダに同じサイズ・同じ更新日時のファイルがあればコピーしない。
+
     Args:
-        pattern_str (str): 検索するファイル名のパターン
+        pattern_str (str | list): 検索するファイル名のパターン（複数の場合はリスト）
+        use_index (bool): ファイル名の索引を使うかどうか
+        conflict (str): 同じ名前のファイルがあるときの扱い
+            （'tree': フォルダ構成を保つ, 'suffix': _1, _2 ... を付ける, 'skip': 最初のファイルだけコピーする）
+        workers (int): コピーに使うスレッド数
+        sources (list): 検索するフォルダのリスト
+        dest (str): コピー先のフォルダ
+        extensions (list): 拡張子のリスト。空の場合はすべて
+        ignore_case (bool): パターンの大文字と小文字を区別しないかどうか
+        dedup (str): 内容が同じファイルの扱い（'hardlink': ハードリンクにする, 'skip': コピーしない）
+        mode (str): パターンの種類（'substring', 'glob', 'regex'）
+
+    Returns:
+        dict: コピー結果のサマリー
     """
-    os.makedirs("new", exist_ok=True)
+    patterns = [pattern_str] if isinstance(pattern_str, str) else list(pattern_str)
+    matches = list(iter_matching_files(patterns, sources, extensions, use_index, ignore_case, mode))
+    source_root = sources[0] if len(sources) == 1 else os.path.commonpath([os.path.abspath(s) for s in sources])
+    return bulk_copy(matches, dest, conflict=conflict, source_root=source_root, workers=workers, dedup=dedup)
+
+
+def parse_args(argv=None):
+    """コマンドライン引数を解析する"""
+    parser = argparse.ArgumentParser(description='ファイル名にパターンを含むファイルを探してコピーします。')
+    parser.add_argument('patterns', nargs='*', help='ファイル名のパターン (省略時は入力を求める)')
+    parser.add_argument('-m', '--mode', choices=SEARCH_MODES, default='substring',
+                        help='パターンの種類 (substring: 含まれる文字列, glob: ファイル名全体の fnmatch 形式, regex: 正規表現)')
+    parser.add_argument('-s', '--source', action='append', help='検索するフォルダ (複数指定可、省略時は test)')
+    parser.add_argument('-d', '--dest', default='new', help='コピー先のフォルダ')
+    parser.add_argument('-e', '--ext', action='append',
+                        help='拡張子 (複数指定可、省略時は .csv、"*" ですべて)')
+    parser.add_argument('-i', '--ignore-case', action='store_true', help='大文字と小文字を区別しない')
+    parser.add_argument('--conflict', choices=CONFLICT_POLICIES, default='suffix', help='同じ名前のファイルの扱い')
+    parser.add_argument('--dedup', choices=DEDUP_MODES, help='内容が同じファイルをハードリンクにする・コピーしない')
+    parser.add_argument('-j', '--workers', type=int, default=8, help='コピーに使うスレッド数')
+    parser.add_argument('--no-index', action='store_true', help='ファイル名の索引を使わずにフォルダをたどる')
+    parser.add_argument('--list', action='store_true', help='コピーせずに一致したファイルを表示する')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """コマンドラインからファイルを探してコピーする"""
+    args = parse_args(argv)
+
+    patterns = args.patterns or [input("検索するパターンを入力してください: ")]
+    sources = args.source or ["test"]
+    extensions = [] if args.ext == ['*'] else [
+        ext if ext.startswith('.') else f'.{ext}' for ext in (args.ext or ['.csv'])]
+    try:
+        compile_name_matcher(patterns, extensions, args.ignore_case, args.mode)
+    except re.error as e:
+        print(f'パターンが正しくありません: {e}', file=sys.stderr)
+        return 1
+
+    if args.list:
+        for path in iter_matching_files(patterns, sources, extensions, not args.no_index, args.ignore_case,
+                                        args.mode):
+            print(path)
+        return 0
 
-    for root, dirs, files in os.walk("test"):
-        for file in files:
-            if file.endswith(".csv") and pattern_str in file:
-                src = os.path.join(root, file)
-                dst = os.path.join("new", file)
-                shutil.copy2(src, dst)
+    summary = copy_files_with_pattern(patterns, use_index=not args.no_index, conflict=args.conflict,
+                                      workers=args.workers, sources=sources, dest=args.dest,
+                                      extensions=extensions, ignore_case=args.ignore_case, dedup=args.dedup,
+                                      mode=args.mode)
+    for src, error in summary['errors']:
+        print(f'エラー: {src}: {error}', file=sys.stderr)
+    print(f"コピー: {summary['copied']} 件, 変更なし: {summary['up_to_date']} 件, "
+          f"名前の重複でスキップ: {summary['conflict_skipped']} 件 ({summary['elapsed']} 秒)")
+    if args.dedup:
+        print(f"内容の重複: {summary['duplicates']} 件, 節約: {summary['bytes_saved'] / 1e6:,.1f} MB")
+    return 1 if summary['errors'] else 0
 
 
 if __name__ == "__main__":
-    pattern = input("検索するパターンを入力してください: ")
-    copy_files_with_pattern(pattern)
\ No newline at end of file
+    sys.exit(main())
@@ -1,53 +1,746 @@
 # Description: フォルダ全体をZIPファイルにバックアップする。
+# 差分バックアップでは前回から変更されたファイルだけを保存し、任意の時点の状態に復元できる。
+# 圧縮する場合は、メンバーの圧縮をスレッドプールで並列に行う。
+# 作成したバックアップは verify で検証できる（CRC-32 と、マニフェストまたは元のファイルとの照合）。
 
+import bz2
+import hashlib
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import threading
+import time
 import zipfile
+import zlib
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
 
+# 差分バックアップのZIPに格納するマニフェストの名前
+MANIFEST_NAME = '.backup_manifest.json'
+# ハッシュ計算・復元時に一度に読み書きするバイト数
+CHUNK_SIZE = 1024 * 1024
+
+# 選択できる圧縮方式
+COMPRESSION_METHODS = {
+    'deflate': zipfile.ZIP_DEFLATED,
+    'bzip2': zipfile.ZIP_BZIP2,
+    'lzma': zipfile.ZIP_LZMA,
+}
+
+# すでに圧縮されているため再圧縮しない拡張子
+ALREADY_COMPRESSED_SUFFIXES = {
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic',
+    '.mp3', '.m4a', '.aac', '.ogg', '.flac', '.mp4', '.mov', '.mkv', '.avi',
+    '.zip', '.gz', '.bz2', '.xz', '.7z', '.rar', '.lzh',
+    '.docx', '.xlsx', '.pptx', '.odt', '.ods', '.odp',
+}
+
+# この大きさまでのファイルはワーカースレッドがメモリ上で圧縮する（大きいファイルは書き込み側で逐次圧縮）
+PARALLEL_MAX_FILE_SIZE = 16 * 1024 * 1024
+# この大きさを超えるファイルは最初からZIP64のメンバーとして書き込む（書き込み中に大きくなっても失敗しないように余裕をとる）
+FORCE_ZIP64_SIZE = zipfile.ZIP64_LIMIT // 2
+# 進捗を表示する間隔（秒）
+PROGRESS_INTERVAL = 1.0
+# クイック検証で調べるメンバーの割合と最小数
+QUICK_VERIFY_FRACTION = 0.05
+QUICK_VERIFY_MIN_MEMBERS = 100
+
+
+def list_backups(folder_name, backup_folder):
+    """
+    既存のバックアップファイルを番号順に返す関数。
+
+    :param folder_name: バックアップをとるフォルダの名前
+    :param backup_folder: バックアップ先のフォルダ
+    :return: (番号, パス) のリスト
+    """
+    pattern = re.compile(rf'{re.escape(folder_name)}_(\d+)\.zip')
+    backups = []
+    with os.scandir(backup_folder) as entries:
+        for entry in entries:
+            match = pattern.fullmatch(entry.name)
+            if match and entry.is_file():
+                backups.append((int(match.group(1)), Path(entry.path)))
+    return sorted(backups)
+
 
 def generate_unique_backup_filename(folder, backup_folder):
     """
     バックアップファイル名を生成する関数。
 
+    既存のバックアップを1回だけ走査し、最大の番号の次の番号を使う。
+
     :param folder: バックアップをとるフォルダ
     :param backup_folder: バックアップ先のフォルダ
     :return:
     """
     folder_name = folder.name
-    number = 1
-    while True:
-        zip_filename = f'{folder_name}_{number}.zip'
-        backup_zip_path = backup_folder / zip_filename
-        if not backup_zip_path.exists():
-            return backup_zip_path
-        number += 1
+    backups = list_backups(folder_name, backup_folder)
+    number = backups[-1][0] + 1 if backups else 1
+    return backup_folder / f'{folder_name}_{number}.zip'
+
+
+def iter_backup_entries(folder):
+    """
+    フォルダ内のファイルを os.scandir で順に返すジェネレーター。
+
+    フォルダの一覧をまとめて作らずに1つずつ返すので、項目数が多くてもメモリ使用量が増えない。
+    フォルダ自体は返さず、中身が空のフォルダだけを stat が None の項目として返す。
+    フォルダへのシンボリックリンクはたどらない。
+
+    :param folder: バックアップをとるフォルダ
+    :return: (パス, フォルダからの相対パス（'/' 区切り）, stat) を順に返す
+    """
+    stack = [(os.fspath(folder), '')]
+    while stack:
+        directory, rel_dir = stack.pop()
+        empty = True
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    empty = False
+                    rel_path = rel_dir + entry.name
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append((entry.path, rel_path + '/'))
+                        elif entry.is_file():
+                            yield entry.path, rel_path, entry.stat()
+                    except OSError as e:
+                        print(f'\nスキップ: {entry.path} ({e})', file=sys.stderr)
+        except OSError as e:
+            print(f'\nスキップ: {directory} ({e})', file=sys.stderr)
+            continue
+        if empty and rel_dir:
+            yield directory, rel_dir, None
 
 
-def backup_to_zip(folder, backup_folder):
+def count_backup_entries(folder):
+    """
+    ETAを表示するために、フォルダ内のファイル数と合計バイト数を数える関数。
+
+    :param folder: バックアップをとるフォルダ
+    :return: (ファイル数, 合計バイト数)
+    """
+    total_files = 0
+    total_bytes = 0
+    for _, _, stat in iter_backup_entries(folder):
+        if stat is not None:
+            total_files += 1
+            total_bytes += stat.st_size
+    return total_files, total_bytes
+
+
+class BackupProgress:
+    """
+    処理したファイル数・バイト数と速度（件/s, MB/s）・残り時間を一定間隔で1行に表示するクラス。
+
+    ファイルごとに表示するとファイル数が多いときに表示が処理の妨げになるので、
+    PROGRESS_INTERVAL 秒に1回だけ同じ行を上書きする。
+    """
+
+    def __init__(self, total_files=None, total_bytes=None, interval=PROGRESS_INTERVAL, stream=None):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.interval = interval
+        self.stream = stream or sys.stdout
+        self.files = 0
+        self.bytes = 0
+        self.start = time.monotonic()
+        self.last_report = self.start
+
+    def update(self, files=1, nbytes=0):
+        """処理したファイル数とバイト数を加算し、前回の表示から一定時間たっていれば表示する"""
+        self.files += files
+        self.bytes += nbytes
+        now = time.monotonic()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report(now)
+
+    def report(self, now=None):
+        """現在の進捗を表示する"""
+        elapsed = max((now or time.monotonic()) - self.start, 1e-9)
+        files_per_sec = self.files / elapsed
+        bytes_per_sec = self.bytes / elapsed
+
+        line = (f'{self.files:,} 件 {self.bytes / 1e6:,.1f} MB'
+                f' | {files_per_sec:,.0f} 件/s {bytes_per_sec / 1e6:,.1f} MB/s')
+        if self.total_files:
+            line += f' | {self.files / self.total_files:.1%}'
+            # バイト数で見積もれるときはバイト数、できないときはファイル数で残り時間を計算する
+            if self.total_bytes and bytes_per_sec > 0:
+                remaining = max(self.total_bytes - self.bytes, 0) / bytes_per_sec
+            elif files_per_sec > 0:
+                remaining = max(self.total_files - self.files, 0) / files_per_sec
+            else:
+                remaining = None
+            if remaining is not None:
+                minutes, seconds = divmod(int(remaining), 60)
+                hours, minutes = divmod(minutes, 60)
+                line += f' | 残り {hours}:{minutes:02d}:{seconds:02d}'
+
+        self.stream.write(f'\r{line}\x1b[K')
+        self.stream.flush()
+
+    def finish(self):
+        """最終的な進捗を表示して改行する"""
+        self.report()
+        self.stream.write('\n')
+        self.stream.flush()
+
+
+def hash_file(path):
+    """
+    ファイル内容のSHA-256ハッシュを返す関数。
+
+    :param path: ファイルのパス
+    :return: 16進数のハッシュ文字列
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _new_compressor(compress_type, level):
+    """zipfile と同じ形式のデータを出力する圧縮オブジェクトを返す"""
+    if compress_type == zipfile.ZIP_DEFLATED:
+        return zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION if level is None else level, zlib.DEFLATED, -15)
+    if compress_type == zipfile.ZIP_BZIP2:
+        return bz2.BZ2Compressor(9 if level is None else level)
+    return zipfile.LZMACompressor()
+
+
+def _compress_file(path, compress_type, level):
+    """
+    ファイルを読み込んで圧縮する関数（ワーカースレッドで実行される）。
+
+    :param path: ファイルのパス
+    :param compress_type: 圧縮方式
+    :param level: 圧縮レベル
+    :return: (圧縮済みデータ, CRC-32, 元のサイズ)
+    """
+    compressor = _new_compressor(compress_type, level)
+    crc = 0
+    file_size = 0
+    parts = []
+    with open(path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            crc = zlib.crc32(chunk, crc)
+            file_size += len(chunk)
+            parts.append(compressor.compress(chunk))
+    parts.append(compressor.flush())
+    return b''.join(parts), crc, file_size
+
+
+def _write_compressed_member(zip_file, zinfo, data, crc, file_size):
+    """
+    圧縮済みのデータをメンバーとしてZIPに書き込む関数。
+
+    zipfile には圧縮済みデータを書き込む公開APIがないため、ZipFile.open(..., 'w') が
+    内部で行っている処理（ローカルヘッダー・データの書き込みと中央ディレクトリ用の記録）を行う。
+
+    :param zip_file: 書き込み中の ZipFile
+    :param zinfo: メンバーの ZipInfo
+    :param data: 圧縮済みデータ
+    :param crc: 元のデータのCRC-32
+    :param file_size: 元のデータのサイズ
+    """
+    zinfo.file_size = file_size
+    zinfo.compress_size = len(data)
+    zinfo.CRC = crc
+    zinfo.flag_bits = 0x02 if zinfo.compress_type == zipfile.ZIP_LZMA else 0x00
+    zip64 = file_size > zipfile.ZIP64_LIMIT or len(data) > zipfile.ZIP64_LIMIT
+
+    zip_file.fp.seek(zip_file.start_dir)
+    zinfo.header_offset = zip_file.fp.tell()
+    zip_file._writecheck(zinfo)
+    zip_file._didModify = True
+
+    zip_file.fp.write(zinfo.FileHeader(zip64))
+    zip_file.fp.write(data)
+    zip_file.start_dir = zip_file.fp.tell()
+
+    zip_file.filelist.append(zinfo)
+    zip_file.NameToInfo[zinfo.filename] = zinfo
+
+
+def _write_streamed_member(zip_file, path, arcname, compress_type, level):
+    """
+    ファイルを CHUNK_SIZE ずつ読みながらメンバーとして書き込む関数。
+
+    ファイル全体をメモリに載せないので、大きいファイルでもメモリ使用量は一定になる。
+    4GBを超える可能性のあるファイルは最初からZIP64のメンバーとして書き込む。
+
+    :param zip_file: 書き込み中の ZipFile
+    :param path: 追加するファイルのパス
+    :param arcname: ZIP内での名前
+    :param compress_type: 圧縮方式
+    :param level: 圧縮レベル
+    """
+    zinfo = zipfile.ZipInfo.from_file(path, arcname)
+    if zinfo.is_dir():
+        zip_file.writestr(zinfo, b'')
+        return
+
+    zinfo.compress_type = compress_type
+    zinfo._compresslevel = level
+    with open(path, 'rb') as src, zip_file.open(zinfo, 'w', force_zip64=zinfo.file_size > FORCE_ZIP64_SIZE) as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+
+class ParallelZipWriter:
+    """
+    メンバーの圧縮をスレッドプールで並列に行い、書き込みは呼び出し元のスレッドが追加順に行うクラス。
+
+    zlib・bz2・lzma は圧縮中にGILを解放するので、スレッドでも複数のコアを使える。
+    圧縮済みのデータを保持するメンバー数を制限して、メモリ使用量が増えすぎないようにする。
+    """
+
+    def __init__(self, zip_file, compress_type=zipfile.ZIP_STORED, level=None, workers=None):
+        self.zip_file = zip_file
+        self.compress_type = compress_type
+        self.level = level
+        self.executor = None
+        self.max_pending = 0
+        self.pending = deque()
+
+        if compress_type != zipfile.ZIP_STORED:
+            workers = workers or os.cpu_count() or 1
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+            self.max_pending = workers * 2
+
+    def add(self, path, arcname, size=None):
+        """
+        ファイルを追加する。
+
+        :param path: 追加するファイルまたはフォルダのパス
+        :param arcname: ZIP内での名前
+        :param size: ファイルのサイズ（分かっている場合。省略時は stat で調べる）
+        """
+        path = Path(path)
+        if self.executor is None or path.is_dir():
+            self.flush()
+            _write_streamed_member(self.zip_file, path, arcname, self.compress_type, self.level)
+            return
+
+        if size is None:
+            size = path.stat().st_size
+
+        if path.suffix.lower() in ALREADY_COMPRESSED_SUFFIXES:
+            # 圧縮済みの形式はそのまま格納する
+            self.pending.append((path, arcname, zipfile.ZIP_STORED, None))
+        elif size > PARALLEL_MAX_FILE_SIZE:
+            # 大きいファイルは書き込み時に逐次圧縮する（メモリに載せない）
+            self.pending.append((path, arcname, self.compress_type, None))
+        else:
+            future = self.executor.submit(_compress_file, path, self.compress_type, self.level)
+            self.pending.append((path, arcname, self.compress_type, future))
+
+        while len(self.pending) > self.max_pending:
+            self._write_next()
+
+    def _write_next(self):
+        """追加順で先頭のメンバーを書き込む"""
+        path, arcname, compress_type, future = self.pending.popleft()
+        if future is None:
+            _write_streamed_member(self.zip_file, path, arcname, compress_type, self.level)
+            return
+
+        data, crc, file_size = future.result()
+        zinfo = zipfile.ZipInfo.from_file(path, arcname)
+        zinfo.compress_type = compress_type
+        _write_compressed_member(self.zip_file, zinfo, data, crc, file_size)
+
+    def flush(self):
+        """保留中のメンバーをすべて書き込む"""
+        while self.pending:
+            self._write_next()
+
+    def close(self):
+        """保留中のメンバーを書き込んでスレッドプールを終了する"""
+        try:
+            self.flush()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown(cancel_futures=True)
+
+
+def load_manifest(zip_path):
+    """
+    バックアップに格納されたマニフェストを読み込む関数。
+
+    :param zip_path: バックアップファイルのパス
+    :return: マニフェストの辞書。差分バックアップでない場合は None
+    """
+    with zipfile.ZipFile(zip_path) as backup_zip:
+        if MANIFEST_NAME not in backup_zip.NameToInfo:
+            return None
+        return json.loads(backup_zip.read(MANIFEST_NAME).decode('utf-8'))
+
+
+def backup_to_zip(folder, backup_folder, incremental=False, compression=None, level=None, workers=None,
+                  estimate=True):
     """
     バックアップをZIPファイルにする関数。
 
+    差分バックアップでは、直前のバックアップのマニフェストとサイズ・更新日時を比べて
+    変更されたファイルだけをハッシュ計算し、同じ内容がまだ保存されていないものだけを格納する。
+    マニフェストにはその時点のすべてのファイルと、内容が格納されているバックアップを記録する。
+
     :param folder: バックアップをとるフォルダ
     :param backup_folder: バックアップ先のフォルダ
-    :return:
+    :param incremental: 差分バックアップにするかどうか
+    :param compression: 圧縮方式（'deflate', 'bzip2', 'lzma'）。省略時は無圧縮
+    :param level: 圧縮レベル（deflate: 0-9, bzip2: 1-9。lzma では無視される）
+    :param workers: 圧縮に使うスレッド数（省略時はCPU数に応じて決まる）
+    :param estimate: 先にファイル数と合計サイズを数えて残り時間を表示するかどうか
+    :return: 作成したバックアップファイルのパス
     """
     folder = Path(folder).resolve()
     backup_folder = Path(backup_folder).resolve()
 
+    if compression is None:
+        compress_type = zipfile.ZIP_STORED
+    elif compression in COMPRESSION_METHODS:
+        compress_type = COMPRESSION_METHODS[compression]
+    else:
+        raise ValueError(f'対応していない圧縮方式です: {compression}')
+
     backup_zip_path = generate_unique_backup_filename(folder, backup_folder)
+    previous_files = _load_previous_files(folder.name, backup_folder) if incremental else None
+
+    total_files = total_bytes = None
+    if estimate:
+        print('ファイルを数えています...')
+        total_files, total_bytes = count_backup_entries(folder)
+    progress = BackupProgress(total_files, total_bytes)
 
     # ZIPファイルを作成。
-    print(f'{backup_zip_path.name} を作成中...')
-    with zipfile.ZipFile(backup_zip_path, 'w') as backup_zip:
-        # フォルダ内のすべてのフォルダとファイルをバックアップ。
-        for item in folder.glob('**/*'):
-            print(f'追加中: {item}')
-            arcname = item.relative_to(folder)
-            backup_zip.write(item, arcname=arcname)
+    print(f'{backup_zip_path.name} を作成中{"（差分）" if incremental else ""}...')
+    with zipfile.ZipFile(backup_zip_path, 'w', compression=compress_type, compresslevel=level) as backup_zip:
+        writer = ParallelZipWriter(backup_zip, compress_type, level, workers)
+        unchanged = None
+        try:
+            if incremental:
+                unchanged = _write_incremental_backup(folder, previous_files, backup_zip_path, backup_zip, writer,
+                                                      progress)
+            else:
+                # フォルダ内のすべてのファイルと空のフォルダをバックアップ。
+                for path, rel_path, stat in iter_backup_entries(folder):
+                    if stat is None:
+                        writer.add(path, rel_path)
+                        continue
+                    writer.add(path, rel_path, stat.st_size)
+                    progress.update(1, stat.st_size)
+        finally:
+            writer.close()
+            progress.finish()
 
+    if unchanged is not None:
+        print(f'変更なし: {unchanged} 件')
     print('完了。')
+    return backup_zip_path
+
+
+def _load_previous_files(folder_name, backup_folder):
+    """直前のバックアップのマニフェストに記録されたファイルの辞書を返す。"""
+    backups = list_backups(folder_name, backup_folder)
+    if backups:
+        previous_manifest = load_manifest(backups[-1][1])
+        if previous_manifest:
+            return previous_manifest['files']
+    return {}
+
+
+def _write_incremental_backup(folder, previous_files, backup_zip_path, backup_zip, writer, progress):
+    """差分バックアップの内容とマニフェストを書き込み、変更がなかったファイル数を返す。"""
+    # 内容のハッシュから格納済みの場所を引けるようにする（同じ内容は二重に保存しない）
+    stored_by_hash = {entry['sha256']: (entry['archive'], entry['member']) for entry in previous_files.values()}
+
+    files = {}
+    unchanged = 0
+    for path, rel_path, stat in iter_backup_entries(folder):
+        if stat is None:
+            continue
+        progress.update(1, stat.st_size)
+
+        # サイズと更新日時が前回と同じファイルは内容を読まずに前回の記録を引き継ぐ
+        previous = previous_files.get(rel_path)
+        if previous and previous['size'] == stat.st_size and previous['mtime_ns'] == stat.st_mtime_ns:
+            files[rel_path] = previous
+            unchanged += 1
+            continue
+
+        digest = hash_file(path)
+        location = stored_by_hash.get(digest)
+        if location is None:
+            writer.add(path, rel_path, stat.st_size)
+            location = (backup_zip_path.name, rel_path)
+            stored_by_hash[digest] = location
+
+        files[rel_path] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': digest,
+            'archive': location[0],
+            'member': location[1],
+        }
+
+    manifest = {
+        'version': 1,
+        'folder': folder.name,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'files': files,
+    }
+    # マニフェストは保留中のメンバーをすべて書き込んでから追加する
+    writer.flush()
+    backup_zip.writestr(MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False))
+    return unchanged
+
+
+def restore_backup(backup_folder, folder_name, restore_to, number=None):
+    """
+    バックアップからフォルダを復元する関数。
+
+    差分バックアップの場合は、指定した時点のマニフェストに記録されたファイルを
+    それぞれが格納されているバックアップから取り出す。
+
+    :param backup_folder: バックアップ先のフォルダ
+    :param folder_name: バックアップをとったフォルダの名前
+    :param restore_to: 復元先のフォルダ
+    :param number: 復元するバックアップの番号（省略時は最新）
+    :return: 復元したファイル数
+    """
+    backup_folder = Path(backup_folder).resolve()
+    restore_to = Path(restore_to).resolve()
+
+    backups = dict(list_backups(folder_name, backup_folder))
+    if not backups:
+        raise FileNotFoundError(f'{folder_name} のバックアップが見つかりません: {backup_folder}')
+    if number is None:
+        number = max(backups)
+    if number not in backups:
+        raise FileNotFoundError(f'{folder_name}_{number}.zip が見つかりません: {backup_folder}')
+
+    manifest = load_manifest(backups[number])
+    if manifest is None:
+        # 通常のバックアップはそのまま展開する
+        with zipfile.ZipFile(backups[number]) as backup_zip:
+            backup_zip.extractall(restore_to)
+            return sum(1 for info in backup_zip.infolist() if not info.is_dir())
+
+    # 格納先のバックアップごとにまとめて、各ZIPを1回だけ開く
+    by_archive = defaultdict(list)
+    for rel_path, entry in manifest['files'].items():
+        by_archive[entry['archive']].append((rel_path, entry))
+
+    restored = 0
+    for archive_name, entries in by_archive.items():
+        print(f'{archive_name} から復元中...')
+        with zipfile.ZipFile(backup_folder / archive_name) as backup_zip:
+            for rel_path, entry in entries:
+                target = (restore_to / rel_path).resolve()
+                if restore_to not in target.parents:
+                    raise ValueError(f'復元先の外を指すパスです: {rel_path}')
+
+                target.parent.mkdir(parents=True, exist_ok=True)
+                with backup_zip.open(entry['member']) as src, open(target, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, CHUNK_SIZE)
+                os.utime(target, ns=(entry['mtime_ns'], entry['mtime_ns']))
+                restored += 1
+
+    print(f'完了。{restored} 件のファイルを復元しました。')
+    return restored
+
+
+def _verify_member(zip_path, info, expected_sha256, source_path, local, opened, lock):
+    """
+    1つのメンバーを読み込んで検証する関数（ワーカースレッドで実行される）。
+
+    ZipFile のハンドルはスレッドごとに1つ開いて使い回す。
+
+    :return: (メンバー名, 読み込んだバイト数, エラー内容。問題がなければ None)
+    """
+    zip_file = getattr(local, 'zip_file', None)
+    if zip_file is None:
+        zip_file = local.zip_file = zipfile.ZipFile(zip_path)
+        with lock:
+            opened.append(zip_file)
+
+    digest = hashlib.sha256() if expected_sha256 else None
+    size = 0
+    try:
+        # ZipExtFile は最後まで読むと CRC-32 を照合し、一致しなければ BadZipFile を送出する
+        with zip_file.open(info) as f:
+            while chunk := f.read(CHUNK_SIZE):
+                size += len(chunk)
+                if digest:
+                    digest.update(chunk)
+    except (zipfile.BadZipFile, OSError, EOFError, zlib.error, ValueError) as e:
+        return info.filename, size, f'読み込みエラー: {e}'
+
+    if digest and digest.hexdigest() != expected_sha256:
+        return info.filename, size, 'SHA-256 がマニフェストと一致しません'
+
+    if source_path is not None:
+        try:
+            crc = 0
+            with open(source_path, 'rb') as f:
+                while chunk := f.read(CHUNK_SIZE):
+                    crc = zlib.crc32(chunk, crc)
+        except OSError as e:
+            return info.filename, size, f'元のファイルを読めません: {e}'
+        if crc != info.CRC:
+            return info.filename, size, 'CRC-32 が元のファイルと一致しません'
+
+    return info.filename, size, None
+
+
+def verify_backup(zip_path, source=None, quick=False, sample=None, workers=None, seed=None):
+    """
+    バックアップのメンバーを並列に読み込んで検証する関数。
+
+    すべてのメンバーの CRC-32 を確認し、差分バックアップではマニフェストの SHA-256、
+    元のフォルダを指定した場合はそのファイルの CRC-32 とも照合する。
+    クイック検証では無作為に選んだ一部のメンバーだけを調べる。
+
+    :param zip_path: 検証するバックアップファイルのパス
+    :param source: 照合する元のフォルダ（省略時は照合しない）
+    :param quick: クイック検証にするかどうか
+    :param sample: クイック検証で調べるメンバー数（省略時は全体の5%、最小100個）
+    :param workers: 読み込みに使うスレッド数（省略時はCPU数に応じて決まる）
+    :param seed: クイック検証でメンバーを選ぶ乱数のシード
+    :return: 検証結果の辞書（調べたメンバー数・バイト数・処理時間・速度・エラーのリスト）
+    """
+    zip_path = Path(zip_path).resolve()
+    source = Path(source).resolve() if source else None
+    start = time.monotonic()
+
+    errors = []
+    with zipfile.ZipFile(zip_path) as backup_zip:
+        members = [info for info in backup_zip.infolist() if not info.is_dir() and info.filename != MANIFEST_NAME]
+        manifest = None
+        if MANIFEST_NAME in backup_zip.NameToInfo:
+            manifest = json.loads(backup_zip.read(MANIFEST_NAME).decode('utf-8'))
+
+    # このバックアップに格納されたメンバーごとに、マニフェストに記録された SHA-256 を引けるようにする
+    expected = {}
+    if manifest:
+        for entry in manifest['files'].values():
+            if entry['archive'] == zip_path.name:
+                expected[entry['member']] = entry['sha256']
+        member_names = {info.filename for info in members}
+        errors.extend((name, 'マニフェストに記録されたメンバーがありません')
+                      for name in sorted(expected.keys() - member_names))
+
+    if quick:
+        count = sample or max(QUICK_VERIFY_MIN_MEMBERS, int(len(members) * QUICK_VERIFY_FRACTION))
+        if count < len(members):
+            members = random.Random(seed).sample(members, count)
+    # ZIP内の位置の順に読むと、ディスク上で連続した読み込みになる
+    members.sort(key=lambda info: info.header_offset)
+
+    progress = BackupProgress(len(members), sum(info.file_size for info in members))
+    local = threading.local()
+    opened = []
+    lock = threading.Lock()
+    total_bytes = 0
+    print(f'{zip_path.name} を検証中{"（クイック）" if quick else ""}...')
+    try:
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            futures = [executor.submit(_verify_member, zip_path, info, expected.get(info.filename),
+                                       source / info.filename if source else None, local, opened, lock)
+                       for info in members]
+            for future in futures:
+                name, size, error = future.result()
+                total_bytes += size
+                progress.update(1, size)
+                if error:
+                    errors.append((name, error))
+    finally:
+        progress.finish()
+        for zip_file in opened:
+            zip_file.close()
+
+    elapsed = time.monotonic() - start
+    result = {
+        'archive': str(zip_path),
+        'quick': quick,
+        'checked': len(members),
+        'bytes': total_bytes,
+        'elapsed': round(elapsed, 3),
+        'mb_per_sec': round(total_bytes / 1e6 / max(elapsed, 1e-9), 1),
+        'errors': errors,
+    }
+
+    for name, error in errors:
+        print(f'エラー: {name}: {error}', file=sys.stderr)
+    print(f'{"問題なし" if not errors else f"{len(errors)} 件のエラー"}。'
+          f'{len(members)} 件 {total_bytes / 1e6:,.1f} MB を {elapsed:.1f} 秒で検証しました'
+          f'（{result["mb_per_sec"]:,.1f} MB/s）。')
+    return result
+
+
+def parse_args(argv=None):
+    """コマンドライン引数を解析する"""
+    parser = argparse.ArgumentParser(description='フォルダをZIPファイルにバックアップ・復元・検証します。')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    backup_parser = subparsers.add_parser('backup', help='バックアップを作成する')
+    backup_parser.add_argument('folder', help='バックアップをとるフォルダ')
+    backup_parser.add_argument('backup_folder', help='バックアップ先のフォルダ')
+    backup_parser.add_argument('--incremental', action='store_true', help='差分バックアップにする')
+    backup_parser.add_argument('--compression', choices=sorted(COMPRESSION_METHODS), help='圧縮方式 (省略時は無圧縮)')
+    backup_parser.add_argument('--level', type=int, default=None, help='圧縮レベル')
+    backup_parser.add_argument('-j', '--workers', type=int, default=None, help='圧縮に使うスレッド数')
+    backup_parser.add_argument('--no-estimate', action='store_true', help='先にファイルを数えない (残り時間を表示しない)')
+    backup_parser.add_argument('--verify', action='store_true', help='作成後にクイック検証する')
+
+    restore_parser = subparsers.add_parser('restore', help='バックアップから復元する')
+    restore_parser.add_argument('backup_folder', help='バックアップ先のフォルダ')
+    restore_parser.add_argument('folder_name', help='バックアップをとったフォルダの名前')
+    restore_parser.add_argument('restore_to', help='復元先のフォルダ')
+    restore_parser.add_argument('--number', type=int, default=None, help='復元するバックアップの番号 (省略時は最新)')
+
+    verify_parser = subparsers.add_parser('verify', help='バックアップを検証する')
+    verify_parser.add_argument('zip_path', help='検証するバックアップファイル')
+    verify_parser.add_argument('--source', help='照合する元のフォルダ')
+    verify_parser.add_argument('--quick', action='store_true', help='一部のメンバーだけを調べる')
+    verify_parser.add_argument('--sample', type=int, default=None, help='クイック検証で調べるメンバー数')
+    verify_parser.add_argument('-j', '--workers', type=int, default=None, help='読み込みに使うスレッド数')
+    verify_parser.add_argument('--seed', type=int, default=None, help='クイック検証の乱数のシード')
+    verify_parser.add_argument('--report', help='検証結果のJSONの出力先')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """コマンドラインからバックアップ・復元・検証を実行する"""
+    args = parse_args(argv)
+
+    if args.command == 'backup':
+        backup_zip_path = backup_to_zip(args.folder, args.backup_folder, incremental=args.incremental,
+                                        compression=args.compression, level=args.level, workers=args.workers,
+                                        estimate=not args.no_estimate)
+        if args.verify:
+            return 1 if verify_backup(backup_zip_path, quick=True, workers=args.workers)['errors'] else 0
+    elif args.command == 'restore':
+        restore_backup(args.backup_folder, args.folder_name, args.restore_to, args.number)
+    else:
+        result = verify_backup(args.zip_path, source=args.source, quick=args.quick, sample=args.sample,
+                               workers=args.workers, seed=args.seed)
+        if args.report:
+            Path(args.report).write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding='utf-8')
+        return 1 if result['errors'] else 0
+    return 0
 
 
 if __name__ == "__main__":
-    source_folder = r'folder_path'
-    backup_destination = r'folder_path'
-    backup_to_zip(source_folder, backup_destination)
+    sys.exit(main())
@@ -0,0 +1,368 @@
+"""
+ファイル名の索引をSQLiteに保存し、フォルダを毎回走査せずにファイルを探すモジュール
+
+索引はフォルダごとに更新日時を記録し、更新のときは更新日時が変わったフォルダだけを
+読み直す（フォルダの更新日時はその中のファイルの追加・削除・名前の変更で変わる）。
+ファイル名は FTS5 の trigram で索引し、部分一致・globの検索を索引で行う。
+FTS5 の trigram が使えないSQLiteや、3文字以上続く固定の文字がないパターン（「売上」「売*」など）は、
+trigram の索引では探せないので、テーブル全体を調べる検索になる。
+
+例:
+    with FileNameIndex('test') as index:
+        index.refresh()
+        for path in index.search('sales'):
+            print(path)
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import time
+from functools import lru_cache
+
+# 索引の保存先（環境変数 FILE_NAME_INDEX_DIR で変更できる）
+DEFAULT_INDEX_DIR = os.environ.get('FILE_NAME_INDEX_DIR', os.path.join(os.path.expanduser('~'), '.file_name_index'))
+# 索引の形式を変えたら番号を上げる（古い索引は作り直される）
+_INDEX_VERSION = 1
+# 更新日時がこの秒数以内のフォルダは、同じ時刻のうちにさらに変更される可能性があるので記録しない
+_RACY_SECONDS = 2
+
+SEARCH_MODES = ('substring', 'glob', 'regex')
+# FTS5 の trigram の索引で探せる、パターンの中の固定の文字の連続の最小の長さ
+_TRIGRAM_MIN_LITERAL = 3
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime_ns INTEGER
+);
+CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER,
+    mtime_ns INTEGER
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+'''
+
+_FTS_SCHEMA = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+    name, content='files', content_rowid='id', tokenize='trigram case_sensitive 1'
+);
+CREATE TRIGGER IF NOT EXISTS files_delete AFTER DELETE ON files BEGIN
+    INSERT INTO files_fts (files_fts, rowid, name) VALUES ('delete', old.id, old.name);
+END;
+'''
+
+# 最初の索引作成では行ごとに FTS5 へ追加するより最後にまとめて作り直すほうが速いので、このトリガーは外せるようにする
+_FTS_INSERT_TRIGGER = '''
+CREATE TRIGGER IF NOT EXISTS files_insert AFTER INSERT ON files BEGIN
+    INSERT INTO files_fts (rowid, name) VALUES (new.id, new.name);
+END
+'''
+
+
+def default_index_path(root, index_dir=None):
+    """
+    フォルダの索引ファイルのパスを返す
+
+    Args:
+        root (str): 索引を作るフォルダ
+        index_dir (str): 索引の保存先フォルダ。省略した場合は DEFAULT_INDEX_DIR
+
+    Returns:
+        str: 索引ファイルのパス
+    """
+    root = os.path.abspath(root)
+    key = hashlib.sha1(root.encode('utf-8', 'surrogatepass')).hexdigest()[:16]
+    name = f'{os.path.basename(root) or "root"}_{key}.sqlite'
+    return os.path.join(index_dir or DEFAULT_INDEX_DIR, name)
+
+
+def glob_to_sqlite(pattern):
+    """
+    fnmatch 形式のglobパターンをSQLiteのGLOB形式に変換する（否定の [!...] を [^...] にする）
+    """
+    return re.sub(r'\[!', '[^', pattern)
+
+
+def escape_glob(text):
+    """文字列をSQLiteのGLOBで文字どおりに一致させるためにエスケープする"""
+    return re.sub(r'([*?\[])', r'[\1]', text)
+
+
+def longest_glob_literal(pattern):
+    """
+    SQLiteのGLOBパターンの中で、ワイルドカードをはさまずに続く固定の文字の最大の長さを返す
+
+    1文字だけの文字クラス（escape_glob() の "[*]" など）は固定の文字として数える。
+    """
+    longest = run = 0
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char in '*?':
+            run = 0
+        elif char == '[':
+            end = pattern.find(']', i + 2)
+            if end == -1:
+                # 閉じていない [ は文字どおりの [ として扱う
+                run += 1
+            else:
+                run = run + 1 if end == i + 2 and pattern[i + 1] != '^' else 0
+                i = end
+        else:
+            run += 1
+        longest = max(longest, run)
+        i += 1
+    return longest
+
+
+@lru_cache(maxsize=32)
+def _compile_regex(pattern):
+    """正規表現をコンパイルする（同じパターンを何度もコンパイルしない）"""
+    return re.compile(pattern)
+
+
+def _regexp(pattern, value):
+    """SQLiteのREGEXP演算子の実装"""
+    return value is not None and _compile_regex(pattern).search(value) is not None
+
+
+class FileNameIndex:
+    """
+    フォルダ内のファイル名の索引
+
+    Args:
+        root (str): 索引を作るフォルダ
+        db_path (str): 索引ファイルのパス。省略した場合は default_index_path(root)
+    """
+
+    def __init__(self, root, db_path=None):
+        self.root = os.path.abspath(root)
+        self.db_path = db_path or default_index_path(self.root)
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.create_function('REGEXP', 2, _regexp, deterministic=True)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if version != _INDEX_VERSION:
+            self.conn.executescript('''
+                DROP TABLE IF EXISTS files_fts;
+                DROP TABLE IF EXISTS files;
+                DROP TABLE IF EXISTS dirs;
+            ''')
+            self.conn.execute(f'PRAGMA user_version={_INDEX_VERSION}')
+        self.conn.executescript(_SCHEMA)
+
+        try:
+            self.conn.executescript(_FTS_SCHEMA)
+            self.conn.execute(_FTS_INSERT_TRIGGER)
+            self.has_trigram = True
+        except sqlite3.OperationalError:
+            # FTS5 または trigram トークナイザーがないSQLite
+            self.has_trigram = False
+
+    def close(self):
+        """索引を閉じる"""
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _full_path(self, rel_dir, name=''):
+        """相対パスを絶対パスにする"""
+        return os.path.normpath(os.path.join(self.root, rel_dir, name))
+
+    def _remove_tree(self, rel_dir):
+        """フォルダとその下のすべての記録を削除する"""
+        # rel_dir + '/' 以上 rel_dir + '0' 未満（'0' は '/' の次の文字）でサブフォルダを範囲検索する
+        low, high = rel_dir + '/', rel_dir + '0'
+        self.conn.execute('DELETE FROM files WHERE dir = ? OR (dir >= ? AND dir < ?)', (rel_dir, low, high))
+        self.conn.execute('DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)', (rel_dir, low, high))
+
+    def _update_dir(self, rel_dir):
+        """
+        フォルダを読み直して、追加・削除・変更されたファイルの記録だけを更新する
+
+        Returns:
+            list: サブフォルダの相対パスのリスト
+        """
+        files = {}
+        subdirs = []
+        with os.scandir(self._full_path(rel_dir)) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(f'{rel_dir}/{entry.name}' if rel_dir else entry.name)
+                    elif entry.is_file():
+                        stat = entry.stat()
+                        files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+                except OSError:
+                    continue
+
+        removed_ids = []
+        changed = []
+        for file_id, name, size, mtime_ns in self.conn.execute(
+                'SELECT id, name, size, mtime_ns FROM files WHERE dir = ?', (rel_dir,)).fetchall():
+            current = files.pop(name, None)
+            if current is None:
+                removed_ids.append((file_id,))
+            elif current != (size, mtime_ns):
+                changed.append((*current, file_id))
+        # 残ったものが新しいファイル
+        self.conn.executemany('DELETE FROM files WHERE id = ?', removed_ids)
+        self.conn.executemany('UPDATE files SET size = ?, mtime_ns = ? WHERE id = ?', changed)
+        self.conn.executemany('INSERT INTO files (dir, name, size, mtime_ns) VALUES (?, ?, ?, ?)',
+                              [(rel_dir, name, size, mtime_ns) for name, (size, mtime_ns) in files.items()])
+
+        old_subdirs = {child for (child,) in self.conn.execute('SELECT path FROM dirs WHERE parent = ?', (rel_dir,))}
+        for removed in old_subdirs.difference(subdirs):
+            self._remove_tree(removed)
+        return subdirs
+
+    def refresh(self, progress_callback=None):
+        """
+        索引を更新する
+
+        記録した更新日時と同じフォルダは中身を読まずに記録済みのサブフォルダだけをたどり、
+        変わったフォルダだけを os.scandir で読み直す。
+
+        Args:
+            progress_callback (function): (調べたフォルダ数, 読み直したフォルダ数) を受け取るコールバック関数
+
+        Returns:
+            dict: 調べたフォルダ数・読み直したフォルダ数・索引のファイル数・処理時間
+        """
+        start = time.perf_counter()
+        racy_limit = time.time_ns() - _RACY_SECONDS * 1_000_000_000
+        checked = 0
+        rescanned = 0
+
+        with self.conn:
+            self.conn.execute('BEGIN')
+            # 索引が空なら FTS5 への追加は最後にまとめて行う
+            bulk = self.has_trigram and self.conn.execute('SELECT 1 FROM files LIMIT 1').fetchone() is None
+            if bulk:
+                self.conn.execute('DROP TRIGGER IF EXISTS files_insert')
+
+            stack = [('', None)]
+            while stack:
+                rel_dir, parent = stack.pop()
+                checked += 1
+                try:
+                    mtime_ns = os.stat(self._full_path(rel_dir)).st_mtime_ns
+                except OSError:
+                    self._remove_tree(rel_dir)
+                    continue
+
+                row = self.conn.execute('SELECT mtime_ns FROM dirs WHERE path = ?', (rel_dir,)).fetchone()
+                if row and row[0] == mtime_ns:
+                    children = self.conn.execute('SELECT path FROM dirs WHERE parent = ?', (rel_dir,)).fetchall()
+                    stack.extend((child, rel_dir) for (child,) in children)
+                    continue
+
+                rescanned += 1
+                try:
+                    subdirs = self._update_dir(rel_dir)
+                except OSError:
+                    self._remove_tree(rel_dir)
+                    continue
+
+                # 更新直後のフォルダは次回も読み直すように、更新日時を記録しない
+                recorded_mtime = mtime_ns if mtime_ns < racy_limit else None
+                self.conn.execute('INSERT OR REPLACE INTO dirs (path, parent, mtime_ns) VALUES (?, ?, ?)',
+                                  (rel_dir, parent, recorded_mtime))
+                stack.extend((child, rel_dir) for child in subdirs)
+
+                if progress_callback:
+                    progress_callback(checked, rescanned)
+
+            if bulk:
+                self.conn.execute("INSERT INTO files_fts (files_fts) VALUES ('rebuild')")
+                self.conn.execute(_FTS_INSERT_TRIGGER)
+
+        total_files = self.conn.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+        return {
+            'checked_dirs': checked,
+            'rescanned_dirs': rescanned,
+            'files': total_files,
+            'elapsed': round(time.perf_counter() - start, 3),
+        }
+
+    def iter_paths(self, extensions=None):
+        """
+        索引のすべてのファイルのパスを返す
+
+        Args:
+            extensions (list): 拡張子のリスト（例: ['.csv']）。省略した場合はすべて
+
+        Yields:
+            str: ファイルのパス
+        """
+        suffixes = tuple(ext.lower() for ext in extensions) if extensions else None
+        for rel_dir, name in self.conn.execute('SELECT dir, name FROM files'):
+            if suffixes is None or name.lower().endswith(suffixes):
+                yield self._full_path(rel_dir, name)
+
+    def search(self, pattern, mode='substring', extensions=None):
+        """
+        ファイル名で検索する
+
+        Args:
+            pattern (str): 検索するパターン
+            mode (str): 'substring'（部分一致）、'glob'（fnmatch 形式）、'regex'（re.search）
+            extensions (list): 拡張子のリスト（例: ['.csv']）。省略した場合はすべて
+
+        Yields:
+            str: 一致したファイルのパス
+        """
+        return self.search_any([pattern], mode, extensions)
+
+    def search_any(self, patterns, mode='substring', extensions=None):
+        """
+        いずれかのパターンに一致するファイル名を1回の問い合わせで検索する
+
+        Args:
+            patterns (list): 検索するパターンのリスト
+            mode (str): 'substring'（部分一致）、'glob'（fnmatch 形式）、'regex'（re.search）
+            extensions (list): 拡張子のリスト（例: ['.csv']）。省略した場合はすべて
+
+        Yields:
+            str: 一致したファイルのパス（2つ以上のパターンに一致しても1回だけ）
+        """
+        patterns = list(dict.fromkeys(patterns))
+        if mode == 'substring':
+            sql, params = self._glob_query([f'*{escape_glob(pattern)}*' for pattern in patterns])
+        elif mode == 'glob':
+            sql, params = self._glob_query([glob_to_sqlite(pattern) for pattern in patterns])
+        elif mode == 'regex':
+            pattern = '|'.join(f'(?:{pattern})' for pattern in patterns)
+            _compile_regex(pattern)  # 不正な正規表現はここで re.error にする
+            sql, params = 'SELECT dir, name FROM files WHERE name REGEXP ?', [pattern]
+        else:
+            raise ValueError(f'対応していない検索方法です: {mode}')
+
+        suffixes = tuple(ext.lower() for ext in extensions) if extensions else None
+        for rel_dir, name in self.conn.execute(sql, params):
+            if suffixes is None or name.lower().endswith(suffixes):
+                yield self._full_path(rel_dir, name)
+
+    def _glob_query(self, patterns):
+        """いずれかのGLOBパターンに一致するファイルを検索するSQLとパラメーターを返す"""
+        # trigram の索引は、3文字以上続く固定の文字がないパターンには何も返さないので、
+        # そのようなパターンが1つでもあればテーブル全体を1回だけ調べる
+        if self.has_trigram and all(longest_glob_literal(pattern) >= _TRIGRAM_MIN_LITERAL for pattern in patterns):
+            subqueries = ' UNION '.join(['SELECT rowid FROM files_fts WHERE name GLOB ?'] * len(patterns))
+            return f'SELECT dir, name FROM files WHERE id IN ({subqueries})', patterns
+        return 'SELECT dir, name FROM files WHERE ' + ' OR '.join(['name GLOB ?'] * len(patterns)), patterns
@@ -0,0 +1,307 @@
+"""
+請求書・領収書のPDFから日付・取引先・金額を取り出すモジュール
+
+1ページ目のテキストを fitz で取り出し、コンパイル済みの正規表現で日付（西暦・和暦）と
+金額（¥・円・カンマ区切り）を探す。取引先は、これまでに入力された取引先名と
+その別名（PDFに書かれていた会社名）を記録した辞書から探す。
+リネームツールでは FieldExtractor がバックグラウンドで抽出し、入力欄に自動入力する。
+"""
+
+import json
+import os
+import queue
+import re
+import threading
+import unicodedata
+from datetime import date
+
+import fitz
+
+# 取引先の辞書の保存先（環境変数 INVOICE_PARTNERS_PATH で変更できる）
+DEFAULT_PARTNERS_PATH = os.environ.get('INVOICE_PARTNERS_PATH',
+                                       os.path.join(os.path.expanduser('~'), '.invoice_partners.json'))
+# 自社名（取引先の別名として学習しない。環境変数 INVOICE_OWN_COMPANY にカンマ区切りで指定する）
+OWN_COMPANY_NAMES = [name.strip() for name in os.environ.get('INVOICE_OWN_COMPANY', '').split(',') if name.strip()]
+
+# 和暦の元年の前年（元年 = 1）
+ERA_BASE_YEARS = {
+    '令和': 2018, 'R': 2018,
+    '平成': 1988, 'H': 1988,
+    '昭和': 1925, 'S': 1925,
+}
+
+# 日付・金額の近くにあれば優先するキーワード
+DATE_KEYWORDS = re.compile(r'発行日|請求日|日付|取引日|領収日|ご利用日|注文日|納品日')
+AMOUNT_KEYWORDS = re.compile(r'合計|総額|請求金額|ご請求額|お支払|領収金額|税込')
+
+# 西暦の日付（2024年1月5日, 2024/01/05, 2024-1-5, 2024.01.05）
+WESTERN_DATE = re.compile(r'(?<!\d)((?:19|20)\d{2})\s*[年/\-.]\s*(\d{1,2})\s*[月/\-.]\s*(\d{1,2})\s*日?')
+# 和暦の日付（令和6年1月5日, R6.1.5, 平成元年4月1日）
+JAPANESE_DATE = re.compile(r'(令和|平成|昭和|[RHS])\s*(元|\d{1,2})\s*[年/\-.]\s*(\d{1,2})\s*[月/\-.]\s*(\d{1,2})\s*日?')
+# 金額（¥1,234 / 1,234円 / 1,234 円）
+YEN_PREFIX_AMOUNT = re.compile(r'¥\s*(\d{1,3}(?:,\d{3})+|\d+)(?![\d,])')
+YEN_SUFFIX_AMOUNT = re.compile(r'(?<![\d,])(\d{1,3}(?:,\d{3})+|\d+)\s*円')
+# 会社名の行（取引先の別名の候補）
+COMPANY_NAME = re.compile(r'((?:株式会社|有限会社|合同会社)\s*\S+|\S+?\s*(?:株式会社|有限会社|合同会社|\(株\)|（株）))')
+
+
+def normalize_text(text):
+    """全角の数字・記号を半角にそろえる（NFKC正規化）"""
+    return unicodedata.normalize('NFKC', text)
+
+
+def extract_first_page_text(file_path):
+    """
+    PDFの1ページ目のテキストを返す
+
+    Args:
+        file_path (str): PDFファイルのパス
+
+    Returns:
+        str: 正規化したテキスト
+    """
+    with fitz.open(file_path) as pdf_document:
+        if pdf_document.page_count == 0:
+            return ''
+        return normalize_text(pdf_document[0].get_text())
+
+
+def _valid_date(year, month, day):
+    """正しい日付なら YYYYMMDD の文字列を返す"""
+    try:
+        return date(year, month, day).strftime('%Y%m%d')
+    except ValueError:
+        return None
+
+
+def find_dates(text):
+    """
+    テキスト内の日付を見つけた順に返す
+
+    Returns:
+        list: (YYYYMMDD, 文字の位置) のリスト
+    """
+    dates = []
+    for match in WESTERN_DATE.finditer(text):
+        value = _valid_date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+        if value:
+            dates.append((value, match.start()))
+    for match in JAPANESE_DATE.finditer(text):
+        era_year = 1 if match.group(2) == '元' else int(match.group(2))
+        value = _valid_date(ERA_BASE_YEARS[match.group(1)] + era_year, int(match.group(3)), int(match.group(4)))
+        if value:
+            dates.append((value, match.start()))
+    return sorted(dates, key=lambda item: item[1])
+
+
+def find_amounts(text):
+    """
+    テキスト内の金額を見つけた順に返す
+
+    Returns:
+        list: (金額, 文字の位置) のリスト
+    """
+    amounts = []
+    for pattern in (YEN_PREFIX_AMOUNT, YEN_SUFFIX_AMOUNT):
+        for match in pattern.finditer(text):
+            amounts.append((int(match.group(1).replace(',', '')), match.start()))
+    return sorted(amounts, key=lambda item: item[1])
+
+
+def _keyword_line(text, position, keywords):
+    """
+    文字の位置を含む行にキーワードがあれば 0、その前の行にあれば 1、どちらにもなければ None を返す
+    """
+    line_start = text.rfind('\n', 0, position) + 1
+    line_end = text.find('\n', position)
+    if keywords.search(text[line_start:line_end if line_end != -1 else len(text)]):
+        return 0
+    if line_start == 0:
+        return None
+    # 前の行は、この行の直前の改行の前から（前の行が1行目なら先頭から）
+    previous_start = text.rfind('\n', 0, line_start - 1) + 1
+    return 1 if keywords.search(text[previous_start:line_start - 1]) else None
+
+
+def pick_date(text):
+    """キーワードのある行（なければその次の行）の日付を優先して、日付を1つ選ぶ"""
+    dates = find_dates(text)
+    for distance in (0, 1):
+        for value, position in dates:
+            if _keyword_line(text, position, DATE_KEYWORDS) == distance:
+                return value
+    return dates[0][0] if dates else None
+
+
+def pick_amount(text):
+    """
+    キーワードのある行の金額を優先して、金額を1つ選ぶ
+
+    キーワードの行に金額があればその最大の金額、なければキーワードの次の行の最初の金額、
+    どちらもなければ最大の金額を選ぶ。
+    """
+    amounts = find_amounts(text)
+    distances = [(value, _keyword_line(text, position, AMOUNT_KEYWORDS)) for value, position in amounts]
+    same_line = [value for value, distance in distances if distance == 0]
+    if same_line:
+        return str(max(same_line))
+    next_line = [value for value, distance in distances if distance == 1]
+    if next_line:
+        return str(next_line[0])
+    return str(max(value for value, _ in amounts)) if amounts else None
+
+
+class PartnerDictionary:
+    """
+    取引先名と、PDFに書かれていた別名（会社名）を記録する辞書
+
+    リネームのたびに learn() で学習し、次からは match() でテキストから取引先名を探す。
+    別名は、どの取引先と一緒に現れたかを数え、1つの取引先とだけ現れた名前だけを使う
+    （自社名のようにどの請求書にも書かれている名前は、別の取引先で学習した時点で使われなくなる）。
+
+    Args:
+        path (str): 辞書を保存するJSONファイルのパス。省略した場合は DEFAULT_PARTNERS_PATH
+        own_names (list): 別名として学習しない自社名。省略した場合は OWN_COMPANY_NAMES
+    """
+
+    def __init__(self, path=None, own_names=None):
+        self.path = path or DEFAULT_PARTNERS_PATH
+        self.own_names = [normalize_text(name) for name in (OWN_COMPANY_NAMES if own_names is None else own_names)]
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.aliases = {}
+        self.pattern = None
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            self.counts = data.get('counts', {})
+            # 以前の形式（別名 → 取引先名）も読み込む
+            self.aliases = {alias: partners if isinstance(partners, dict) else {partners: 1}
+                            for alias, partners in data.get('aliases', {}).items()}
+        except (OSError, ValueError):
+            pass
+        self._compile()
+
+    def _alias_partner(self, alias):
+        """別名が1つの取引先とだけ現れていればその取引先名を返す"""
+        partners = self.aliases.get(alias)
+        return next(iter(partners)) if partners and len(partners) == 1 else None
+
+    def _compile(self):
+        """取引先名と別名を1つの正規表現にまとめる（長いものを先に照合する）"""
+        names = sorted(set(self.counts) | {alias for alias in self.aliases if self._alias_partner(alias)},
+                       key=len, reverse=True)
+        self.pattern = re.compile('|'.join(map(re.escape, names))) if names else None
+
+    def match(self, text):
+        """
+        テキストに含まれる取引先名を返す
+
+        複数見つかった場合は、これまでに使われた回数が最も多い取引先を選ぶ。
+        """
+        with self.lock:
+            if self.pattern is None:
+                return None
+            found = {name if name in self.counts else self._alias_partner(name)
+                     for name in self.pattern.findall(text)}
+            if not found:
+                return None
+            return max(found, key=lambda partner: self.counts.get(partner, 0))
+
+    def learn(self, text, partner):
+        """
+        入力された取引先名を記録し、テキストにその名前がなければ会社名の行を別名として記録する
+
+        Args:
+            text (str): PDFの1ページ目のテキスト（正規化済み）
+            partner (str): 入力された取引先名
+        """
+        if not partner:
+            return
+        with self.lock:
+            self.counts[partner] = self.counts.get(partner, 0) + 1
+            if text and partner not in text:
+                for alias in {match.group(1).strip() for match in COMPANY_NAME.finditer(text)}:
+                    if any(name in alias for name in self.own_names):
+                        continue
+                    # 別名と取引先の組を数える（ほかの取引先とも現れた名前は別名として使わない）
+                    partners = self.aliases.setdefault(alias, {})
+                    partners[partner] = partners.get(partner, 0) + 1
+            self._compile()
+            data = {'counts': self.counts, 'aliases': self.aliases}
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def extract_fields(text, partners=None):
+    """
+    テキストから日付・取引先・金額を取り出す
+
+    Args:
+        text (str): PDFの1ページ目のテキスト（正規化済み）
+        partners (PartnerDictionary): 取引先の辞書
+
+    Returns:
+        dict: {'date': YYYYMMDD, 'partner': 取引先名, 'amount': 金額}（見つからない項目は None）
+    """
+    return {
+        'date': pick_date(text),
+        'partner': partners.match(text) if partners else None,
+        'amount': pick_amount(text),
+    }
+
+
+class FieldExtractor:
+    """
+    PDFからの項目の抽出をバックグラウンドのスレッドで行うクラス
+
+    結果は notify('-FIELDS-', (パス, 項目の辞書)) で知らせ、テキストと項目はパスごとに保持する。
+
+    Args:
+        notify (function): (イベント名, 値) を受け取る関数（window.write_event_value など）
+        partners (PartnerDictionary): 取引先の辞書
+        fitz_lock (threading.Lock): fitz をほかのスレッドと同時に使わないためのロック
+    """
+
+    def __init__(self, notify, partners=None, fitz_lock=None):
+        self.notify = notify
+        self.partners = partners or PartnerDictionary()
+        self.fitz_lock = fitz_lock or threading.Lock()
+        self.queue = queue.Queue()
+        self.texts = {}
+        self.results = {}
+        self.thread = threading.Thread(target=self.worker, daemon=True)
+        self.thread.start()
+
+    def request(self, file_paths):
+        """ファイルの抽出を予約する（抽出済みのファイルは結果をすぐに知らせる）"""
+        for file_path in file_paths:
+            if file_path in self.results:
+                self.notify('-FIELDS-', (file_path, self.results[file_path]))
+            else:
+                self.queue.put(file_path)
+
+    def learn(self, file_path, partner):
+        """リネームに使われた取引先名を学習する"""
+        self.partners.learn(self.texts.get(file_path, ''), partner)
+
+    def worker(self):
+        """予約されたファイルを順に抽出する（バックグラウンドのスレッドで実行される）"""
+        while True:
+            file_path = self.queue.get()
+            if file_path in self.results:
+                continue
+            try:
+                with self.fitz_lock:
+                    text = extract_first_page_text(file_path)
+            except Exception:
+                # 読めないファイルは自動入力しない
+                continue
+            fields = extract_fields(text, self.partners)
+            self.texts[file_path] = text
+            self.results[file_path] = fields
+            self.notify('-FIELDS-', (file_path, fields))
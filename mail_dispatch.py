@@ -0,0 +1,331 @@
+"""
+リネームしたPDFをメールで送るためのキュー
+
+メールの作成・送信はバックグラウンドのスレッドで行うので、リネームの操作は送信を待たない。
+送信方法（トランスポート）は Outlook（Windows）と SMTP から選べる。SMTP の接続は続けて送る間は使い回し、
+設定すれば数件のPDFを1通のメールにまとめる。送信に失敗したら間隔を空けながら再送する。
+
+設定は JSON ファイル（環境変数 RENAME_MAIL_CONFIG、省略時は ~/.rename_pdf_mail.json）に書く。
+    {
+        "transport": "smtp",
+        "to": "keiri@example.com",
+        "from": "scanner@example.com",
+        "smtp_host": "localhost", "smtp_port": 25, "starttls": false,
+        "batch_size": 5, "batch_wait": 3.0
+    }
+宛先は環境変数 RENAME_MAIL_TO でも指定できる。
+"""
+
+import json
+import mimetypes
+import os
+import queue
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+
+# 設定ファイルの場所
+DEFAULT_CONFIG_PATH = os.environ.get('RENAME_MAIL_CONFIG',
+                                     os.path.join(os.path.expanduser('~'), '.rename_pdf_mail.json'))
+MAIL_SUBJECT = '電子取引データの送付について'
+DEFAULT_CONFIG = {
+    'transport': 'outlook' if os.name == 'nt' else 'smtp',
+    'to': '',
+    'from': '',
+    'smtp_host': 'localhost',
+    'smtp_port': 25,
+    'smtp_user': '',
+    'smtp_password': '',
+    'starttls': False,
+    'use_ssl': False,
+    # Outlook の場合、送信せずに画面に表示して確認する
+    'display': True,
+    # 1通のメールにまとめるPDFの最大数と、まとめるために次のPDFを待つ秒数
+    'batch_size': 1,
+    'batch_wait': 3.0,
+    'max_retries': 5,
+    'retry_backoff': 2.0,
+    # この秒数だけ送るものがなければ接続を閉じる
+    'idle_timeout': 60.0,
+}
+
+
+def load_mail_config(path=None):
+    """
+    メールの設定を読み込む（ファイルがなければ既定値）
+
+    Returns:
+        dict: 設定
+    """
+    config = dict(DEFAULT_CONFIG)
+    try:
+        with open(path or DEFAULT_CONFIG_PATH, encoding='utf-8') as f:
+            config.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+    config['to'] = os.environ.get('RENAME_MAIL_TO', config['to'])
+    return config
+
+
+def build_mail_text(values_list):
+    """
+    メールの本文を作る
+
+    Args:
+        values_list (list): PDFごとの {'date', 'partner', 'amount', 'section', 'not_adopted'} の辞書のリスト
+
+    Returns:
+        str: 本文
+    """
+    mail_text = '次のとおり電子取引データを送付するのでよろしくお願いします🌷 \n'
+    for values in values_list:
+        mail_text += (
+            f'\n'
+            f'日　　付:{values["date"]}\n'
+            f'取引先名:{values["partner"]}\n'
+            f'金　　額:{values["amount"]}\n'
+            f'区　　分:{values["section"]}\n'
+        )
+        if values['not_adopted']:
+            mail_text += f'この{values["section"]}は採用されませんでした🙅‍\n'
+    return mail_text
+
+
+class OutlookTransport:
+    """
+    Outlook でメールを作成するトランスポート（Windows のみ）
+
+    Args:
+        display (bool): True なら送信せずに画面に表示し、送信前に確認できるようにする
+    """
+
+    def __init__(self, display=True):
+        self.display = display
+        self.outlook = None
+
+    def open(self):
+        """Outlook に接続する（送信のスレッドで COM を初期化する）"""
+        import pythoncom
+        import win32com.client as win32
+
+        pythoncom.CoInitialize()
+        self.outlook = win32.Dispatch('Outlook.Application')
+
+    def send(self, message):
+        """メールを作成して表示または送信する"""
+        if self.outlook is None:
+            self.open()
+        mail_item = self.outlook.CreateItem(0)  # メールアイテムを作成
+        mail_item.To = message['to']
+        mail_item.Subject = message['subject']
+        mail_item.Body = message['body']
+        for attachment in message['attachments']:
+            mail_item.Attachments.Add(os.path.abspath(attachment))
+        if self.display:
+            mail_item.Display()
+        else:
+            mail_item.Send()
+
+    def close(self):
+        """接続を閉じる"""
+        if self.outlook is not None:
+            import pythoncom
+
+            self.outlook = None
+            pythoncom.CoUninitialize()
+
+
+class SmtpTransport:
+    """
+    SMTP でメールを送るトランスポート（接続は close() まで使い回す）
+
+    Args:
+        host (str): SMTP サーバー
+        port (int): ポート番号
+        sender (str): 送信者のアドレス
+        username (str): 認証のユーザー名（省略した場合は認証しない）
+        password (str): 認証のパスワード
+        starttls (bool): STARTTLS を使うかどうか
+        use_ssl (bool): 最初から SSL で接続するかどうか
+        timeout (float): 接続のタイムアウト（秒）
+    """
+
+    def __init__(self, host='localhost', port=25, sender='', username='', password='', starttls=False,
+                 use_ssl=False, timeout=30.0):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self.smtp = None
+
+    def open(self):
+        """SMTP サーバーに接続する"""
+        smtp_class = smtplib.SMTP_SSL if self.use_ssl else smtplib.SMTP
+        self.smtp = smtp_class(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            self.smtp.starttls()
+        if self.username:
+            self.smtp.login(self.username, self.password)
+
+    def send(self, message):
+        """メールを送信する（接続していなければ接続する）"""
+        if not message['to']:
+            raise ValueError('宛先が設定されていません')
+        if self.smtp is None:
+            self.open()
+        mail = EmailMessage()
+        mail['From'] = self.sender or self.username
+        mail['To'] = message['to']
+        mail['Subject'] = message['subject']
+        mail.set_content(message['body'])
+        for attachment in message['attachments']:
+            mime_type = mimetypes.guess_type(attachment)[0] or 'application/octet-stream'
+            maintype, subtype = mime_type.split('/', 1)
+            with open(attachment, 'rb') as f:
+                mail.add_attachment(f.read(), maintype=maintype, subtype=subtype,
+                                    filename=os.path.basename(attachment))
+        self.smtp.send_message(mail)
+
+    def close(self):
+        """接続を閉じる"""
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except OSError:
+                # smtplib.SMTPException も OSError のサブクラス
+                pass
+            self.smtp = None
+
+
+def create_transport(config):
+    """設定からトランスポートを作る"""
+    if config['transport'] == 'outlook':
+        return OutlookTransport(display=config['display'])
+    if config['transport'] == 'smtp':
+        return SmtpTransport(config['smtp_host'], config['smtp_port'], config['from'], config['smtp_user'],
+                             config['smtp_password'], config['starttls'], config['use_ssl'])
+    raise ValueError(f"不明なトランスポートです: {config['transport']}")
+
+
+class MailDispatcher:
+    """
+    PDFのメール送信を順に行うキュー
+
+    submit() はすぐに戻り、送信はバックグラウンドのスレッドで行う。
+    結果は notify('-MAIL_SENT-', (ファイルのリスト, エラー内容。送信できた場合は None)) で知らせる。
+    まとめたPDFのうち見つからないファイルは、ほかのPDFとは別に失敗として知らせ、残りだけを送る。
+
+    Args:
+        transport: open() / send(message) / close() を持つトランスポート
+        to (str): 宛先
+        notify (function): (イベント名, 値) を受け取る関数（window.write_event_value など）
+        batch_size (int): 1通のメールにまとめるPDFの最大数
+        batch_wait (float): まとめるために次のPDFを待つ秒数
+        max_retries (int): 送信に失敗したときに再送する回数
+        retry_backoff (float): 最初の再送までの秒数（再送のたびに2倍にする）
+        idle_timeout (float): この秒数だけ送るものがなければ接続を閉じる
+    """
+
+    def __init__(self, transport, to, notify=None, batch_size=1, batch_wait=3.0, max_retries=5,
+                 retry_backoff=2.0, idle_timeout=60.0):
+        self.transport = transport
+        self.to = to
+        self.notify = notify
+        self.batch_size = max(batch_size, 1)
+        self.batch_wait = batch_wait
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.idle_timeout = idle_timeout
+        self.queue = queue.Queue()
+        # close() が呼ばれたら再送の待ち時間を打ち切る
+        self.closing = threading.Event()
+        self.thread = threading.Thread(target=self.worker, daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def from_config(cls, config, notify=None):
+        """設定から作る"""
+        return cls(create_transport(config), config['to'], notify, config['batch_size'], config['batch_wait'],
+                   config['max_retries'], config['retry_backoff'], config['idle_timeout'])
+
+    def submit(self, file_path, values):
+        """PDFの送信を予約する"""
+        self.queue.put((file_path, values))
+
+    def close(self):
+        """予約済みのメールを送り終えてから止める（再送を待っているメールは再送せずに失敗とする）"""
+        self.closing.set()
+        self.queue.put(None)
+        self.thread.join()
+
+    def _collect_batch(self, first):
+        """最初の1件に続けて届いたPDFを batch_size 件までまとめる"""
+        batch = [first]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                # 止める合図は、まとめた分を送ってから処理する
+                self.queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _send_with_retry(self, message):
+        """送信に失敗したら、接続し直して間隔を空けながら再送する"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.transport.send(message)
+                return None
+            except (ValueError, FileNotFoundError) as e:
+                # 設定や添付ファイルの誤りは再送しても直らない
+                return f'{type(e).__name__}: {e}'
+            except Exception as e:
+                error = f'{type(e).__name__}: {e}'
+                self.transport.close()
+                # 止める合図があれば待たずに打ち切る
+                if attempt < self.max_retries and self.closing.wait(self.retry_backoff * 2 ** attempt):
+                    break
+        return error
+
+    def worker(self):
+        """予約されたPDFを順に送信する（バックグラウンドのスレッドで実行される）"""
+        while True:
+            try:
+                item = self.queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                self.transport.close()
+                continue
+            if item is None:
+                break
+
+            batch = self._collect_batch(item) if self.batch_size > 1 else [item]
+            # 見つからないファイルがあっても、ほかのPDFは送る
+            missing = [file_path for file_path, _ in batch if not os.path.isfile(file_path)]
+            if missing and self.notify:
+                self.notify('-MAIL_SENT-', (missing, 'FileNotFoundError: 添付するファイルがありません'))
+            batch = [(file_path, values) for file_path, values in batch if file_path not in missing]
+            if not batch:
+                continue
+            files = [file_path for file_path, _ in batch]
+            message = {
+                'to': self.to,
+                'subject': MAIL_SUBJECT,
+                'body': build_mail_text([values for _, values in batch]),
+                'attachments': files,
+            }
+            error = self._send_with_retry(message)
+            if self.notify:
+                self.notify('-MAIL_SENT-', (files, error))
+        self.transport.close()
@@ -1,38 +1,141 @@
 """
 同一ディレクトリにあるPDFファイルを1つのファイルに結合する
-pip install PyPDF2
+pip install PyMuPDF  （または pip install PyPDF2）
+
+引数を指定すると、ファイル・フォルダ・マニフェストを入力にして、多数のファイルを並列に結合できる。
+フォルダ内のファイルは自然順（2.pdf が 10.pdf より前）に並べ、以前に結合した出力は入力から除く。
+
+例:
+    python marge_pdf_file.py
+    python marge_pdf_file.py 2024-03/ -r -o merged/2024-03.pdf -j 8 --exclude "*_draft.pdf"
+    python marge_pdf_file.py --manifest month_end.txt -o month_end.pdf
+    python marge_pdf_file.py scans/ -r --dry-run --save-plan plan.json
 """
 
-import PyPDF2
+import argparse
+import os
+import sys
 from pathlib import Path
 from datetime import datetime
 
+from pdf_merge_engine import BACKENDS, DEFAULT_CHUNK_SIZE, merge_pdf_files, merge_pdf_files_parallel
+from pdf_merge_plan import PREVIOUS_OUTPUT_REASON, SORT_ORDERS, build_merge_plan, save_plan
+
+
+def merge_pdfs(backend=None):
+    """
+    PDFファイルを結合する関数
+
+    結合は pdf_merge_engine で行う（fitz があれば入力を少しずつ追加するので、メモリは入力の合計に比例しない）
 
-def merge_pdfs():
-    """PDFファイルを結合する関数"""
+    Args:
+        backend (str): 'fitz' または 'pypdf2'。省略した場合は使えるほう（fitz を優先）
 
-    merger = PyPDF2.PdfMerger()
+    Returns:
+        dict: 結合結果のサマリー（読めずにスキップしたファイルも errors に入れる）。結合するPDFがなければ None
+    """
     # 現在の作業ディレクトリを入力フォルダとする
     input_folder = Path().cwd()
     # 入力フォルダのパスをPathオブジェクトとして取得
     base_path = Path(input_folder)
 
-    # 入力フォルダ内のPDFファイルをリストとして取得し、ファイル名でソート
-    pdf_list = list(base_path.glob('*.pdf'))
-    sorted_pdf_list = sorted(pdf_list)
-
-    # PDFファイルを順に結合
-    for sorted_pdf in sorted_pdf_list:
-        merger.append(str(sorted_pdf))
-
     # 出力ファイル名を指定し、結合したPDFファイルを保存
     now = datetime.now()
     dt = now.strftime('%Y%m%d%H%M%S')
     output_path = base_path / (dt + '.pdf')  # 出力ファイル名を指定してパスを生成
 
-    merger.write(str(output_path))
-    merger.close()
+    # 入力フォルダ内のPDFファイルを自然順に並べる（以前に結合したファイルは除く）
+    plan = build_merge_plan([base_path], output_path)
+    sorted_pdf_list = [item['path'] for item in plan['inputs']]
+    # 以前に結合したファイルはエラーではないので除く
+    skipped = [(item['path'], item['reason']) for item in plan['skipped'] if item['reason'] != PREVIOUS_OUTPUT_REASON]
+    if not sorted_pdf_list:
+        for path, reason in skipped:
+            print(f'スキップ: {path}: {reason}', file=sys.stderr)
+        print('結合するPDFがありません', file=sys.stderr)
+        return None
+
+    # PDFファイルを順に結合
+    summary = merge_pdf_files(sorted_pdf_list, output_path, backend=backend)
+    summary['errors'] = skipped + summary['errors']
+    return summary
+
+
+def parse_args(argv=None):
+    """コマンドライン引数を解析する"""
+    parser = argparse.ArgumentParser(description='PDFファイルを1つのファイルに結合します。')
+    parser.add_argument('sources', nargs='*', help='PDFファイルまたはフォルダ (省略時はカレントディレクトリ)')
+    parser.add_argument('-r', '--recursive', action='store_true', help='フォルダのサブフォルダもたどる')
+    parser.add_argument('--manifest', '--file-list', dest='manifest',
+                        help='結合するファイルの一覧 (1行に1つのパスのテキスト、またはJSON)。書かれた順に結合する')
+    parser.add_argument('--include', action='append', default=[], help='フォルダ内のファイルのうち一致するものだけを使う (複数指定可)')
+    parser.add_argument('--exclude', action='append', default=[], help='一致するファイルを除く (複数指定可)')
+    parser.add_argument('--sort', choices=SORT_ORDERS, default='natural', help='フォルダ内のファイルの順序')
+    parser.add_argument('-o', '--output', help='出力先 (省略時は入力フォルダの YYYYmmddHHMMSS.pdf)')
+    parser.add_argument('--backend', choices=BACKENDS, help='結合方法 (省略時は fitz があれば fitz)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='ワーカープロセス数 (省略時はCPU数)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='並列に結合するときに1つの中間ファイルにまとめるファイル数')
+    parser.add_argument('--no-outline', action='store_true', help='ファイルごとのしおりを作らない')
+    parser.add_argument('--no-dedupe', action='store_true', help='重複したフォント・画像をまとめない (速いが大きくなる)')
+    parser.add_argument('--no-cache', action='store_true', help='ページ数のキャッシュを使わない')
+    parser.add_argument('--dry-run', action='store_true', help='結合せずに計画を表示する')
+    parser.add_argument('--save-plan', help='計画をJSONで保存する (--manifest で読み込める)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """コマンドラインからPDFを結合する"""
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        # 引数がなければ従来どおりカレントディレクトリのPDFを結合する
+        summary = merge_pdfs()
+        if summary is None:
+            return 1
+        for path, error in summary['errors']:
+            print(f'エラー: {path}: {error}', file=sys.stderr)
+        return 1 if summary['errors'] else 0
+    args = parse_args(argv)
+
+    sources = args.sources or ([] if args.manifest else ['.'])
+    output_path = args.output or os.path.join(
+        sources[0] if sources and os.path.isdir(sources[0]) else '.',
+        datetime.now().strftime('%Y%m%d%H%M%S') + '.pdf')
+
+    plan = build_merge_plan(sources, output_path, recursive=args.recursive, manifest=args.manifest,
+                            include=args.include, exclude=args.exclude, sort=args.sort,
+                            use_cache=not args.no_cache, workers=args.jobs)
+    # 以前に結合したファイルを除くのは通常の動作なので、スキップとしては表示しない
+    skipped = [item for item in plan['skipped'] if item['reason'] != PREVIOUS_OUTPUT_REASON]
+    for item in skipped:
+        print(f"スキップ: {item['path']}: {item['reason']}", file=sys.stderr)
+    print(f"計画: {len(plan['inputs'])} ファイル, {plan['pages']} ページ, {plan['bytes'] / 1e6:,.1f} MB "
+          f"→ {plan['output']} ({plan['elapsed']} 秒)", file=sys.stderr)
+    if args.save_plan:
+        save_plan(plan, args.save_plan)
+    if args.dry_run:
+        for item in plan['inputs']:
+            print(f"{item['pages']:>6}  {item['path']}")
+        return 0
+
+    inputs = [item['path'] for item in plan['inputs']]
+    if not inputs:
+        print('結合するPDFがありません', file=sys.stderr)
+        return 1
+
+    def on_progress(done, total):
+        print(f'\r中間ファイル: {done} / {total}', end='', file=sys.stderr, flush=True)
+
+    summary = merge_pdf_files_parallel(inputs, output_path, backend=args.backend, chunk_size=args.chunk_size,
+                                       workers=args.jobs, dedupe=not args.no_dedupe, outline=not args.no_outline,
+                                       progress_callback=on_progress)
+    print(file=sys.stderr)
+    for path, error in summary['errors']:
+        print(f'エラー: {path}: {error}', file=sys.stderr)
+    print(f"{output_path}: {len(summary['sources'])} / {summary['files']} ファイル, {summary['pages']} ページ "
+          f"({summary['backend']}, {summary['elapsed']} 秒)")
+    return 1 if summary['errors'] or skipped else 0
 
 
 if __name__ == "__main__":
-    merge_pdfs()
\ No newline at end of file
+    sys.exit(main())
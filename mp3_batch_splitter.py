@@ -0,0 +1,225 @@
+"""
+複数のMP3ファイルをまとめて分割するコマンドラインツール
+
+フォルダまたはglobパターンで指定したMP3ファイルをプロセスプールで並列に分割し、
+ファイルごとの結果（セグメント数・バイト数・処理時間）をJSONで出力する。
+セグメントの書き込みは同時実行数を --io-limit で制限できる。
+
+例:
+    python mp3_batch_splitter.py podcasts/ --interval 5:00 -o split/ --summary summary.json
+    python mp3_batch_splitter.py "lectures/*.mp3" --times "30:00, 1:00:00" -j 8 --io-limit 2
+    python mp3_batch_splitter.py podcasts/ --interval 10:00 --silence -o split/
+"""
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from mp3_split_engine import (find_silence_split_points, fixed_split_points, get_frame_index, parse_time_to_seconds,
+                              split_mp3_file)
+
+# ワーカープロセス間で共有する書き込みの同時実行数の制限
+_io_semaphore = None
+
+
+def _init_worker(io_semaphore):
+    """ワーカープロセスの初期化"""
+    global _io_semaphore
+    _io_semaphore = io_semaphore
+
+
+def collect_input_files(sources):
+    """
+    フォルダまたはglobパターンから入力MP3ファイルのリストを作成する
+
+    Args:
+        sources (list): フォルダのパスまたはglobパターンのリスト
+
+    Returns:
+        list: 重複を除いてソートしたMP3ファイルのパスのリスト
+    """
+    files = set()
+    for source in sources:
+        if os.path.isdir(source):
+            files.update(str(path) for path in Path(source).rglob('*') if path.suffix.lower() == '.mp3')
+        else:
+            files.update(path for path in glob.glob(source, recursive=True) if os.path.isfile(path))
+    return sorted(files)
+
+
+def assign_output_folders(input_files, output_root):
+    """
+    入力ファイルごとの出力フォルダを決める
+
+    出力先を指定した場合はファイル名ごとのサブフォルダにし、同じ名前が重複したら番号を付ける。
+    指定しない場合は入力ファイルと同じフォルダに出力する。
+    """
+    if not output_root:
+        return [os.path.dirname(os.path.abspath(path)) for path in input_files]
+
+    used_names = set()
+    folders = []
+    for path in input_files:
+        stem = Path(path).stem
+        name = stem
+        number = 1
+        while name in used_names:
+            name = f'{stem}_{number}'
+            number += 1
+        used_names.add(name)
+        folders.append(os.path.join(output_root, name))
+    return folders
+
+
+def split_one_file(input_file, output_folder, plan, cache_dir=None):
+    """
+    1つのファイルを分割して結果を返す（ワーカープロセスで実行される）
+
+    Args:
+        input_file (str): 入力MP3ファイルのパス
+        output_folder (str): 出力フォルダのパス
+        plan (dict): 分割計画。{'interval': 秒, 'silence': 無音で区切るか} または {'times': [秒, ...]}
+        cache_dir (str): 索引キャッシュの保存先フォルダ
+
+    Returns:
+        dict: 入力ファイル・出力フォルダ・セグメント数・バイト数・処理時間・エラー
+    """
+    start = time.perf_counter()
+    result = {'input': input_file, 'output_folder': output_folder, 'segments': 0, 'bytes': 0,
+              'elapsed': 0.0, 'error': None}
+    try:
+        # 索引の作成はCPU処理が中心なので制限の外で行う
+        index = get_frame_index(input_file, cache_dir)
+
+        if plan.get('interval') and plan.get('silence'):
+            split_points = find_silence_split_points(input_file, plan['interval'])
+        elif plan.get('interval'):
+            split_points = fixed_split_points(plan['interval'], index.duration)
+        else:
+            split_points = plan['times']
+
+        if _io_semaphore is not None:
+            with _io_semaphore:
+                output_paths = split_mp3_file(input_file, output_folder, split_points, index=index)
+        else:
+            output_paths = split_mp3_file(input_file, output_folder, split_points, index=index)
+
+        result['segments'] = len(output_paths)
+        result['bytes'] = sum(os.path.getsize(path) for path in output_paths)
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+
+    result['elapsed'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def batch_split(input_files, plan, output_root=None, jobs=None, io_limit=2, cache_dir=None, status_callback=None):
+    """
+    複数のMP3ファイルをプロセスプールで並列に分割する
+
+    Args:
+        input_files (list): 入力MP3ファイルのパスのリスト
+        plan (dict): 分割計画。{'interval': 秒, 'silence': 無音で区切るか} または {'times': [秒, ...]}
+        output_root (str): 出力先フォルダ。省略した場合は入力ファイルと同じフォルダ
+        jobs (int): ワーカープロセス数。省略した場合はCPU数
+        io_limit (int): セグメントを同時に書き込むファイル数の上限
+        cache_dir (str): 索引キャッシュの保存先フォルダ
+        status_callback (function): ファイルごとの結果を受け取るコールバック関数
+
+    Returns:
+        dict: ファイルごとの結果と合計を含むサマリー
+    """
+    start = time.perf_counter()
+    output_folders = assign_output_folders(input_files, output_root)
+    io_semaphore = multiprocessing.Semaphore(max(1, io_limit))
+
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(io_semaphore,)) as executor:
+        futures = [executor.submit(split_one_file, input_file, output_folder, plan, cache_dir)
+                   for input_file, output_folder in zip(input_files, output_folders)]
+        for future in futures:
+            result = future.result()
+            results.append(result)
+            if status_callback:
+                status_callback(result)
+
+    return {
+        'files': results,
+        'total_files': len(results),
+        'failed_files': sum(1 for result in results if result['error']),
+        'total_segments': sum(result['segments'] for result in results),
+        'total_bytes': sum(result['bytes'] for result in results),
+        'elapsed': round(time.perf_counter() - start, 3),
+    }
+
+
+def parse_args(argv=None):
+    """コマンドライン引数を解析する"""
+    parser = argparse.ArgumentParser(description='複数のMP3ファイルを並列で分割します。')
+    parser.add_argument('sources', nargs='+', help='入力フォルダまたはglobパターン')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--interval', help='固定時間で分割する間隔 (h:mm:ss, mm:ss または秒)')
+    group.add_argument('--times', help='分割時間ポイント (カンマ区切り)')
+    parser.add_argument('--silence', action='store_true',
+                        help='--interval の近くにある無音で区切る (NumPy と FFmpeg が必要)')
+    parser.add_argument('-o', '--output', help='出力先フォルダ (省略時は入力ファイルと同じフォルダ)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='ワーカープロセス数 (省略時はCPU数)')
+    parser.add_argument('--io-limit', type=int, default=2, help='同時に書き込むファイル数の上限')
+    parser.add_argument('--cache-dir', default=None, help='索引キャッシュの保存先フォルダ')
+    parser.add_argument('--summary', help='サマリーJSONの出力先 (省略時は標準出力)')
+    args = parser.parse_args(argv)
+
+    # 時間の文字列はここで秒数に変換し、誤りは使い方のエラーとして表示する
+    if args.silence and args.times:
+        parser.error('--silence は --interval と一緒に指定してください (--times とは併用できません)')
+    try:
+        if args.interval is not None:
+            args.interval = parse_time_to_seconds(args.interval)
+        else:
+            args.times = sorted(parse_time_to_seconds(time_str) for time_str in args.times.split(','))
+    except ValueError:
+        parser.error(f'時間の形式が正しくありません: {args.times if args.interval is None else args.interval} (h:mm:ss, mm:ss または秒)')
+    if args.interval is not None and args.interval <= 0:
+        parser.error('分割時間を設定してください。')
+    return args
+
+
+def main(argv=None):
+    """コマンドラインから一括分割を実行する"""
+    args = parse_args(argv)
+
+    if args.interval is not None:
+        plan = {'interval': args.interval, 'silence': args.silence}
+    else:
+        plan = {'times': args.times}
+
+    input_files = collect_input_files(args.sources)
+    if not input_files:
+        sys.exit('MP3ファイルが見つかりませんでした。')
+
+    def on_result(result):
+        if result['error']:
+            print(f"エラー: {result['input']}: {result['error']}", file=sys.stderr)
+        else:
+            print(f"完了: {result['input']} ({result['segments']} 個, {result['elapsed']} 秒)", file=sys.stderr)
+
+    summary = batch_split(input_files, plan, output_root=args.output, jobs=args.jobs, io_limit=args.io_limit,
+                          cache_dir=args.cache_dir, status_callback=on_result)
+
+    summary_json = json.dumps(summary, ensure_ascii=False, indent=2)
+    if args.summary:
+        Path(args.summary).write_text(summary_json, encoding='utf-8')
+    else:
+        print(summary_json)
+
+    return 1 if summary['failed_files'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,825 @@
+"""
+MP3ファイルをフレーム境界で分割するエンジン（GUIに依存しない）
+
+ファイル全体をメモリに読み込まず、フレームヘッダーを1回のストリーミング走査で解析して
+フレームごとのバイトオフセット索引を作成し、分割ポイントに最も近いフレーム境界で切り出す。
+切り出しは os.sendfile（使えない環境では固定サイズのバッファ）でコピーするため、
+入力ファイルの大きさに関係なくメモリ使用量は一定になる。
+
+作成した索引は パス・サイズ・更新日時 をキーにしてディスクにキャッシュするので、
+同じファイルを2回目以降に分割するときは走査を省略できる。
+
+無音検出による自動分割には NumPy と FFmpeg が必要（固定時間・指定時間の分割には不要）。
+pip install numpy
+"""
+
+import hashlib
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+from array import array
+from collections import namedtuple
+from pathlib import Path
+
+# 走査時に一度に読み込むバイト数
+READ_CHUNK_SIZE = 1024 * 1024
+# セグメントをコピーするときの1回あたりのバイト数
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+# フレームヘッダーを確認するために必要な先読みバイト数（最大フレーム長より十分大きい値）
+_LOOKAHEAD = 8192
+# 索引キャッシュの保存先（環境変数 MP3_SPLITTER_CACHE_DIR で変更できる）
+DEFAULT_CACHE_DIR = os.environ.get('MP3_SPLITTER_CACHE_DIR', str(Path.home() / '.mp3_splitter_cache'))
+# 索引キャッシュの形式が変わったときに古いキャッシュを無視するためのバージョン
+_CACHE_VERSION = 1
+# 無音検出のためにデコードするときのサンプルレート（音量の判定には低いサンプルレートで十分）
+ANALYSIS_SAMPLE_RATE = 8000
+
+# ビットレート表 (kbps)。キーは (MPEG1なら1・MPEG2/2.5なら2, レイヤー)
+_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+# サンプルレート表 (Hz)。キーはヘッダーのバージョンID (3: MPEG1, 2: MPEG2, 0: MPEG2.5)
+_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    0: (11025, 12000, 8000),
+}
+
+FrameHeader = namedtuple('FrameHeader',
+                         ['length', 'bitrate', 'sample_rate', 'samples', 'channels', 'version_id', 'layer'])
+
+Segment = namedtuple('Segment', ['start_time', 'end_time', 'start_byte', 'end_byte'])
+
+Mp3Info = namedtuple('Mp3Info', ['duration', 'bitrate', 'sample_rate', 'channels', 'exact'])
+
+
+class SplitCancelled(Exception):
+    """分割処理が中止されたときに送出される例外"""
+
+
+def _check_cancelled(cancel_event):
+    """中止が要求されていたら SplitCancelled を送出する"""
+    if cancel_event is not None and cancel_event.is_set():
+        raise SplitCancelled()
+
+
+def parse_frame_header(header):
+    """
+    4バイトのMPEGオーディオフレームヘッダーを解析する
+
+    Args:
+        header (bytes): フレーム先頭の4バイト
+
+    Returns:
+        FrameHeader: 解析結果。フレームヘッダーとして無効な場合は None
+    """
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+
+    version_id = (header[1] >> 3) & 0x03
+    layer_bits = (header[1] >> 1) & 0x03
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0x03
+
+    # 予約値・フリーフォーマットは扱わない
+    if version_id == 1 or layer_bits == 0 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    layer = 4 - layer_bits
+    mpeg1 = version_id == 3
+    bitrate = _BITRATES[(1 if mpeg1 else 2, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version_id][sample_rate_index]
+    padding = (header[2] >> 1) & 0x01
+
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 2:
+        samples = 1152
+        length = 144 * bitrate // sample_rate + padding
+    else:
+        # レイヤー3はMPEG2/2.5だとフレームあたりのサンプル数が半分になる
+        samples = 1152 if mpeg1 else 576
+        length = samples // 8 * bitrate // sample_rate + padding
+
+    # チャンネルモード3はモノラル
+    channels = 1 if (header[3] >> 6) == 3 else 2
+
+    return FrameHeader(length, bitrate, sample_rate, samples, channels, version_id, layer)
+
+
+def _is_same_stream(a, b):
+    """2つのフレームヘッダーが同じストリームのものかどうかを返す"""
+    return (a.version_id, a.layer, a.sample_rate) == (b.version_id, b.layer, b.sample_rate)
+
+
+def _vbr_tag_offset(header):
+    """Xing/Info タグがフレーム先頭から何バイト目にあるかを返す"""
+    if header.version_id == 3:
+        return 4 + (17 if header.channels == 1 else 32)
+    return 4 + (9 if header.channels == 1 else 17)
+
+
+def _is_vbr_header_frame(buf, pos, header):
+    """フレームが音声ではなく Xing/Info/VBRI ヘッダーを格納したフレームかどうかを返す"""
+    tag_offset = pos + _vbr_tag_offset(header)
+    if buf[tag_offset:tag_offset + 4] in (b'Xing', b'Info'):
+        return True
+    return buf[pos + 36:pos + 40] == b'VBRI'
+
+
+def _read_vbr_frame_count(frame, header):
+    """
+    Xing/Info/VBRI ヘッダーに記録されたフレーム数を返す
+
+    Args:
+        frame (bytes): 先頭フレームのデータ
+        header (FrameHeader): 先頭フレームのヘッダー
+
+    Returns:
+        int: フレーム数。ヘッダーがない、またはフレーム数が記録されていない場合は None
+    """
+    tag_offset = _vbr_tag_offset(header)
+    if frame[tag_offset:tag_offset + 4] in (b'Xing', b'Info'):
+        flags = int.from_bytes(frame[tag_offset + 4:tag_offset + 8], 'big')
+        if flags & 0x01:
+            return int.from_bytes(frame[tag_offset + 8:tag_offset + 12], 'big')
+        return None
+
+    # VBRI ヘッダーはフレーム先頭から36バイト目に固定
+    if frame[36:40] == b'VBRI':
+        return int.from_bytes(frame[50:54], 'big')
+
+    return None
+
+
+def id3v2_tag_size(data):
+    """
+    先頭の ID3v2 タグの大きさを返す
+
+    Args:
+        data (bytes): ファイル先頭の10バイト以上
+
+    Returns:
+        int: タグのバイト数（フッターを含む）。タグがなければ 0
+    """
+    if len(data) < 10 or data[:3] != b'ID3':
+        return 0
+    # サイズは各バイト7ビットの syncsafe 整数
+    size = (data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F)
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+class FrameIndex:
+    """
+    MP3ファイルのフレーム索引
+
+    フレームの長さ（時間）はストリーム内で一定なので、フレーム番号から時間が求まる。
+    そのためフレームごとにはバイトオフセットだけを保持する。
+    """
+
+    def __init__(self, offsets, audio_end, sample_rate, samples_per_frame, channels, file_size):
+        self.offsets = offsets
+        self.audio_end = audio_end
+        self.sample_rate = sample_rate
+        self.samples_per_frame = samples_per_frame
+        self.channels = channels
+        self.file_size = file_size
+
+    @property
+    def frame_count(self):
+        """フレーム数を返す"""
+        return len(self.offsets)
+
+    @property
+    def frame_duration(self):
+        """1フレームの長さ（秒）を返す"""
+        return self.samples_per_frame / self.sample_rate
+
+    @property
+    def duration(self):
+        """音声の長さ（秒）を返す"""
+        return self.frame_count * self.frame_duration
+
+    @property
+    def bitrate(self):
+        """平均ビットレート (bps) を返す"""
+        if not self.offsets:
+            return 0
+        return int((self.audio_end - self.offsets[0]) * 8 / self.duration)
+
+    def frame_at(self, seconds):
+        """指定した時間に最も近いフレーム境界のフレーム番号を返す"""
+        frame = int(round(seconds / self.frame_duration))
+        return max(0, min(frame, self.frame_count))
+
+    def offset_of_frame(self, frame):
+        """フレーム番号に対応するバイトオフセットを返す（末尾の場合は音声データの終端）"""
+        if frame >= self.frame_count:
+            return self.audio_end
+        return self.offsets[frame]
+
+    def time_of_frame(self, frame):
+        """フレーム番号に対応する時間（秒）を返す"""
+        return frame * self.frame_duration
+
+
+def build_frame_index(file_path, progress_callback=None, cancel_event=None):
+    """
+    MP3ファイルを1回だけ先頭から走査してフレーム索引を作成する
+
+    Args:
+        file_path (str): MP3ファイルのパス
+        progress_callback (function): 走査済みバイト数と全体のバイト数を受け取るコールバック関数
+        cancel_event (threading.Event): セットされたら SplitCancelled を送出して中止する
+
+    Returns:
+        FrameIndex: フレーム索引
+    """
+    offsets = array('q')
+    # 一度解析したヘッダーは4バイトの値をキーにして再利用する
+    known_headers = {}
+    first = None
+
+    with open(file_path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        pos = id3v2_tag_size(f.read(10))
+        audio_end = pos
+
+        buf = b''
+        buf_start = pos
+        eof = False
+        synced = False
+
+        while True:
+            rel = pos - buf_start
+
+            # 先読み分が足りなくなったら現在位置から読み直す
+            if not eof and rel + _LOOKAHEAD > len(buf):
+                f.seek(pos)
+                buf = f.read(READ_CHUNK_SIZE)
+                buf_start = pos
+                rel = 0
+                eof = len(buf) < READ_CHUNK_SIZE
+                _check_cancelled(cancel_event)
+                if progress_callback:
+                    progress_callback(pos, file_size)
+
+            if rel + 4 > len(buf):
+                break
+
+            header_bytes = buf[rel:rel + 4]
+            header = known_headers.get(header_bytes) if synced else None
+
+            if header is None:
+                header = parse_frame_header(header_bytes)
+                if header is not None and first is not None and not _is_same_stream(header, first):
+                    header = None
+
+                # 同期が外れている間は次のフレームヘッダーも確認して誤検出を防ぐ
+                if header is not None and not synced:
+                    next_rel = rel + header.length
+                    if next_rel + 4 <= len(buf):
+                        next_header = parse_frame_header(buf[next_rel:next_rel + 4])
+                        if next_header is None or not _is_same_stream(header, next_header):
+                            header = None
+                    elif not (eof and next_rel <= len(buf)):
+                        header = None
+
+                if header is None:
+                    # 次の同期ワードの候補まで進める
+                    synced = False
+                    next_sync = buf.find(b'\xff', rel + 1)
+                    pos = buf_start + (next_sync if next_sync != -1 else len(buf))
+                    if eof and next_sync == -1:
+                        break
+                    continue
+
+                known_headers[header_bytes] = header
+                synced = True
+
+            # 末尾で途切れているフレームは含めない
+            if pos + header.length > file_size:
+                break
+
+            if first is None:
+                first = header
+                if _is_vbr_header_frame(buf, rel, header):
+                    pos += header.length
+                    audio_end = pos
+                    continue
+
+            offsets.append(pos)
+            pos += header.length
+            audio_end = pos
+
+    if first is None:
+        raise ValueError(f'MPEGオーディオフレームが見つかりません: {file_path}')
+
+    if progress_callback:
+        progress_callback(file_size, file_size)
+
+    return FrameIndex(offsets, audio_end, first.sample_rate, first.samples, first.channels, file_size)
+
+
+def index_cache_path(file_path, cache_dir=None):
+    """索引キャッシュファイルのパスを返す"""
+    key = hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()
+    return Path(cache_dir or DEFAULT_CACHE_DIR) / f'{key}.idx'
+
+
+def _cache_key(file_path):
+    """キャッシュの有効性を判定するためのキー（パス・サイズ・更新日時）を返す"""
+    stat = os.stat(file_path)
+    return {'path': os.path.abspath(file_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def load_cached_index(file_path, cache_dir=None):
+    """
+    キャッシュからフレーム索引を読み込む
+
+    Args:
+        file_path (str): MP3ファイルのパス
+        cache_dir (str): キャッシュの保存先フォルダ
+
+    Returns:
+        FrameIndex: フレーム索引。キャッシュがない、または古い場合は None
+    """
+    cache_path = index_cache_path(file_path, cache_dir)
+    try:
+        with open(cache_path, 'rb') as f:
+            meta = json.loads(f.readline())
+            if (meta.get('version') != _CACHE_VERSION or meta.get('key') != _cache_key(file_path)
+                    or meta.get('byteorder') != sys.byteorder):
+                return None
+            offsets = array('q')
+            offsets.frombytes(f.read())
+    except (OSError, ValueError):
+        return None
+
+    if len(offsets) != meta['frame_count']:
+        return None
+
+    return FrameIndex(offsets, meta['audio_end'], meta['sample_rate'], meta['samples_per_frame'],
+                      meta['channels'], meta['key']['size'])
+
+
+def save_cached_index(file_path, index, key, cache_dir=None):
+    """
+    フレーム索引をキャッシュに保存する
+
+    Args:
+        file_path (str): MP3ファイルのパス
+        index (FrameIndex): 保存するフレーム索引
+        key (dict): 索引を作成する前に取得したキャッシュキー
+        cache_dir (str): キャッシュの保存先フォルダ
+    """
+    cache_path = index_cache_path(file_path, cache_dir)
+    meta = {
+        'version': _CACHE_VERSION,
+        'key': key,
+        'byteorder': sys.byteorder,
+        'frame_count': index.frame_count,
+        'audio_end': index.audio_end,
+        'sample_rate': index.sample_rate,
+        'samples_per_frame': index.samples_per_frame,
+        'channels': index.channels,
+    }
+    tmp_path = cache_path.with_suffix('.tmp')
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            f.write(json.dumps(meta).encode('utf-8') + b'\n')
+            index.offsets.tofile(f)
+        # 書きかけのキャッシュを読まないように置き換えで保存する
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # キャッシュが保存できなくても分割処理は続ける
+        pass
+
+
+def get_frame_index(file_path, cache_dir=None, progress_callback=None, cancel_event=None):
+    """
+    フレーム索引を返す。キャッシュが有効ならそれを使い、なければ走査して作成・保存する
+
+    Args:
+        file_path (str): MP3ファイルのパス
+        cache_dir (str): キャッシュの保存先フォルダ
+        progress_callback (function): 走査済みバイト数と全体のバイト数を受け取るコールバック関数
+        cancel_event (threading.Event): セットされたら SplitCancelled を送出して中止する
+
+    Returns:
+        FrameIndex: フレーム索引
+    """
+    index = load_cached_index(file_path, cache_dir)
+    if index is not None:
+        return index
+
+    # 走査中にファイルが変更された場合に備えて、走査前の状態をキーにする
+    key = _cache_key(file_path)
+    index = build_frame_index(file_path, progress_callback, cancel_event)
+    save_cached_index(file_path, index, key, cache_dir)
+    return index
+
+
+def probe_mp3(file_path, cache_dir=None):
+    """
+    MP3ファイルの長さなどの情報を、ファイル全体を走査せずに取得する
+
+    キャッシュ済みの索引があれば正確な値を、なければ Xing/VBRI ヘッダーのフレーム数
+    （ない場合は先頭フレームのビットレート）から求めた値を返す。
+
+    Args:
+        file_path (str): MP3ファイルのパス
+        cache_dir (str): キャッシュの保存先フォルダ
+
+    Returns:
+        Mp3Info: 長さ（秒）・ビットレート・サンプルレート・チャンネル数・正確な値かどうか
+    """
+    index = load_cached_index(file_path, cache_dir)
+    if index is not None:
+        return Mp3Info(index.duration, index.bitrate, index.sample_rate, index.channels, True)
+
+    with open(file_path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        f.seek(id3v2_tag_size(f.read(10)))
+        audio_start = f.tell()
+        data = f.read(_LOOKAHEAD)
+
+    # 先頭フレームを探す
+    pos = data.find(b'\xff')
+    while pos != -1:
+        header = parse_frame_header(data[pos:pos + 4])
+        if header is not None:
+            break
+        pos = data.find(b'\xff', pos + 1)
+    else:
+        raise ValueError(f'MPEGオーディオフレームが見つかりません: {file_path}')
+
+    frame_duration = header.samples / header.sample_rate
+    audio_bytes = file_size - audio_start - pos
+    frame_count = _read_vbr_frame_count(data[pos:pos + header.length], header)
+
+    if frame_count:
+        duration = frame_count * frame_duration
+        bitrate = int(audio_bytes * 8 / duration) if duration else header.bitrate
+    else:
+        # VBRヘッダーがない場合は固定ビットレートとみなして推定する
+        bitrate = header.bitrate
+        duration = audio_bytes * 8 / bitrate
+
+    return Mp3Info(duration, bitrate, header.sample_rate, header.channels, False)
+
+
+def plan_segments(index, split_points):
+    """
+    分割ポイント（秒）をフレーム境界に揃えてセグメントのリストを作成する
+
+    Args:
+        index (FrameIndex): フレーム索引
+        split_points (list): 分割ポイント（秒）のリスト
+
+    Returns:
+        list: Segment のリスト。時間はファイル名に使うため指定された分割ポイントのまま保持する
+    """
+    boundaries = [(0, 0)]
+    used_frames = {0, index.frame_count}
+    for point in sorted(split_points):
+        frame = index.frame_at(point)
+        if frame not in used_frames:
+            used_frames.add(frame)
+            boundaries.append((frame, point))
+    boundaries.append((index.frame_count, index.duration))
+
+    segments = []
+    for (start_frame, start_time), (end_frame, end_time) in zip(boundaries, boundaries[1:]):
+        segments.append(Segment(start_time, end_time,
+                                index.offset_of_frame(start_frame), index.offset_of_frame(end_frame)))
+    return segments
+
+
+def fixed_split_points(interval_seconds, total_duration):
+    """一定間隔の分割ポイント（秒）のリストを返す"""
+    split_points = []
+    current_time = interval_seconds
+    while current_time < total_duration:
+        split_points.append(current_time)
+        current_time += interval_seconds
+    return split_points
+
+
+def iter_pcm_chunks(file_path, sample_rate=ANALYSIS_SAMPLE_RATE, chunk_seconds=60):
+    """
+    FFmpeg でMP3をモノラルの16bit PCMにデコードし、NumPy配列のチャンクとして順に返す
+
+    Args:
+        file_path (str): MP3ファイルのパス
+        sample_rate (int): デコード後のサンプルレート
+        chunk_seconds (int): 1チャンクあたりの秒数
+
+    Yields:
+        numpy.ndarray: int16 のサンプル配列
+    """
+    import numpy as np
+
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        raise RuntimeError('無音検出には FFmpeg が必要です。PATH に ffmpeg を追加してください。')
+
+    command = [ffmpeg, '-v', 'error', '-nostdin', '-i', file_path,
+               '-f', 's16le', '-ac', '1', '-ar', str(sample_rate), '-']
+    chunk_bytes = sample_rate * chunk_seconds * 2
+
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            data = process.stdout.read(chunk_bytes)
+            if not data:
+                break
+            yield np.frombuffer(data[:len(data) // 2 * 2], dtype='<i2')
+    finally:
+        process.stdout.close()
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+
+    if process.returncode:
+        raise RuntimeError(f'FFmpeg でのデコードに失敗しました: {file_path}')
+
+
+def window_levels(file_path, window_seconds=0.05, sample_rate=ANALYSIS_SAMPLE_RATE, cancel_event=None):
+    """
+    一定時間の窓ごとの音量 (dBFS) を計算する
+
+    デコードしたチャンクを窓の大きさに並べ替えてまとめて計算するため、
+    メモリに保持するのは窓ごとの音量だけになる。
+
+    Args:
+        file_path (str): MP3ファイルのパス
+        window_seconds (float): 窓の長さ（秒）
+        sample_rate (int): デコード後のサンプルレート
+        cancel_event (threading.Event): セットされたら SplitCancelled を送出して中止する
+
+    Returns:
+        numpy.ndarray: 窓ごとのRMS音量 (dBFS)
+    """
+    import numpy as np
+
+    window = max(1, int(sample_rate * window_seconds))
+    leftover = np.empty(0, dtype=np.int16)
+    parts = []
+
+    for chunk in iter_pcm_chunks(file_path, sample_rate):
+        _check_cancelled(cancel_event)
+        if leftover.size:
+            chunk = np.concatenate((leftover, chunk))
+        count = chunk.size // window
+        frames = chunk[:count * window].astype(np.float32).reshape(count, window)
+        parts.append(np.sqrt(np.mean(frames * frames, axis=1)))
+        leftover = chunk[count * window:]
+
+    if not parts:
+        return np.empty(0, dtype=np.float32)
+
+    rms = np.concatenate(parts)
+    return 20 * np.log10(np.maximum(rms, 1.0) / 32768.0)
+
+
+def find_silence_split_points(file_path, interval_seconds, search_seconds=30, threshold_db=-40.0,
+                              min_silence_seconds=0.3, window_seconds=0.05, cancel_event=None):
+    """
+    指定した間隔の近くにある無音区間を探して分割ポイントにする
+
+    目標時間の前後 search_seconds 秒以内にある無音区間のうち、目標に最も近いものの中央を選ぶ。
+    無音区間がない場合は範囲内で最も音量の小さい位置を選ぶ。
+    次の目標時間は選んだ分割ポイントから interval_seconds 秒後とする。
+
+    Args:
+        file_path (str): MP3ファイルのパス
+        interval_seconds (float): 分割の目安となる間隔（秒）
+        search_seconds (float): 目標時間の前後で無音を探す範囲（秒）
+        threshold_db (float): 無音とみなす音量 (dBFS)
+        min_silence_seconds (float): 無音とみなす最短の長さ（秒）
+        window_seconds (float): 音量を計算する窓の長さ（秒）
+        cancel_event (threading.Event): セットされたら SplitCancelled を送出して中止する
+
+    Returns:
+        list: 分割ポイント（秒）のリスト
+    """
+    import numpy as np
+
+    levels = window_levels(file_path, window_seconds, cancel_event=cancel_event)
+    total_duration = levels.size * window_seconds
+
+    # 連続した無音窓の開始・終了位置を求める
+    silent = np.concatenate(([False], levels < threshold_db, [False]))
+    edges = np.flatnonzero(np.diff(silent.astype(np.int8)))
+    starts, ends = edges[0::2], edges[1::2]
+    long_enough = (ends - starts) >= math.ceil(min_silence_seconds / window_seconds)
+    centers = (starts[long_enough] + ends[long_enough]) / 2 * window_seconds
+
+    split_points = []
+    target = interval_seconds
+    while target < total_duration:
+        lower = max(target - search_seconds, split_points[-1] if split_points else 0)
+        upper = min(target + search_seconds, total_duration)
+
+        candidates = centers[(centers > lower) & (centers < upper)]
+        if candidates.size:
+            point = float(candidates[np.argmin(np.abs(candidates - target))])
+        else:
+            first = min(int(lower / window_seconds) + 1, levels.size - 1)
+            last = max(first + 1, min(int(upper / window_seconds), levels.size))
+            point = (first + int(np.argmin(levels[first:last])) + 0.5) * window_seconds
+
+        if point >= total_duration:
+            break
+        split_points.append(round(point, 3))
+        target = point + interval_seconds
+
+    return split_points
+
+
+def parse_time_to_seconds(time_str):
+    """時間文字列を秒数に変換（h:mm:ss または mm:ss 形式対応）"""
+    time_str = time_str.strip()
+
+    # h:mm:ss 形式の場合
+    if time_str.count(':') == 2:
+        h, m, s = map(int, time_str.split(':'))
+        return h * 3600 + m * 60 + s
+
+    # mm:ss 形式の場合
+    elif time_str.count(':') == 1:
+        m, s = map(int, time_str.split(':'))
+        return m * 60 + s
+
+    # 秒数のみの場合
+    else:
+        return int(time_str)
+
+
+def format_time(seconds):
+    """秒数を h:mm:ss 形式に変換"""
+    h = int(seconds // 3600)
+    m = int((seconds % 3600) // 60)
+    s = int(seconds % 60)
+
+    if h > 0:
+        return f"{h:02d}:{m:02d}:{s:02d}"
+    else:
+        return f"{m:02d}:{s:02d}"
+
+
+def sanitize_filename(filename):
+    """ファイル名から不正な文字を削除して安全なファイル名にする"""
+    # Windowsで使用できない文字を除去
+    invalid_chars = '<>:"/\\|?*'
+
+    # ファイル名から無効な文字を削除
+    for char in invalid_chars:
+        filename = filename.replace(char, '_')
+
+    # 長すぎるファイル名を短くする（240文字以内）
+    if len(filename) > 240:
+        name, ext = os.path.splitext(filename)
+        filename = name[:240 - len(ext)] + ext
+
+    return filename
+
+
+def segment_filename(base_name, segment):
+    """セグメントの出力ファイル名を返す"""
+    if segment.start_time == 0:
+        start_time = "00_00_00"
+    else:
+        start_time = format_time(segment.start_time).replace(":", "_")
+    end_time = format_time(segment.end_time).replace(":", "_")
+    return sanitize_filename(f"{base_name}_{start_time}-{end_time}.mp3")
+
+
+def _sendfile_range(src_file, dst_file, start, length, progress_callback):
+    """os.sendfile でカーネル内コピーする"""
+    in_fd = src_file.fileno()
+    out_fd = dst_file.fileno()
+    offset = start
+    remaining = length
+    while remaining > 0:
+        sent = os.sendfile(out_fd, in_fd, offset, min(COPY_CHUNK_SIZE, remaining))
+        if sent == 0:
+            break
+        offset += sent
+        remaining -= sent
+        if progress_callback:
+            progress_callback(sent)
+    return length - remaining
+
+
+def _buffered_copy_range(src_file, dst_file, start, length, progress_callback):
+    """固定サイズのバッファを使い回してコピーする"""
+    buffer = bytearray(min(COPY_CHUNK_SIZE, max(length, 1)))
+    view = memoryview(buffer)
+    src_file.seek(start)
+    remaining = length
+    while remaining > 0:
+        read = src_file.readinto(view[:min(len(buffer), remaining)])
+        if not read:
+            break
+        dst_file.write(view[:read])
+        remaining -= read
+        if progress_callback:
+            progress_callback(read)
+    return length - remaining
+
+
+def copy_byte_range(src_file, dst_file, start, end, progress_callback=None):
+    """
+    開いているファイルの [start, end) の範囲を別のファイルにコピーする
+
+    Args:
+        src_file: 読み込み元のバイナリファイルオブジェクト
+        dst_file: 書き込み先のバイナリファイルオブジェクト
+        start (int): 開始バイト位置
+        end (int): 終了バイト位置
+        progress_callback (function): コピーしたバイト数を受け取るコールバック関数
+
+    Returns:
+        int: コピーしたバイト数
+    """
+    length = end - start
+    if hasattr(os, 'sendfile'):
+        dst_file.flush()
+        try:
+            return _sendfile_range(src_file, dst_file, start, length, progress_callback)
+        except OSError:
+            # sendfile に対応していないファイルシステムの場合はバッファコピーに切り替える
+            dst_file.seek(0)
+            dst_file.truncate()
+    return _buffered_copy_range(src_file, dst_file, start, length, progress_callback)
+
+
+def split_mp3_file(input_file, output_folder, split_points, index=None, progress_callback=None,
+                   status_callback=None, cancel_event=None):
+    """
+    MP3ファイルをフレーム境界で分割して出力フォルダに保存する
+
+    Args:
+        input_file (str): 入力MP3ファイルのパス
+        output_folder (str): 出力フォルダのパス
+        split_points (list): 分割ポイント（秒）のリスト
+        index (FrameIndex): フレーム索引。省略した場合はキャッシュを使うか入力ファイルを走査して作成する
+        progress_callback (function): 書き込み済みバイト数と全体のバイト数を受け取るコールバック関数
+        status_callback (function): 状態メッセージを報告するコールバック関数
+        cancel_event (threading.Event): セットされたら書きかけのファイルを削除して SplitCancelled を送出する
+
+    Returns:
+        list: 作成したファイルのパスのリスト
+    """
+    if index is None:
+        if status_callback:
+            status_callback("ファイルを解析しています...")
+        index = get_frame_index(input_file, cancel_event=cancel_event)
+
+    segments = plan_segments(index, split_points)
+    total_bytes = sum(segment.end_byte - segment.start_byte for segment in segments)
+    base_name = os.path.splitext(os.path.basename(input_file))[0]
+    os.makedirs(output_folder, exist_ok=True)
+
+    written = 0
+
+    def on_copied(nbytes):
+        nonlocal written
+        written += nbytes
+        _check_cancelled(cancel_event)
+        if progress_callback:
+            progress_callback(written, total_bytes)
+
+    output_paths = []
+    with open(input_file, 'rb') as src_file:
+        for segment in segments:
+            output_filename = segment_filename(base_name, segment)
+            output_path = os.path.join(output_folder, output_filename)
+
+            try:
+                with open(output_path, 'wb') as dst_file:
+                    copy_byte_range(src_file, dst_file, segment.start_byte, segment.end_byte, on_copied)
+            except SplitCancelled:
+                # 途中までしか書き込まれていないファイルは残さない
+                os.remove(output_path)
+                raise
+
+            output_paths.append(output_path)
+            if status_callback:
+                status_callback(f"分割ファイル作成: {output_filename}")
+
+    return output_paths
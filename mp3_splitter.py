@@ -1,17 +1,22 @@
-# pip install mutagen
-
 import os
+import queue
+import threading
+import time
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox
 
-from mutagen.mp3 import MP3
+from mp3_split_engine import (SplitCancelled, find_silence_split_points, fixed_split_points, format_time,
+                              get_frame_index, parse_time_to_seconds, probe_mp3, sanitize_filename, split_mp3_file)
+
+# ワーカースレッドからの通知を確認する間隔（ミリ秒）
+QUEUE_POLL_INTERVAL = 100
 
 
 class MP3SplitterApp:
     def __init__(self, root):
         self.root = root
         self.root.title("MP3分割ツール")
-        self.root.geometry("600x500")
+        self.root.geometry("600x590")
         self.root.resizable(False, False)
 
         # 入力ファイル関連
@@ -59,6 +64,10 @@ class MP3SplitterApp:
         ttk.Spinbox(self.fixed_frame, from_=0, to=59, textvariable=self.seconds, width=2).pack(side="left", padx=(5, 0))
         ttk.Label(self.fixed_frame, text="秒").pack(side="left")
 
+        # 無音検出による自動分割（分割時間の近くにある無音で区切る）
+        ttk.Radiobutton(self.time_frame, text="分割時間の近くの無音で自動分割", variable=self.split_mode,
+                        value="auto", command=self.toggle_split_mode).pack(anchor="w", padx=5, pady=2)
+
         # カスタム時間分割の設定
         ttk.Radiobutton(self.time_frame, text="カスタム時間で分割", variable=self.split_mode,
                         value="custom", command=self.toggle_split_mode).pack(anchor="w", padx=5, pady=2)
@@ -79,10 +88,24 @@ class MP3SplitterApp:
         for child in self.custom_frame.winfo_children():
             child.configure(state="disabled")
 
-        # 実行ボタン
+        # 実行ボタン・中止ボタン
         self.button_frame = ttk.Frame(root)
-        self.button_frame.pack(fill="x", padx=10, pady=20)
-        ttk.Button(self.button_frame, text="分割開始", command=self.split_mp3, width=20).pack(anchor="center")
+        self.button_frame.pack(fill="x", padx=10, pady=(20, 5))
+        self.buttons_inner = ttk.Frame(self.button_frame)
+        self.buttons_inner.pack(anchor="center")
+        self.start_button = ttk.Button(self.buttons_inner, text="分割開始", command=self.split_mp3, width=20)
+        self.start_button.pack(side="left", padx=5)
+        self.cancel_button = ttk.Button(self.buttons_inner, text="中止", command=self.cancel_split, width=10,
+                                        state="disabled")
+        self.cancel_button.pack(side="left", padx=5)
+
+        # 進捗表示（プログレスバーと処理速度）
+        self.progress_frame = ttk.Frame(root)
+        self.progress_frame.pack(fill="x", padx=10, pady=5)
+        self.progress_bar = ttk.Progressbar(self.progress_frame, orient="horizontal", mode="determinate")
+        self.progress_bar.pack(side="left", fill="x", expand=True, padx=5)
+        self.throughput = tk.StringVar()
+        ttk.Label(self.progress_frame, textvariable=self.throughput, width=24).pack(side="left", padx=5)
 
         # 結果表示領域
         self.result_frame = ttk.LabelFrame(root, text="結果")
@@ -94,9 +117,14 @@ class MP3SplitterApp:
         # ファイル情報
         self.file_info = None
 
+        # ワーカースレッドとの通信
+        self.message_queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.worker = None
+
     def toggle_split_mode(self):
-        if self.split_mode.get() == "fixed":
-            # 固定時間モードを有効化、カスタム時間モードを無効化
+        if self.split_mode.get() in ("fixed", "auto"):
+            # 固定時間モード（自動分割も分割時間を使う）を有効化、カスタム時間モードを無効化
             for child in self.fixed_frame.winfo_children():
                 child.configure(state="normal")
             for child in self.custom_frame.winfo_children():
@@ -120,10 +148,10 @@ class MP3SplitterApp:
             output_dir = os.path.dirname(file_path)
             self.output_path.set(output_dir)
 
-            # MP3ファイル情報を取得
+            # MP3ファイル情報を取得（索引キャッシュまたはVBRヘッダーを使い、ファイル全体は走査しない）
             try:
-                mp3_file = MP3(file_path)
-                duration = mp3_file.info.length  # 秒単位の長さ
+                mp3_info = probe_mp3(file_path)
+                duration = mp3_info.duration  # 秒単位の長さ
 
                 hours = int(duration // 3600)
                 minutes = int((duration % 3600) // 60)
@@ -134,15 +162,15 @@ class MP3SplitterApp:
                     "hours": hours,
                     "minutes": minutes,
                     "seconds": seconds,
-                    "bitrate": mp3_file.info.bitrate,
-                    "sample_rate": mp3_file.info.sample_rate,
-                    "channels": 2 if mp3_file.info.mode != 3 else 1  # モード3ならモノラル
+                    "bitrate": mp3_info.bitrate,
+                    "sample_rate": mp3_info.sample_rate,
+                    "channels": mp3_info.channels
                 }
 
                 time_str = f"{hours}時間 " if hours > 0 else ""
                 time_str += f"{minutes}分 {seconds}秒"
 
-                info_text = f"ファイル情報:\n長さ: {time_str}\nビットレート: {mp3_file.info.bitrate // 1000} kbps\nサンプルレート: {mp3_file.info.sample_rate} Hz"
+                info_text = f"ファイル情報:\n長さ: {time_str}\nビットレート: {mp3_info.bitrate // 1000} kbps\nサンプルレート: {mp3_info.sample_rate} Hz"
                 self.result_text.delete(1.0, tk.END)
                 self.result_text.insert(tk.END, info_text)
 
@@ -158,48 +186,15 @@ class MP3SplitterApp:
 
     def parse_time_to_seconds(self, time_str):
         """時間文字列を秒数に変換（h:mm:ss または mm:ss 形式対応）"""
-        time_str = time_str.strip()
-
-        # h:mm:ss 形式の場合
-        if time_str.count(':') == 2:
-            h, m, s = map(int, time_str.split(':'))
-            return h * 3600 + m * 60 + s
-
-        # mm:ss 形式の場合
-        elif time_str.count(':') == 1:
-            m, s = map(int, time_str.split(':'))
-            return m * 60 + s
-
-        # 秒数のみの場合
-        else:
-            return int(time_str)
+        return parse_time_to_seconds(time_str)
 
     def format_time(self, seconds):
         """秒数を h:mm:ss 形式に変換"""
-        h = int(seconds // 3600)
-        m = int((seconds % 3600) // 60)
-        s = int(seconds % 60)
-
-        if h > 0:
-            return f"{h:02d}:{m:02d}:{s:02d}"
-        else:
-            return f"{m:02d}:{s:02d}"
+        return format_time(seconds)
 
     def sanitize_filename(self, filename):
         """ファイル名から不正な文字を削除して安全なファイル名にする"""
-        # Windowsで使用できない文字を除去
-        invalid_chars = '<>:"/\\|?*'
-
-        # ファイル名から無効な文字を削除
-        for char in invalid_chars:
-            filename = filename.replace(char, '_')
-
-        # 長すぎるファイル名を短くする（240文字以内）
-        if len(filename) > 240:
-            name, ext = os.path.splitext(filename)
-            filename = name[:240 - len(ext)] + ext
-
-        return filename
+        return sanitize_filename(filename)
 
     def split_mp3(self):
         """MP3分割を実行"""
@@ -224,9 +219,10 @@ class MP3SplitterApp:
 
         # 分割ポイントの計算
         split_points = []
+        interval_seconds = 0
 
-        if self.split_mode.get() == "fixed":
-            # 固定時間モードの場合
+        if self.split_mode.get() in ("fixed", "auto"):
+            # 固定時間モード・自動分割モードの場合
             hours = self.hours.get()
             minutes = self.minutes.get()
             seconds = self.seconds.get()
@@ -236,12 +232,6 @@ class MP3SplitterApp:
                 return
 
             interval_seconds = hours * 3600 + minutes * 60 + seconds
-            total_duration = self.file_info["duration"]
-
-            current_time = interval_seconds
-            while current_time < total_duration:
-                split_points.append(current_time)
-                current_time += interval_seconds
 
         else:
             # カスタム時間モードの場合
@@ -264,93 +254,117 @@ class MP3SplitterApp:
         # 結果テキストをクリア
         self.result_text.delete(1.0, tk.END)
         self.result_text.insert(tk.END, "分割処理を開始します...\n")
-        self.root.update()
+        self.progress_bar["value"] = 0
+        self.throughput.set("")
+
+        # 分割処理はワーカースレッドで実行し、進捗はキューで受け取る
+        self.cancel_event.clear()
+        self.start_button.configure(state="disabled")
+        self.cancel_button.configure(state="normal")
+        self.worker = threading.Thread(target=self.split_worker,
+                                       args=(input_file, output_folder, self.split_mode.get(), interval_seconds,
+                                             split_points),
+                                       daemon=True)
+        self.worker.start()
+        self.root.after(QUEUE_POLL_INTERVAL, self.process_queue)
+
+    def cancel_split(self):
+        """実行中の分割処理を中止する"""
+        self.cancel_event.set()
+        self.cancel_button.configure(state="disabled")
+        self.result_text.insert(tk.END, "中止しています...\n")
+
+    def split_worker(self, input_file, output_folder, mode, interval_seconds, split_points):
+        """
+        ワーカースレッドで分割処理を実行する
+
+        Tkのウィジェットには触れず、状態はすべて message_queue に送る。
+        """
+        post = self.message_queue.put
+
+        def on_status(message):
+            post(("status", message))
+
+        def progress_reporter(phase):
+            phase_start = time.perf_counter()
+
+            def on_progress(done, total):
+                post(("progress", phase, done, total, time.perf_counter() - phase_start))
+            return on_progress
 
         try:
-            # MP3ファイルを読み込む
-            self.result_text.insert(tk.END, "ファイルを読み込んでいます...\n")
-            self.root.update()
-
-            # ファイル名の取得
-            base_filename = os.path.basename(input_file)
-            filename_without_ext = os.path.splitext(base_filename)[0]
-
-            # MP3ファイルの読み込み
-            with open(input_file, 'rb') as mp3_file:
-                mp3_data = mp3_file.read()
-
-            # MP3ファイルの解析
-            mp3_info = MP3(input_file)
-            total_duration = mp3_info.info.length
-            file_size = len(mp3_data)
-
-            # 素朴な方法: ファイルサイズを時間で比例配分して分割
-            # これは厳密ではありませんが、外部ライブラリなしで近似的に機能します
-
-            # 分割ポイントを秒からバイト位置に変換
-            byte_positions = [int(split_point / total_duration * file_size) for split_point in split_points]
-
-            # ファイルの分割実行
-            segments = []
-            start_pos = 0
-
-            for i, pos in enumerate(byte_positions):
-                segments.append((start_pos, pos))
-                start_pos = pos
-
-            # 最後のセグメント
-            segments.append((start_pos, file_size))
-
-            # 分割ファイルの作成
-            for i, (start, end) in enumerate(segments):
-                segment_data = mp3_data[start:end]
-
-                # 出力ファイル名
-                if i == 0:
-                    # 最初のセグメント
-                    start_time = "00_00_00"
-                    end_time = self.format_time(split_points[i]).replace(":", "_")
-                    output_filename = f"{filename_without_ext}_{start_time}-{end_time}.mp3"
-                elif i == len(segments) - 1:
-                    # 最後のセグメント
-                    start_time = self.format_time(split_points[i - 1]).replace(":", "_")
-                    end_time = self.format_time(total_duration).replace(":", "_")
-                    output_filename = f"{filename_without_ext}_{start_time}-{end_time}.mp3"
-                else:
-                    # 中間セグメント
-                    start_time = self.format_time(split_points[i - 1]).replace(":", "_")
-                    end_time = self.format_time(split_points[i]).replace(":", "_")
-                    output_filename = f"{filename_without_ext}_{start_time}-{end_time}.mp3"
-
-                # ファイル名をサニタイズ
-                output_filename = self.sanitize_filename(output_filename)
-                output_path = os.path.join(output_folder, output_filename)
-
-                # ファイルに書き込み
-                try:
-                    with open(output_path, 'wb') as out_file:
-                        out_file.write(segment_data)
-
-                    self.result_text.insert(tk.END, f"分割ファイル作成: {output_filename}\n")
-                    self.root.update()
-                except Exception as e:
-                    self.result_text.insert(tk.END, f"ファイル保存エラー ({output_filename}): {e}\n")
-                    self.root.update()
-
-            result_msg = f"\n完了しました！\n合計 {len(segments)} 個のファイルを {output_folder} に保存しました。"
-            self.result_text.insert(tk.END, result_msg)
-            messagebox.showinfo("完了", f"MP3の分割が完了しました！\n{len(segments)} 個のファイルを作成しました。")
-
+            # フレーム索引を取得（キャッシュがなければ作成する。ファイル全体はメモリに読み込まない）
+            post(("status", "ファイルを解析しています..."))
+            index = get_frame_index(input_file, progress_callback=progress_reporter("解析"),
+                                    cancel_event=self.cancel_event)
+
+            if interval_seconds and mode == "auto":
+                # 分割時間の近くにある無音を探して分割ポイントにする
+                post(("status", "無音区間を検出しています..."))
+                split_points = find_silence_split_points(input_file, interval_seconds,
+                                                         cancel_event=self.cancel_event)
+            elif interval_seconds:
+                # 固定時間モードの分割ポイントは実際の長さから求める
+                split_points = fixed_split_points(interval_seconds, index.duration)
+
+            # フレーム境界で分割してファイルに書き込み
+            output_paths = split_mp3_file(input_file, output_folder, split_points, index=index,
+                                          progress_callback=progress_reporter("書き込み"), status_callback=on_status,
+                                          cancel_event=self.cancel_event)
+            post(("done", output_folder, len(output_paths)))
+
+        except SplitCancelled:
+            post(("cancelled",))
         except Exception as e:
-            error_msg = f"エラーが発生しました: {e}"
-            self.result_text.insert(tk.END, error_msg)
-            messagebox.showerror("エラー", error_msg)
-
-        finally:
-            self.result_text.insert(tk.END,
-                                    "\n\n注意: このアプリはFFmpegなしでMP3を分割しているため、正確な分割ではない可能性があります。")
-            self.result_text.insert(tk.END,
-                                    "\n分割ポイント付近で音声が途切れる場合があります。より正確な分割にはFFmpegの使用をお勧めします。")
+            post(("error", f"エラーが発生しました: {e}"))
+
+    def process_queue(self):
+        """ワーカースレッドからの通知をまとめて画面に反映する（メインスレッドで実行）"""
+        finished = False
+        progress = None
+
+        while True:
+            try:
+                message = self.message_queue.get_nowait()
+            except queue.Empty:
+                break
+
+            kind = message[0]
+            if kind == "status":
+                self.result_text.insert(tk.END, message[1] + "\n")
+                self.result_text.see(tk.END)
+            elif kind == "progress":
+                # 進捗は最新のものだけ反映すればよい
+                progress = message[1:]
+            elif kind == "done":
+                _, output_folder, count = message
+                result_msg = f"\n完了しました！\n合計 {count} 個のファイルを {output_folder} に保存しました。"
+                self.result_text.insert(tk.END, result_msg)
+                messagebox.showinfo("完了", f"MP3の分割が完了しました！\n{count} 個のファイルを作成しました。")
+                finished = True
+            elif kind == "cancelled":
+                self.result_text.insert(tk.END, "\n中止しました。")
+                finished = True
+            elif kind == "error":
+                self.result_text.insert(tk.END, message[1])
+                messagebox.showerror("エラー", message[1])
+                finished = True
+
+        if progress:
+            self.update_progress(*progress)
+
+        if finished:
+            self.start_button.configure(state="normal")
+            self.cancel_button.configure(state="disabled")
+            self.worker = None
+        else:
+            self.root.after(QUEUE_POLL_INTERVAL, self.process_queue)
+
+    def update_progress(self, phase, done, total, elapsed):
+        """プログレスバーと処理速度の表示を更新する"""
+        self.progress_bar["value"] = done / total * 100 if total else 0
+        if elapsed > 0:
+            self.throughput.set(f"{phase}: {done / elapsed / 1024 / 1024:.1f} MB/s")
 
 
 if __name__ == "__main__":
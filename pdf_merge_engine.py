@@ -0,0 +1,412 @@
+"""
+多数のPDFを少ないメモリで1つのファイルに結合するエンジン
+
+fitz（PyMuPDF）があれば fitz で結合する。入力を batch_size 件ずつ出力に追加しては
+一時ファイルに増分保存（saveIncr）して閉じるので、メモリに載るのは1回分の入力だけで済む。
+最後に、入力をまたいで同じ内容のフォントや画像を1つにまとめ、圧縮して保存し直す。
+fitz がない環境では PyPDF2 で結合する（入力ファイルは読み込んだらすぐに閉じるが、
+出力を書き出すまでページはメモリに残る）。
+
+非常に多くのファイルは merge_pdf_files_parallel で、いくつかずつワーカープロセスで中間ファイルに結合し、
+最後に中間ファイルを順に結合する。しおり（目次）には入力ファイルごとの項目を作る。
+入力ファイルのしおりは、結合した位置にずらして出力のしおりに写す（ファイルごとの項目を作る場合はその下に入れる）。
+
+pip install PyMuPDF  （または pip install PyPDF2）
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+BACKENDS = ('fitz', 'pypdf2')
+# 一時ファイルに増分保存するまでに追加する入力の数
+DEFAULT_BATCH_SIZE = 50
+# 並列に結合するときに1つの中間ファイルにまとめる入力の数
+DEFAULT_CHUNK_SIZE = 200
+# 結合したファイルの作成ツール（次に結合するときに、以前の出力を入力から除くために使う）
+MERGE_CREATOR = 'marge_pdf_file'
+# ストリーム以外で、内容が同じなら1つにまとめるオブジェクトの種類（ページなどはまとめてはいけない）
+DEDUPE_TYPES = {'/Font', '/FontDescriptor', '/Encoding', '/ExtGState', '/ColorSpace', '/XObject'}
+# オブジェクトの定義の中の間接参照（"12 0 R"）
+_REFERENCE = re.compile(r'\b(\d+) 0 R\b')
+
+
+def default_backend():
+    """使える結合方法を返す（fitz を優先する）"""
+    try:
+        import fitz  # noqa: F401
+        return 'fitz'
+    except ImportError:
+        return 'pypdf2'
+
+
+def outline_title(input_path):
+    """しおりの項目名（拡張子を除いたファイル名）を返す"""
+    return os.path.splitext(os.path.basename(input_path))[0]
+
+
+def _shifted_outline(outline, first_page, page_count, base_level):
+    """
+    入力ファイルのしおりを、結合した位置にずらす
+
+    階層が飛んでいる項目は fitz の set_toc が受け付けないので、直前の項目の1つ下までに詰める。
+    行き先のない項目・範囲外の項目はファイルの先頭を指すようにする。
+    """
+    entries = []
+    previous = base_level
+    for level, title, page in outline:
+        level = min(base_level + level, previous + 1)
+        page = page if 1 <= page <= page_count else 1
+        entries.append([level, title, first_page + page - 1])
+        previous = level
+    return entries
+
+
+def input_outline(sources, outlines):
+    """入力ファイルのしおりを結合した位置にずらして並べる（[階層, 項目名, 開始ページ] のリスト）"""
+    toc = []
+    for (_, first_page, page_count), outline in zip(sources, outlines):
+        toc += _shifted_outline(outline, first_page, page_count, 0)
+    return toc
+
+
+def file_outline(sources, outlines=None):
+    """
+    入力ファイルごとに1つのしおりの項目を作り、その下に入力ファイルのしおりを入れる
+
+    Returns:
+        list: [階層, 項目名, 開始ページ] のリスト
+    """
+    toc = []
+    for index, (path, first_page, page_count) in enumerate(sources):
+        toc.append([1, outline_title(path), first_page])
+        if outlines:
+            toc += _shifted_outline(outlines[index], first_page, page_count, 1)
+    return toc
+
+
+def _pypdf2_outline(reader):
+    """PyPDF2 の PdfReader のしおりを [階層, 項目名, ページ] のリストにする（ページは1から数える）"""
+    entries = []
+
+    def walk(items, level):
+        for item in items:
+            if isinstance(item, list):
+                walk(item, level + 1)
+                continue
+            try:
+                page = reader.get_destination_page_number(item)
+            except Exception:
+                page = None
+            entries.append([level, str(item.title), page + 1 if page is not None and page >= 0 else 0])
+
+    try:
+        walk(reader.outline, 1)
+    except Exception:
+        # 壊れたしおりは写さない
+        return []
+    return entries
+
+
+def _dedupe_objects(doc):
+    """
+    内容が同じストリーム（フォント・画像など）とフォント関連のオブジェクトを1つにまとめる
+
+    MuPDF の garbage=4 はオブジェクトの数が増えると非常に遅くなる（数千ファイルで数分）ので、
+    ストリームのハッシュと定義の文字列で重複を探し、参照を付け替える。
+    使われなくなったオブジェクトは保存時の garbage で削除される。
+
+    Returns:
+        int: まとめたオブジェクトの数
+    """
+    replaced = {}
+
+    def resolve(text):
+        return _REFERENCE.sub(lambda m: f'{replaced.get(int(m.group(1)), int(m.group(1)))} 0 R', text)
+
+    # 参照先がまとまると参照元も同じ定義になる（画像とそのマスクなど）ので、増えなくなるまで繰り返す
+    while True:
+        seen = {}
+        duplicates = {}
+        for xref in range(1, doc.xref_length()):
+            if xref in replaced:
+                continue
+            if doc.xref_is_stream(xref):
+                digest = hashlib.sha1(doc.xref_stream_raw(xref)).digest()
+            elif doc.xref_get_key(xref, 'Type')[1] in DEDUPE_TYPES:
+                digest = b''
+            else:
+                continue
+            key = (resolve(doc.xref_object(xref, compressed=True)), digest)
+            if key in seen:
+                duplicates[xref] = seen[key]
+            else:
+                seen[key] = xref
+        if not duplicates:
+            break
+        replaced.update(duplicates)
+        for xref, target in replaced.items():
+            while target in replaced:
+                target = replaced[target]
+            replaced[xref] = target
+
+    for xref in range(1, doc.xref_length()):
+        if xref in replaced:
+            continue
+        definition = doc.xref_object(xref, compressed=True)
+        resolved = resolve(definition)
+        if resolved == definition:
+            continue
+        if doc.xref_is_stream(xref):
+            # ストリームの定義を置き換えると中身が失われるので、キーごとに書き換える
+            for key in doc.xref_get_keys(xref):
+                value = doc.xref_get_key(xref, key)[1]
+                if resolve(value) != value:
+                    doc.xref_set_key(xref, key, resolve(value))
+        else:
+            doc.update_object(xref, resolved)
+    return len(replaced)
+
+
+def _merge_with_fitz(inputs, tmp_path, batch_size, dedupe, progress_callback, toc_builder):
+    """fitz で結合して tmp_path に保存する（結合した入力・入力のしおり・エラーのリストを返す）"""
+    import fitz
+
+    pages = 0
+    sources = []
+    outlines = []
+    errors = []
+    work_path = f'{tmp_path}.work'
+    created = False
+    try:
+        for start in range(0, len(inputs), batch_size):
+            # 2回目以降は一時ファイルを開き直して続きを追加し、増分保存で追記する
+            output = fitz.open(work_path) if created else fitz.open()
+            try:
+                for number, input_path in enumerate(inputs[start:start + batch_size], start + 1):
+                    try:
+                        with fitz.open(input_path) as src:
+                            if src.needs_pass:
+                                raise ValueError('パスワードで保護されています')
+                            output.insert_pdf(src)
+                            outlines.append(src.get_toc())
+                            sources.append((input_path, pages + 1, src.page_count))
+                            pages += src.page_count
+                    except Exception as e:
+                        errors.append((str(input_path), f'{type(e).__name__}: {e}'))
+                    if progress_callback:
+                        progress_callback(number, len(inputs))
+
+                if created:
+                    output.saveIncr()
+                elif output.page_count:
+                    output.save(work_path)
+                    created = True
+            finally:
+                output.close()
+
+        if not created:
+            raise ValueError('結合できるPDFがありません')
+
+        with fitz.open(work_path) as output:
+            output.set_metadata({'creator': MERGE_CREATOR})
+            # fitz の insert_pdf は入力のしおりを写さないので、結合した位置からしおりを作る
+            output.set_toc(toc_builder(sources, outlines))
+            if dedupe:
+                # 重複したオブジェクト（フォント・画像など）をまとめ、ストリームを圧縮して保存し直す
+                _dedupe_objects(output)
+                output.save(tmp_path, garbage=2, deflate=True)
+            else:
+                output.saveIncr()
+        if not dedupe:
+            os.replace(work_path, tmp_path)
+    finally:
+        if os.path.exists(work_path):
+            os.remove(work_path)
+    return sources, outlines, errors
+
+
+def _merge_with_pypdf2(inputs, tmp_path, progress_callback, toc_builder):
+    """PyPDF2 で結合して tmp_path に保存する（結合した入力・入力のしおり・エラーのリストを返す）"""
+    import PyPDF2
+
+    writer = PyPDF2.PdfWriter()
+    pages = 0
+    sources = []
+    outlines = []
+    errors = []
+    for number, input_path in enumerate(inputs, 1):
+        try:
+            # パスを渡すと PdfReader は内容を読み込んでファイルを閉じるので、開いたままのファイルが増えない
+            reader = PyPDF2.PdfReader(str(input_path))
+            if reader.is_encrypted:
+                raise ValueError('パスワードで保護されています')
+            # 入力のしおりは、ファイルごとの項目の下に入れられるように toc_builder で作り直す
+            writer.append(reader, import_outline=False)
+            outlines.append(_pypdf2_outline(reader))
+            sources.append((input_path, pages + 1, len(reader.pages)))
+            pages += len(reader.pages)
+        except Exception as e:
+            errors.append((str(input_path), f'{type(e).__name__}: {e}'))
+        if progress_callback:
+            progress_callback(number, len(inputs))
+
+    if not pages:
+        raise ValueError('結合できるPDFがありません')
+    writer.add_metadata({'/Creator': MERGE_CREATOR})
+    # 階層ごとに直前の親の項目を覚えておき、その下に項目を追加する
+    parents = {0: None}
+    for level, title, first_page in toc_builder(sources, outlines):
+        parents[level] = writer.add_outline_item(title, first_page - 1, parent=parents.get(level - 1))
+    with open(tmp_path, 'wb') as f:
+        writer.write(f)
+    writer.close()
+    return sources, outlines, errors
+
+
+def merge_pdf_files(inputs, output_path, backend=None, batch_size=DEFAULT_BATCH_SIZE, dedupe=True,
+                    progress_callback=None, outline=False, toc_builder=None):
+    """
+    PDFファイルを順に結合する
+
+    一時ファイルに書いてから置き換えるので、途中で失敗しても出力先が壊れたファイルにならない。
+    読めない入力はスキップしてエラーとして記録する。
+
+    Args:
+        inputs (list): 結合するPDFファイルのパスのリスト（この順に結合する）
+        output_path (str): 出力先のパス
+        backend (str): 'fitz' または 'pypdf2'。省略した場合は default_backend()
+        batch_size (int): fitz で一時ファイルに増分保存するまでに追加する入力の数
+        dedupe (bool): fitz で最後に重複したオブジェクトをまとめて圧縮するかどうか
+        progress_callback (function): (処理したファイル数, ファイル数) を受け取るコールバック関数
+        outline (bool): 入力ファイルごとのしおりを作るかどうか（入力のしおりはその下に入れる）。
+            False の場合も入力のしおりは写す
+        toc_builder (function): 結合した入力のリスト [(パス, 開始ページ, ページ数)] と入力のしおりのリストから
+            しおり [[階層, 項目名, 開始ページ]] を作る関数（outline より優先する）
+
+    Returns:
+        dict: ファイル数・ページ数・結合した入力のリスト・入力のしおりのリスト・エラーのリスト・結合方法・処理時間
+    """
+    backend = backend or default_backend()
+    if backend not in BACKENDS:
+        raise ValueError(f'不明な結合方法です: {backend}')
+
+    start = time.perf_counter()
+    inputs = [str(input_path) for input_path in inputs]
+    output_path = str(output_path)
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+
+    if toc_builder is None:
+        toc_builder = file_outline if outline else input_outline
+
+    tmp_path = f'{output_path}.{os.getpid()}.tmp'
+    try:
+        if backend == 'fitz':
+            sources, outlines, errors = _merge_with_fitz(inputs, tmp_path, max(batch_size, 1), dedupe, progress_callback,
+                                               toc_builder)
+        else:
+            sources, outlines, errors = _merge_with_pypdf2(inputs, tmp_path, progress_callback, toc_builder)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return {
+        'files': len(inputs),
+        'pages': sum(page_count for _, _, page_count in sources),
+        'sources': sources,
+        'outlines': outlines,
+        'errors': errors,
+        'backend': backend,
+        'elapsed': round(time.perf_counter() - start, 3),
+    }
+
+
+def _merge_chunk(args):
+    """入力の一部を中間ファイルに結合する（ワーカープロセスで実行される）"""
+    inputs, output_path, backend, batch_size = args
+    try:
+        # 重複の整理は最後の結合でまとめて行う
+        return merge_pdf_files(inputs, output_path, backend, batch_size, dedupe=False)
+    except ValueError:
+        # 中間ファイルの入力がすべて読めなかった
+        return None
+
+
+def merge_pdf_files_parallel(inputs, output_path, backend=None, chunk_size=DEFAULT_CHUNK_SIZE, workers=None,
+                             batch_size=DEFAULT_BATCH_SIZE, dedupe=True, outline=True, progress_callback=None):
+    """
+    PDFファイルを並列に結合する
+
+    入力を chunk_size 件ずつワーカープロセスで中間ファイルに結合し、最後に中間ファイルを順に結合する。
+    入力の順序は変わらず、しおりには入力ファイルごとの項目を作る。
+    中間ファイルは出力先と同じフォルダの一時フォルダに作り、終わったら削除する。
+
+    Args:
+        inputs (list): 結合するPDFファイルのパスのリスト（この順に結合する）
+        output_path (str): 出力先のパス
+        backend (str): 'fitz' または 'pypdf2'。省略した場合は default_backend()
+        chunk_size (int): 1つの中間ファイルにまとめる入力の数
+        workers (int): ワーカープロセス数。省略した場合はCPU数
+        batch_size (int): fitz で一時ファイルに増分保存するまでに追加する入力の数
+        dedupe (bool): 最後に重複したオブジェクトをまとめて圧縮するかどうか
+        outline (bool): 入力ファイルごとのしおりを作るかどうか（入力のしおりはその下に入れる）
+        progress_callback (function): (結合した中間ファイル数, 中間ファイル数) を受け取るコールバック関数
+
+    Returns:
+        dict: merge_pdf_files() と同じ形式のサマリー（sources は元の入力ファイルのリスト）
+    """
+    backend = backend or default_backend()
+    inputs = [str(input_path) for input_path in inputs]
+    chunk_size = max(chunk_size, 1)
+    if len(inputs) <= chunk_size:
+        return merge_pdf_files(inputs, output_path, backend, batch_size, dedupe, outline=outline)
+
+    start = time.perf_counter()
+    output_path = str(output_path)
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(output_dir, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix='.merge_', dir=output_dir)
+    try:
+        chunks = [(inputs[i:i + chunk_size], os.path.join(work_dir, f'{i // chunk_size:06d}.pdf'), backend, batch_size)
+                  for i in range(0, len(inputs), chunk_size)]
+        chunk_summaries = {}
+        errors = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for number, (chunk, summary) in enumerate(zip(chunks, executor.map(_merge_chunk, chunks)), 1):
+                if summary is None:
+                    errors += [(path, '読めるPDFがありません') for path in chunk[0]]
+                else:
+                    chunk_summaries[chunk[1]] = summary
+                    errors += summary['errors']
+                if progress_callback:
+                    progress_callback(number, len(chunks))
+
+        def merged_sources(intermediates):
+            """中間ファイルの位置から、元の入力ファイルの開始ページとしおりを求める"""
+            sources = []
+            outlines = []
+            for path, first_page, _ in intermediates:
+                for source_path, source_first, page_count in chunk_summaries[path]['sources']:
+                    sources.append((source_path, first_page + source_first - 1, page_count))
+                outlines += chunk_summaries[path]['outlines']
+            return sources, outlines
+
+        def toc_builder(intermediates, _):
+            # 中間ファイルのしおりは使わず、元の入力ファイルのしおりから作る
+            return (file_outline if outline else input_outline)(*merged_sources(intermediates))
+
+        summary = merge_pdf_files(list(chunk_summaries), output_path, backend, batch_size, dedupe,
+                                  toc_builder=toc_builder)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    summary['files'] = len(inputs)
+    summary['sources'], summary['outlines'] = merged_sources(summary['sources'])
+    summary['errors'] = errors + summary['errors']
+    summary['elapsed'] = round(time.perf_counter() - start, 3)
+    return summary
@@ -0,0 +1,289 @@
+"""
+PDFの結合計画（どのファイルをどの順に結合するか）を作るモジュール
+
+フォルダ・ファイル・マニフェストから入力を集め、含める・除くパターンで絞り込み、
+フォルダ内のファイルは自然順（2.pdf が 10.pdf より前）に並べる。
+出力先のフォルダにある、このツールで以前に結合したファイルは入力から除く。
+
+入力ごとのページ数とサイズは SQLite にキャッシュする（パス・サイズ・更新日時が同じなら開き直さない）ので、
+大きなフォルダでも2回目以降の計画はすぐに作れる。
+
+マニフェストは、1行に1つのパスを書いたテキストか、パスのリスト・計画（save_plan() の出力）のJSON。
+"""
+
+import fnmatch
+import json
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from pdf_merge_engine import MERGE_CREATOR
+
+# キャッシュの保存先（環境変数 PDF_MERGE_CACHE_DIR で変更できる）
+DEFAULT_CACHE_DIR = os.environ.get('PDF_MERGE_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.pdf_merge_cache'))
+# キャッシュの形式を変えたら番号を上げる（古いキャッシュは作り直される）
+_CACHE_VERSION = 1
+SORT_ORDERS = ('natural', 'name', 'mtime')
+# 以前に結合したファイルを除いたときの理由（読めなかったファイルと区別するために使う）
+PREVIOUS_OUTPUT_REASON = '以前に結合したファイル'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS pdf_info (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER,
+    page_count INTEGER,
+    creator TEXT,
+    error TEXT
+);
+'''
+
+
+def natural_sort_key(path):
+    """数字の部分を数として比べるソートキーを返す（2.pdf が 10.pdf より前になる）"""
+    # 数字で区切ると、文字列と数字が必ず交互に並ぶので、同じ位置どうしは同じ型で比べられる
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', str(path))]
+
+
+def probe_pdf(file_path):
+    """
+    PDFのページ数と作成ツールを調べる（ワーカープロセスで実行される）
+
+    Returns:
+        tuple: (パス, ページ数, 作成ツール, エラー内容。調べられた場合は None)
+    """
+    try:
+        try:
+            import fitz
+        except ImportError:
+            import PyPDF2
+
+            reader = PyPDF2.PdfReader(file_path)
+            if reader.is_encrypted:
+                raise ValueError('パスワードで保護されています')
+            creator = (reader.metadata or {}).get('/Creator') or ''
+            return file_path, len(reader.pages), str(creator), None
+
+        with fitz.open(file_path) as pdf_document:
+            if pdf_document.needs_pass:
+                raise ValueError('パスワードで保護されています')
+            return file_path, pdf_document.page_count, (pdf_document.metadata or {}).get('creator') or '', None
+    except Exception as e:
+        return file_path, None, '', f'{type(e).__name__}: {e}'
+
+
+class PageCountCache:
+    """
+    PDFのページ数のキャッシュ
+
+    Args:
+        db_path (str): キャッシュファイルのパス。省略した場合は DEFAULT_CACHE_DIR の page_counts.sqlite
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.path.join(DEFAULT_CACHE_DIR, 'page_counts.sqlite')
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if version != _CACHE_VERSION:
+            self.conn.execute('DROP TABLE IF EXISTS pdf_info')
+            self.conn.execute(f'PRAGMA user_version={_CACHE_VERSION}')
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        """キャッシュを閉じる"""
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def lookup(self, files, workers=None):
+        """
+        ファイルのページ数を返す（キャッシュにないか、変更されたファイルだけを並列に調べる）
+
+        Args:
+            files (dict): 絶対パス → stat
+            workers (int): 調べるのに使うプロセス数。省略した場合はCPU数
+
+        Returns:
+            dict: 絶対パス → (ページ数, 作成ツール, エラー内容)
+        """
+        results = {}
+        missing = []
+        for path, stat in files.items():
+            row = self.conn.execute('SELECT size, mtime_ns, page_count, creator, error FROM pdf_info WHERE path = ?',
+                                    (path,)).fetchone()
+            if row and row[:2] == (stat.st_size, stat.st_mtime_ns):
+                results[path] = row[2:]
+            else:
+                missing.append(path)
+
+        if missing:
+            with ProcessPoolExecutor(max_workers=workers) as executor, self.conn:
+                for path, page_count, creator, error in executor.map(probe_pdf, missing, chunksize=16):
+                    stat = files[path]
+                    self.conn.execute('INSERT OR REPLACE INTO pdf_info VALUES (?, ?, ?, ?, ?, ?)',
+                                      (path, stat.st_size, stat.st_mtime_ns, page_count, creator, error))
+                    results[path] = (page_count, creator, error)
+        return results
+
+
+def read_manifest(manifest_path):
+    """
+    マニフェストのパスのリストを返す（相対パスはマニフェストのフォルダからのパスにする）
+
+    テキストの場合は1行に1つのパス（# で始まる行と空行は無視する）。JSONの場合はパスのリストか、
+    {'inputs': [パスまたは {'path': パス}]} の形式（save_plan() の出力もそのまま使える）。
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, encoding='utf-8') as f:
+        if manifest_path.lower().endswith('.json'):
+            data = json.load(f)
+            items = data['inputs'] if isinstance(data, dict) else data
+            paths = [item['path'] if isinstance(item, dict) else item for item in items]
+        else:
+            paths = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    return [os.path.join(base_dir, path) for path in paths]
+
+
+def _matches(path, root, patterns):
+    """ファイル名かフォルダからの相対パスがいずれかのパターンに一致すればTrueを返す"""
+    rel_path = os.path.relpath(path, root).replace(os.sep, '/')
+    name = os.path.basename(path)
+    return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(rel_path, pattern) for pattern in patterns)
+
+
+def expand_sources(sources, recursive=False, include=(), exclude=(), sort='natural', exclude_dirs=()):
+    """
+    ファイルとフォルダのリストを、結合するPDFファイルのリストにする
+
+    フォルダ内のファイルは sort の順に並べる。直接指定したファイルは指定した順のまま使う。
+
+    Args:
+        sources (list): PDFファイルまたはフォルダのパスのリスト
+        recursive (bool): フォルダのサブフォルダもたどるかどうか
+        include (list): フォルダ内のファイルのうち、ファイル名か相対パスがこのパターンに一致するものだけを使う
+        exclude (list): ファイル名か相対パスがこのパターンに一致するファイルを除く
+        sort (str): 'natural'（自然順）, 'name'（文字コード順）, 'mtime'（更新日時順）
+        exclude_dirs (list): たどらないフォルダ（出力先など）
+
+    Returns:
+        dict: 絶対パス → stat（結合する順）
+    """
+    exclude_dirs = {os.path.abspath(directory) for directory in exclude_dirs}
+    files = {}
+    for source in sources:
+        source = os.path.abspath(source)
+        if not os.path.isdir(source):
+            if not _matches(source, os.path.dirname(source), exclude):
+                files.setdefault(source, os.stat(source))
+            continue
+
+        found = []
+        stack = [source]
+        while stack:
+            directory = stack.pop()
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive and entry.path not in exclude_dirs:
+                            stack.append(entry.path)
+                    elif entry.name.lower().endswith('.pdf') and entry.is_file():
+                        if include and not _matches(entry.path, source, include):
+                            continue
+                        if _matches(entry.path, source, exclude):
+                            continue
+                        found.append((entry.path, entry.stat()))
+
+        if sort == 'mtime':
+            found.sort(key=lambda item: (item[1].st_mtime_ns, natural_sort_key(item[0])))
+        elif sort == 'name':
+            found.sort(key=lambda item: item[0])
+        else:
+            found.sort(key=lambda item: natural_sort_key(item[0]))
+        for path, stat in found:
+            files.setdefault(path, stat)
+    return files
+
+
+def build_merge_plan(sources, output_path, recursive=False, manifest=None, include=(), exclude=(), sort='natural',
+                     use_cache=True, cache_path=None, workers=None):
+    """
+    結合計画を作る
+
+    出力先のファイルと、出力先のフォルダにある以前に結合したファイル（作成ツールが MERGE_CREATOR）は除く。
+    出力先のフォルダが入力のフォルダの下にある場合は、そのフォルダはたどらない。
+
+    Args:
+        sources (list): PDFファイルまたはフォルダのパスのリスト
+        output_path (str): 出力先のパス
+        recursive (bool): フォルダのサブフォルダもたどるかどうか
+        manifest (str): マニフェストのパス（書かれた順に sources より前に結合する）
+        include (list): ファイル名か相対パスが一致するものだけを使うパターン
+        exclude (list): ファイル名か相対パスが一致するものを除くパターン
+        sort (str): フォルダ内のファイルの順序（'natural', 'name', 'mtime'）
+        use_cache (bool): ページ数のキャッシュを使うかどうか
+        cache_path (str): キャッシュファイルのパス
+        workers (int): ページ数を調べるのに使うプロセス数。省略した場合はCPU数
+
+    Returns:
+        dict: {'output', 'inputs': [{'path', 'size', 'pages'}], 'skipped': [{'path', 'reason'}], 'pages', 'bytes', 'elapsed'}
+    """
+    start = time.perf_counter()
+    output_path = os.path.abspath(output_path)
+    output_dir = os.path.dirname(output_path)
+    input_dirs = {os.path.abspath(source) for source in sources if os.path.isdir(source)}
+    # 出力先が入力のフォルダとは別のフォルダなら、そのフォルダごと除く
+    exclude_dirs = [] if output_dir in input_dirs else [output_dir]
+
+    ordered = read_manifest(manifest) if manifest else []
+    skipped = [{'path': os.path.abspath(path), 'reason': 'ファイルがありません'}
+               for path in ordered + list(sources) if not os.path.exists(path)]
+    ordered = [path for path in ordered if os.path.exists(path)]
+    sources = [path for path in sources if os.path.exists(path)]
+
+    files = expand_sources(ordered, False, (), exclude, sort)
+    files.update((path, stat) for path, stat in expand_sources(sources, recursive, include, exclude, sort,
+                                                                exclude_dirs).items() if path not in files)
+    files.pop(output_path, None)
+
+    if use_cache:
+        with PageCountCache(cache_path) as cache:
+            info = cache.lookup(files, workers)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            info = {path: (page_count, creator, error)
+                    for path, page_count, creator, error in executor.map(probe_pdf, list(files), chunksize=16)}
+
+    inputs = []
+    for path, stat in files.items():
+        page_count, creator, error = info[path]
+        if error:
+            skipped.append({'path': path, 'reason': error})
+        elif creator == MERGE_CREATOR and os.path.dirname(path) == output_dir:
+            skipped.append({'path': path, 'reason': PREVIOUS_OUTPUT_REASON})
+        else:
+            inputs.append({'path': path, 'size': stat.st_size, 'pages': page_count})
+
+    return {
+        'output': output_path,
+        'inputs': inputs,
+        'skipped': skipped,
+        'pages': sum(item['pages'] for item in inputs),
+        'bytes': sum(item['size'] for item in inputs),
+        'elapsed': round(time.perf_counter() - start, 3),
+    }
+
+
+def save_plan(plan, plan_path):
+    """結合計画をJSONで保存する（マニフェストとして読み込める）"""
+    with open(plan_path, 'w', encoding='utf-8') as f:
+        json.dump(plan, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,351 @@
+"""
+請求書PDFのファイル名の検証・組み立て・移動を行うモジュールと、マニフェストから一括でリネームするツール
+
+GUIに依存しないので、リネームツール（rename_pdf_file_send_mail.py）からもバッチ処理からも使える。
+ファイル名は「日付_取引先_金額_区分[_不].pdf」の形式にする。
+
+マニフェストは CSV（ヘッダー行あり）または JSON（オブジェクトのリスト）で、列は次のとおり。
+    src, date, partner, amount, section, not_adopted, dest_dir（not_adopted と dest_dir は省略可）
+すべての行を先に検証し、1行でもエラーがあれば何も移動しない。
+移動はスレッドで並列に行い、別のドライブへの移動もコピー・fsync・置き換えで途中の状態を残さない。
+
+例:
+    python pdf_rename_core.py renames.csv --report result.json -j 8
+    python pdf_rename_core.py renames.json --dry-run
+"""
+
+import argparse
+import csv
+import errno
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bulk_copier import copy_file_fast
+
+# ファイル名に使えない文字（Windowsの禁止文字と、項目の区切りに使う _）
+INVALID_NAME_CHARS = set('\\/:*?"<>|_')
+# 真とみなす not_adopted の値
+TRUE_VALUES = {'1', 'true', 'yes', 'y', '不', '○'}
+
+
+def validate_fields(date, partner, amount, section, require_section=True):
+    """
+    入力された項目を検証する
+
+    Args:
+        date (str): 日付（YYYYMMDD）
+        partner (str): 取引先
+        amount (str): 金額（数字）
+        section (str): 区分
+        require_section (bool): 区分を必須にするかどうか
+
+    Returns:
+        list: エラーメッセージのリスト（問題がなければ空）
+    """
+    errors = []
+    if not date.isdigit() or len(date) != 8:
+        errors.append('日付を8桁の数字で入力してください')
+    if not amount.isdigit():
+        errors.append('金額を数字で入力してください')
+    if not partner:
+        errors.append('取引先を入力してください')
+    if require_section and not section:
+        errors.append('区分を入力してください')
+    for label, value in (('取引先', partner), ('区分', section)):
+        invalid = sorted(INVALID_NAME_CHARS & set(value))
+        if invalid:
+            errors.append(f'{label}に使えない文字が含まれています: {" ".join(invalid)}')
+    return errors
+
+
+def build_filename(date, partner, amount, section, not_adopted=False, current_name=''):
+    """
+    新しいファイル名を組み立てる
+
+    Args:
+        current_name (str): 今のファイル名。'不' で始まる場合は _不 を付けない
+
+    Returns:
+        str: 「日付_取引先_金額_区分[_不].pdf」の形式のファイル名（区分が空なら省く）
+    """
+    # ファイル名の前の文字が '不' だった場合は何もしない
+    if not_adopted and os.path.basename(current_name).startswith('不'):
+        adopted_text = ''
+    else:
+        adopted_text = '_不' if not_adopted else ''
+    parts = [date, partner, amount] + ([section] if section else [])
+    return '_'.join(parts) + f'{adopted_text}.pdf'
+
+
+def plan_rename(src, date, partner, amount, section, not_adopted=False, dest_dir=None):
+    """
+    移動先のパスを返す
+
+    Args:
+        src (str): 元のファイルのパス
+        dest_dir (str): 保存先のフォルダ。省略した場合は元のファイルと同じフォルダ
+
+    Returns:
+        str: 移動先のパス
+    """
+    new_filename = build_filename(date, partner, amount, section, not_adopted, src)
+    return os.path.join(dest_dir or os.path.dirname(src), new_filename)
+
+
+def _fsync_path(path):
+    """ファイルまたはフォルダの内容をディスクに書き込む（フォルダを開けないOSでは何もしない）"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def move_file(src, dst):
+    """
+    ファイルを移動する（同じ名前のファイルがある場合は上書きせずに FileExistsError）
+
+    同じドライブ内なら名前の変更だけで済ませる。別のドライブの場合は移動先のフォルダ内の一時ファイルに
+    コピーして fsync し、置き換えてから元のファイルを削除するので、移動先に書きかけのファイルは残らない。
+
+    Returns:
+        str: 使った方法（'rename' または 'copy'）
+    """
+    if os.path.exists(dst):
+        raise FileExistsError(errno.EEXIST, '同じ名前のファイルがあります', dst)
+    os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+    try:
+        os.rename(src, dst)
+        return 'rename'
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+    tmp = f'{dst}.{os.getpid()}.part'
+    try:
+        copy_file_fast(src, tmp)
+        _fsync_path(tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    _fsync_path(os.path.dirname(dst) or '.')
+    os.remove(src)
+    return 'copy'
+
+
+def load_manifest(manifest_path):
+    """
+    マニフェストを読み込む
+
+    Returns:
+        list: 行ごとの辞書のリスト
+
+    Raises:
+        OSError: マニフェストを読めないとき
+        ValueError: マニフェストの形式が正しくないとき
+    """
+    if manifest_path.lower().endswith('.json'):
+        with open(manifest_path, encoding='utf-8') as f:
+            rows = json.load(f)
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValueError('JSONのマニフェストはオブジェクトのリストにしてください')
+        return rows
+    # Excel で保存したCSVの BOM も読めるようにする
+    with open(manifest_path, encoding='utf-8-sig', newline='') as f:
+        try:
+            return list(csv.DictReader(f))
+        except csv.Error as e:
+            raise ValueError(f'CSVのマニフェストを読めません: {e}') from e
+
+
+def _row_value(row, key):
+    """行の値を前後の空白を除いた文字列で返す"""
+    value = row.get(key)
+    return '' if value is None else str(value).strip()
+
+
+def validate_manifest(rows, base_dir='.', require_section=True):
+    """
+    マニフェストのすべての行を検証して移動の計画を作る
+
+    ファイルの有無・項目・移動先の重複（マニフェスト内と既存のファイル）を調べる。
+
+    Args:
+        rows (list): load_manifest() の結果
+        base_dir (str): 相対パスの基準のフォルダ
+        require_section (bool): 区分を必須にするかどうか
+
+    Returns:
+        tuple: (計画のリスト, エラーのリスト)。計画とエラーは {'row', 'src', 'dst', ...} の辞書
+    """
+    plans = []
+    errors = []
+    seen_src = {}
+    seen_dst = {}
+    # マニフェストで移動されるファイル（その名前は移動のあとに空く）
+    manifest_sources = {os.path.normpath(os.path.join(base_dir, _row_value(row, 'src'))) for row in rows
+                        if _row_value(row, 'src')}
+    for number, row in enumerate(rows, 1):
+        src = _row_value(row, 'src')
+        row_errors = []
+        if not src:
+            row_errors.append('src がありません')
+        else:
+            src = os.path.normpath(os.path.join(base_dir, src))
+            if not os.path.isfile(src):
+                row_errors.append('ファイルがありません')
+            elif src in seen_src:
+                row_errors.append(f'{seen_src[src]} 行目と同じファイルです')
+
+        fields = {key: _row_value(row, key) for key in ('date', 'partner', 'amount', 'section')}
+        not_adopted = row.get('not_adopted') is True or _row_value(row, 'not_adopted').lower() in TRUE_VALUES
+        row_errors += validate_fields(**fields, require_section=require_section)
+
+        dst = None
+        if not row_errors:
+            dest_dir = _row_value(row, 'dest_dir')
+            dest_dir = os.path.join(base_dir, dest_dir) if dest_dir else None
+            dst = os.path.normpath(plan_rename(src, not_adopted=not_adopted, dest_dir=dest_dir, **fields))
+            if dst in seen_dst:
+                row_errors.append(f'{seen_dst[dst]} 行目と移動先が同じです')
+            elif dst != src and os.path.exists(dst) and dst not in manifest_sources:
+                row_errors.append(f'同じ名前のファイルがあります: {dst}')
+
+        if row_errors:
+            errors.append({'row': number, 'src': src, 'dst': dst, 'errors': row_errors})
+        else:
+            seen_src[src] = number
+            seen_dst[dst] = number
+            plans.append({'row': number, 'src': src, 'dst': dst})
+    return plans, errors
+
+
+def _apply_one(plan):
+    """1行の移動を行う（ワーカースレッドで実行される）"""
+    if plan['src'] == plan['dst']:
+        return {**plan, 'status': 'unchanged', 'method': None, 'error': None}
+    try:
+        method = move_file(plan['src'], plan['dst'])
+        return {**plan, 'status': 'moved', 'method': method, 'error': None}
+    except OSError as e:
+        return {**plan, 'status': 'error', 'method': None, 'error': str(e)}
+
+
+def apply_renames(plans, workers=8, status_callback=None):
+    """
+    計画どおりにファイルを並列に移動する
+
+    移動先が別の行の移動元になっている行は、その行の移動が終わってから次の回にまとめて移動する。
+    （移動先が互いに入れ替わっている行は移動できないのでエラーにする）
+
+    Args:
+        plans (list): validate_manifest() の計画のリスト
+        workers (int): 移動に使うスレッド数
+        status_callback (function): 行ごとの結果の辞書を受け取るコールバック関数
+
+    Returns:
+        list: 行ごとの結果の辞書のリスト（行番号順）
+    """
+    results = []
+    pending = list(plans)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending:
+            sources = {plan['src'] for plan in pending if plan['src'] != plan['dst']}
+            ready = [plan for plan in pending if plan['dst'] not in sources]
+            blocked = [plan for plan in pending if plan['dst'] in sources]
+            if not ready:
+                ready = [{**plan, 'status': 'error', 'method': None, 'error': '移動先が互いに入れ替わっています'}
+                         for plan in blocked]
+                blocked = []
+                batch = ready
+            else:
+                batch = executor.map(_apply_one, ready)
+            for result in batch:
+                results.append(result)
+                if status_callback:
+                    status_callback(result)
+            pending = blocked
+    return sorted(results, key=lambda result: result['row'])
+
+
+def write_report(report_path, results, errors, summary):
+    """結果をJSON（.csv の場合はCSV）で書き出す"""
+    if report_path.lower().endswith('.csv'):
+        with open(report_path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['row', 'src', 'dst', 'status', 'error'])
+            for result in results:
+                writer.writerow([result['row'], result['src'], result['dst'], result['status'], result['error'] or ''])
+            for error in errors:
+                writer.writerow([error['row'], error['src'], error['dst'] or '', 'invalid', '; '.join(error['errors'])])
+        return
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump({'summary': summary, 'results': results, 'invalid': errors}, f, ensure_ascii=False, indent=2)
+
+
+def parse_args(argv=None):
+    """コマンドライン引数を解析する"""
+    parser = argparse.ArgumentParser(description='マニフェスト (CSV/JSON) に従って請求書PDFを一括でリネームします。')
+    parser.add_argument('manifest', help='マニフェストのパス (.csv または .json)')
+    parser.add_argument('--base-dir', help='相対パスの基準のフォルダ (省略時はマニフェストのフォルダ)')
+    parser.add_argument('--report', help='結果の出力先 (.json または .csv)')
+    parser.add_argument('-j', '--workers', type=int, default=8, help='移動に使うスレッド数')
+    parser.add_argument('--no-section', action='store_true', help='区分を省略できるようにする')
+    parser.add_argument('--dry-run', action='store_true', help='検証だけ行い、移動しない')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """コマンドラインからマニフェストに従ってリネームする"""
+    args = parse_args(argv)
+    start = time.perf_counter()
+
+    try:
+        rows = load_manifest(args.manifest)
+    except (OSError, ValueError) as e:
+        print(f'エラー: {args.manifest}: {e}', file=sys.stderr)
+        return 1
+    base_dir = args.base_dir or os.path.dirname(os.path.abspath(args.manifest))
+    plans, errors = validate_manifest(rows, base_dir, require_section=not args.no_section)
+
+    results = []
+    if errors:
+        for error in errors:
+            print(f"エラー: {error['row']} 行目 {error['src']}: {'; '.join(error['errors'])}", file=sys.stderr)
+        print(f'{len(errors)} 行にエラーがあるので、移動しませんでした', file=sys.stderr)
+    elif not args.dry_run:
+        def on_result(result):
+            if result['error']:
+                print(f"エラー: {result['row']} 行目 {result['src']}: {result['error']}", file=sys.stderr)
+
+        results = apply_renames(plans, workers=args.workers, status_callback=on_result)
+
+    summary = {
+        'rows': len(rows),
+        'invalid': len(errors),
+        'moved': sum(result['status'] == 'moved' for result in results),
+        'unchanged': sum(result['status'] == 'unchanged' for result in results),
+        'failed': sum(result['status'] == 'error' for result in results),
+        'elapsed': round(time.perf_counter() - start, 3),
+    }
+    if args.report:
+        write_report(args.report, results, errors, summary)
+    print(f"移動: {summary['moved']} 件, 変更なし: {summary['unchanged']} 件, 失敗: {summary['failed']} 件, "
+          f"検証エラー: {summary['invalid']} 件 ({summary['elapsed']} 秒)")
+    return 1 if errors or summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,448 @@
+"""
+PDFを分割するエンジン
+
+分割の方法:
+    'page'     1ページずつ（従来の split_pdf と同じファイル名）
+    'every'    N ページずつ
+    'ranges'   指定したページ範囲（"1-3,4-10,11-"）
+    'bookmark' しおりの項目ごと
+    'blank'    白紙のページを区切りにする（白紙のページは出力しない）
+
+ファイルはワーカープロセスで並列に分割し、各ワーカーはファイルを1回だけ開いてすべての部分を書き出す。
+ページ数が多いファイルは、部分をページ範囲ごとの作業に分けて複数のワーカーで書き出す。
+fitz（PyMuPDF）があれば fitz で、なければ PyPDF2 で分割する。白紙の判定は fitz ではテキストのないページを低解像度で
+描画したグレースケール画像のインクの割合で、PyPDF2 ではテキストと画像がないことで行う。
+
+pip install PyMuPDF  （または pip install PyPDF2）
+"""
+
+import os
+import re
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+BACKENDS = ('fitz', 'pypdf2')
+SPLIT_MODES = ('page', 'every', 'ranges', 'bookmark', 'blank')
+# このページ数より多いファイルは、ページ範囲ごとの作業に分けて並列に処理する
+LARGE_FILE_PAGES = 200
+# 白紙の判定で描画する倍率（72dpi の 0.25 倍 = 18dpi）
+BLANK_RENDER_ZOOM = 0.25
+# この明るさ（0〜255）より暗い画素をインクとみなす
+BLANK_DARK_LEVEL = 200
+# インクの画素の割合がこれ未満なら白紙とみなす（スキャンのごみを許す）
+BLANK_INK_RATIO = 0.002
+# インクでない画素の値（bytes.translate で削除し、残りの長さをインクの画素数にする）
+_LIGHT_BYTES = bytes(range(BLANK_DARK_LEVEL, 256))
+
+# 出力する部分（開始ページ・終了ページは0から数え、終了ページは含まない）
+Segment = namedtuple('Segment', ['start', 'end', 'name'])
+
+
+def default_backend():
+    """使える分割方法を返す（fitz を優先する）"""
+    try:
+        import fitz  # noqa: F401
+        return 'fitz'
+    except ImportError:
+        return 'pypdf2'
+
+
+def parse_page_ranges(text, page_count):
+    """
+    ページ範囲の文字列を (開始, 終了) のリストにする
+
+    Args:
+        text (str): "1-3,5,7-" の形式（ページは1から数える。終わりを省略すると最後のページまで）
+        page_count (int): ページ数
+
+    Returns:
+        list: (開始, 終了) のリスト（0から数え、終了は含まない）
+    """
+    ranges = []
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        match = re.fullmatch(r'(\d*)\s*-\s*(\d*)|(\d+)', part)
+        if not match:
+            raise ValueError(f'ページ範囲の形式が正しくありません: {part}')
+        if match.group(3):
+            first = last = int(match.group(3))
+        else:
+            first = int(match.group(1) or 1)
+            last = int(match.group(2) or page_count)
+        last = min(last, page_count)
+        if first < 1 or first > last:
+            raise ValueError(f'ページ範囲が正しくありません: {part}（{page_count} ページ）')
+        ranges.append((first - 1, last))
+    return ranges
+
+
+def _safe_name(text):
+    """ファイル名に使えない文字を _ にする"""
+    return re.sub(r'[\\/:*?"<>|\r\n\t]', '_', text).strip() or 'untitled'
+
+
+def ink_ratio(page):
+    """fitz のページを低解像度のグレースケールで描画し、インクの画素の割合を返す"""
+    import fitz
+
+    pix = page.get_pixmap(matrix=fitz.Matrix(BLANK_RENDER_ZOOM, BLANK_RENDER_ZOOM), colorspace=fitz.csGRAY,
+                          alpha=False)
+    samples = pix.samples
+    return len(samples.translate(None, _LIGHT_BYTES)) / max(len(samples), 1)
+
+
+class _FitzSource:
+    """fitz で開いたPDF"""
+
+    def __init__(self, path):
+        import fitz
+
+        self.doc = fitz.open(path)
+        if self.doc.needs_pass:
+            self.doc.close()
+            raise ValueError('パスワードで保護されています')
+
+    @property
+    def page_count(self):
+        return self.doc.page_count
+
+    def outline(self, level):
+        """しおりのうち level 以下の階層の (項目名, 開始ページ) のリスト"""
+        return [(title, page - 1) for entry_level, title, page, *_ in self.doc.get_toc()
+                if entry_level <= level and page >= 1]
+
+    def is_blank(self, number, ink_threshold):
+        page = self.doc[number]
+        # テキストのあるページは白紙ではない
+        if page.get_text().strip():
+            return False
+        # テキストも画像も描画もないページは描画せずに白紙とする
+        if not page.get_images() and not page.get_drawings():
+            return True
+        # スキャンした画像のページは、描画してインクの割合で判定する
+        return ink_ratio(page) < ink_threshold
+
+    def write(self, start, end, output_path):
+        import fitz
+
+        with fitz.open() as output:
+            output.insert_pdf(self.doc, from_page=start, to_page=end - 1)
+            output.save(output_path, garbage=1)
+
+    def close(self):
+        self.doc.close()
+
+
+class _PyPdf2Source:
+    """PyPDF2 で開いたPDF"""
+
+    def __init__(self, path):
+        import PyPDF2
+
+        self.reader = PyPDF2.PdfReader(path)
+        if self.reader.is_encrypted:
+            raise ValueError('パスワードで保護されています')
+
+    @property
+    def page_count(self):
+        return len(self.reader.pages)
+
+    def outline(self, level):
+        """しおりのうち level 以下の階層の (項目名, 開始ページ) のリスト"""
+        entries = []
+
+        def walk(items, depth):
+            for item in items:
+                if isinstance(item, list):
+                    if depth < level:
+                        walk(item, depth + 1)
+                    continue
+                page = self.reader.get_destination_page_number(item)
+                if page is not None and page >= 0:
+                    entries.append((str(item.title), page))
+
+        walk(self.reader.outline, 1)
+        return entries
+
+    def is_blank(self, number, ink_threshold):
+        page = self.reader.pages[number]
+        resources = page.get('/Resources') or {}
+        if hasattr(resources, 'get_object'):
+            resources = resources.get_object()
+        return '/XObject' not in resources and not (page.extract_text() or '').strip()
+
+    def write(self, start, end, output_path):
+        import PyPDF2
+
+        writer = PyPDF2.PdfWriter()
+        for number in range(start, end):
+            writer.add_page(self.reader.pages[number])
+        with open(output_path, 'wb') as f:
+            writer.write(f)
+
+    def close(self):
+        pass
+
+
+def open_source(path, backend=None):
+    """分割するPDFを開く"""
+    return _FitzSource(path) if (backend or default_backend()) == 'fitz' else _PyPdf2Source(path)
+
+
+def find_blank_pages(source, start=0, end=None, ink_threshold=BLANK_INK_RATIO):
+    """白紙のページ番号（0から数える）のリストを返す"""
+    end = source.page_count if end is None else end
+    return [number for number in range(start, end) if source.is_blank(number, ink_threshold)]
+
+
+def plan_segments(source, stem, mode='page', every=1, ranges=None, bookmark_level=1, blank_pages=None,
+                  ink_threshold=BLANK_INK_RATIO):
+    """
+    出力する部分のリストを作る
+
+    Args:
+        source: open_source() で開いたPDF
+        stem (str): 元のファイル名（拡張子なし）。出力ファイル名に使う
+        mode (str): 分割の方法（SPLIT_MODES）
+        every (int): 'every' の場合のページ数
+        ranges (str): 'ranges' の場合のページ範囲（"1-3,4-10,11-"）
+        bookmark_level (int): 'bookmark' の場合に区切りにするしおりの階層（1 は最上位だけ）
+        blank_pages (list): 'blank' の場合の白紙のページ番号（省略した場合は調べる）
+        ink_threshold (float): 白紙とみなすインクの割合
+
+    Returns:
+        list: Segment のリスト
+    """
+    page_count = source.page_count
+    if mode == 'page':
+        return [Segment(number, number + 1, f'{number + 1}_{stem}.pdf') for number in range(page_count)]
+
+    if mode == 'every':
+        every = max(every, 1)
+        return [Segment(start, min(start + every, page_count), f'{start + 1}-{min(start + every, page_count)}_{stem}.pdf')
+                for start in range(0, page_count, every)]
+
+    if mode == 'ranges':
+        return [Segment(start, end, f'{start + 1}-{end}_{stem}.pdf' if end - start > 1 else f'{end}_{stem}.pdf')
+                for start, end in parse_page_ranges(ranges or '', page_count)]
+
+    if mode == 'bookmark':
+        starts = []
+        for title, page in source.outline(bookmark_level):
+            # 同じページから始まる項目は最初の項目だけを使う
+            if page < page_count and (not starts or page > starts[-1][1]):
+                starts.append((title, page))
+        if not starts or starts[0][1] > 0:
+            # 最初のしおりより前のページは1つの部分にする
+            starts.insert(0, (stem, 0))
+        width = len(str(len(starts)))
+        return [Segment(page, starts[i + 1][1] if i + 1 < len(starts) else page_count,
+                        f'{i + 1:0{width}d}_{_safe_name(title)}.pdf')
+                for i, (title, page) in enumerate(starts)]
+
+    if mode == 'blank':
+        if blank_pages is None:
+            blank_pages = find_blank_pages(source, ink_threshold=ink_threshold)
+        return blank_segments(page_count, blank_pages, stem)
+
+    raise ValueError(f'不明な分割の方法です: {mode}')
+
+
+def blank_segments(page_count, blank_pages, stem):
+    """白紙のページを区切りにした部分のリストを作る（白紙のページはどの部分にも入れない）"""
+    blank = set(blank_pages)
+    runs = []
+    start = None
+    for number in range(page_count + 1):
+        if number < page_count and number not in blank:
+            if start is None:
+                start = number
+        elif start is not None:
+            runs.append((start, number))
+            start = None
+    width = len(str(len(runs)))
+    return [Segment(start, end, f'{i:0{width}d}_{stem}.pdf') for i, (start, end) in enumerate(runs, 1)]
+
+
+def write_segments(input_path, segments, output_dir, backend=None):
+    """
+    PDFを1回だけ開いて部分を書き出す（ワーカープロセスで実行される）
+
+    Returns:
+        dict: {'input', 'segments', 'pages', 'error'}
+    """
+    result = {'input': str(input_path), 'segments': 0, 'pages': 0, 'error': None}
+    try:
+        source = open_source(str(input_path), backend)
+        try:
+            _write_all(source, segments, output_dir, result)
+        finally:
+            source.close()
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+    return result
+
+
+def _write_all(source, segments, output_dir, result):
+    """部分を一時ファイルに書いてから置き換える"""
+    os.makedirs(output_dir, exist_ok=True)
+    for segment in segments:
+        output_path = os.path.join(output_dir, segment.name)
+        tmp_path = f'{output_path}.{os.getpid()}.tmp'
+        try:
+            source.write(segment.start, segment.end, tmp_path)
+            os.replace(tmp_path, output_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        result['segments'] += 1
+        result['pages'] += segment.end - segment.start
+
+
+def split_file(input_path, output_dir, options, backend=None, large_file_pages=None):
+    """
+    1つのPDFを1回だけ開いて、計画と書き出しを行う（ワーカープロセスで実行される）
+
+    large_file_pages より多いページのファイルは、最初のグループの部分だけを書き出し、
+    残りのグループを 'pending' で返す（呼び出し元がほかのワーカーに振り分ける）。
+    'blank' の場合は白紙の判定もページ範囲ごとに振り分けるため、何も書き出さずに 'blank_scan' でページ数を返す。
+
+    Args:
+        options (dict): plan_segments() のキーワード引数（mode, every, ranges, bookmark_level, ink_threshold）
+        large_file_pages (int): これより多いページのファイルを分けて処理する。省略した場合は分けない
+
+    Returns:
+        dict: {'input', 'segments', 'pages', 'error'}（分ける場合は 'pending' または 'blank_scan' も）
+    """
+    result = {'input': str(input_path), 'segments': 0, 'pages': 0, 'error': None}
+    try:
+        source = open_source(str(input_path), backend)
+        try:
+            if large_file_pages and source.page_count > large_file_pages:
+                if options['mode'] == 'blank':
+                    result['blank_scan'] = source.page_count
+                    return result
+                stem = os.path.splitext(os.path.basename(input_path))[0]
+                groups = _group_segments(plan_segments(source, stem, **options), large_file_pages)
+                result['pending'] = groups[1:]
+                _write_all(source, groups[0] if groups else [], output_dir, result)
+            else:
+                stem = os.path.splitext(os.path.basename(input_path))[0]
+                _write_all(source, plan_segments(source, stem, **options), output_dir, result)
+        finally:
+            source.close()
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+    return result
+
+
+def _find_blank_range(input_path, start, end, ink_threshold, backend):
+    """ページ範囲の白紙のページを調べる（ワーカープロセスで実行される）"""
+    source = open_source(str(input_path), backend)
+    try:
+        return find_blank_pages(source, start, end, ink_threshold)
+    finally:
+        source.close()
+
+
+def _group_segments(segments, max_pages):
+    """部分を、合計のページ数が max_pages 程度になるグループに分ける"""
+    groups = [[]]
+    pages = 0
+    for segment in segments:
+        if groups[-1] and pages + segment.end - segment.start > max_pages:
+            groups.append([])
+            pages = 0
+        groups[-1].append(segment)
+        pages += segment.end - segment.start
+    return [group for group in groups if group]
+
+
+def default_output_dir(input_path, output_root=None):
+    """出力フォルダ（元のファイル名と同じ名前のフォルダ）を返す"""
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.join(output_root, stem) if output_root else os.path.join(os.path.dirname(input_path), stem)
+
+
+def split_pdf_files(inputs, mode='page', output_root=None, workers=None, backend=None, every=1, ranges=None,
+                    bookmark_level=1, ink_threshold=BLANK_INK_RATIO, large_file_pages=LARGE_FILE_PAGES,
+                    status_callback=None):
+    """
+    複数のPDFをプロセスプールで並列に分割する
+
+    各ファイルはワーカーが開いてページ数を調べ、large_file_pages 以下のファイルはそのまま分割する。
+    より大きなファイルは、そのワーカーが最初のグループを書き出し、残りの書き出し（'blank' の場合は
+    白紙の判定も）をページ範囲ごとの作業に分けてほかのワーカーで並列に行う。
+
+    Args:
+        inputs (list): PDFファイルのパスのリスト
+        mode (str): 分割の方法（SPLIT_MODES）
+        output_root (str): 出力先フォルダ。省略した場合は入力ファイルと同じフォルダ（ファイル名ごとのサブフォルダ）
+        workers (int): ワーカープロセス数。省略した場合はCPU数
+        backend (str): 'fitz' または 'pypdf2'。省略した場合は default_backend()
+        every, ranges, bookmark_level, ink_threshold: plan_segments() の引数
+        large_file_pages (int): ページ範囲ごとの作業に分けるファイルのページ数
+        status_callback (function): 作業ごとの結果の辞書を受け取るコールバック関数
+
+    Returns:
+        dict: ファイル数・書き出した部分の数・ページ数・エラーのリスト・処理時間
+    """
+    start = time.perf_counter()
+    backend = backend or default_backend()
+    options = {'mode': mode, 'every': every, 'ranges': ranges, 'bookmark_level': bookmark_level,
+               'ink_threshold': ink_threshold}
+
+    results = []
+    errors = []
+
+    def collect(result):
+        results.append(result)
+        if result['error']:
+            errors.append((result['input'], result['error']))
+        if status_callback:
+            status_callback(result)
+
+    inputs = [str(input_path) for input_path in inputs]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # ファイルを開くのはワーカーだけ（呼び出し元では開かない）
+        first_futures = [executor.submit(split_file, input_path, default_output_dir(input_path, output_root),
+                                         options, backend, large_file_pages)
+                         for input_path in inputs]
+        futures = []
+        for input_path, future in zip(inputs, first_futures):
+            result = future.result()
+            pending = result.pop('pending', [])
+            page_count = result.pop('blank_scan', None)
+            if page_count:
+                # 大きなファイルの白紙の判定をページ範囲ごとに並列に行ってから部分を決める
+                try:
+                    blank_pages = []
+                    for pages in executor.map(_find_blank_range, *zip(*[
+                            (input_path, first, min(first + large_file_pages, page_count), ink_threshold, backend)
+                            for first in range(0, page_count, large_file_pages)])):
+                        blank_pages += pages
+                except Exception as e:
+                    result['error'] = f'{type(e).__name__}: {e}'
+                else:
+                    stem = os.path.splitext(os.path.basename(input_path))[0]
+                    pending = _group_segments(blank_segments(page_count, blank_pages, stem), large_file_pages)
+            if result['error'] or result['segments'] or not page_count:
+                collect(result)
+            for group in pending:
+                futures.append(executor.submit(write_segments, input_path, group,
+                                               default_output_dir(input_path, output_root), backend))
+
+        for future in futures:
+            collect(future.result())
+
+    return {
+        'files': len(inputs),
+        'segments': sum(result['segments'] for result in results),
+        'pages': sum(result['pages'] for result in results),
+        'errors': errors,
+        'backend': backend,
+        'elapsed': round(time.perf_counter() - start, 3),
+    }
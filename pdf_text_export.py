@@ -0,0 +1,231 @@
+"""
+多数のPDFのテキストをまとめて書き出すコマンドラインツール
+
+PDFごとのテキストの抽出をプロセスプールで並列に行い（各ワーカーは一度に1つのPDFだけを開く）、
+結果をJSONL（1行に1ファイル）またはPDFごとの .txt ファイルに書き出す。
+前回から更新日時とサイズが変わっていないPDFは抽出しない。
+抽出できなかったPDFはテキストに混ぜずに、ファイルごとのエラーとして記録する。
+
+例:
+    python pdf_text_export.py archive/ -o archive.jsonl
+    python pdf_text_export.py "scans/**/*.pdf" --txt-dir texts/ -j 8 --summary summary.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from pdf_text_index import extract_pdf_pages, iter_pdf_files
+
+# .txt に書き出すときのページの区切り（pdftotext と同じ改ページ文字）
+PAGE_SEPARATOR = '\f'
+
+
+def collect_pdf_files(sources):
+    """
+    フォルダまたはglobパターンからPDFファイルの一覧を作る
+
+    Args:
+        sources (list): フォルダのパスまたはglobパターンのリスト
+
+    Returns:
+        dict: 絶対パス → stat（パスでソート済み）
+    """
+    files = {}
+    for source in sources:
+        if os.path.isdir(source):
+            files.update(iter_pdf_files(source))
+        else:
+            for path in glob.glob(source, recursive=True):
+                if path.lower().endswith('.pdf') and os.path.isfile(path):
+                    files[os.path.abspath(path)] = os.stat(path)
+    return dict(sorted(files.items()))
+
+
+def _source_base(source):
+    """フォルダならそのフォルダ、globパターンならワイルドカードより前のフォルダの絶対パスを返す"""
+    if os.path.isdir(source):
+        return os.path.abspath(source)
+    parts = []
+    for part in os.path.normpath(source).split(os.sep):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    else:
+        # ワイルドカードのないファイルのパス
+        parts = parts[:-1]
+    return os.path.abspath(os.sep.join(parts) or (os.sep if source.startswith(os.sep) else '.'))
+
+
+def source_root(sources):
+    """
+    .txt の相対パスの基準になるフォルダを返す
+
+    見つかったファイルではなく入力の指定から決めるので、PDFが増えても基準は変わらず、
+    前回書き出した .txt と比べられる。
+    """
+    return os.path.commonpath([_source_base(source) for source in sources])
+
+
+def _txt_path(txt_dir, pdf_path, root):
+    """PDFに対応する .txt ファイルのパスを返す（root からの相対パスを保つ）"""
+    rel_path = os.path.relpath(pdf_path, root)
+    return os.path.join(txt_dir, os.path.splitext(rel_path)[0] + '.txt')
+
+
+def _read_previous_jsonl(jsonl_path):
+    """前回のJSONLに記録された、エラーのないファイルの (更新日時, サイズ) を返す"""
+    previous = {}
+    if not os.path.exists(jsonl_path):
+        return previous
+    with open(jsonl_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if not record.get('error'):
+                previous[record['path']] = (record['mtime_ns'], record['size'])
+    return previous
+
+
+def export_texts(sources, jsonl_path=None, txt_dir=None, workers=None, status_callback=None, root=None):
+    """
+    PDFのテキストを並列に抽出して書き出す
+
+    JSONLの場合は一時ファイルに、変更のないファイルの前回の行と新しく抽出した行を順に書き、
+    最後に置き換える。.txt の場合は書き出したファイルの更新日時をPDFと同じにして、次回の比較に使う。
+
+    Args:
+        sources (list): フォルダのパスまたはglobパターンのリスト
+        jsonl_path (str): JSONLの出力先（txt_dir とどちらかを指定する）
+        txt_dir (str): .txt の出力先フォルダ
+        workers (int): ワーカープロセス数。省略した場合はCPU数
+        status_callback (function): ファイルごとの結果の辞書を受け取るコールバック関数
+        root (str): .txt の相対パスの基準のフォルダ。省略した場合は source_root(sources)
+
+    Returns:
+        dict: ファイル数・抽出した数・変更なしでスキップした数・エラーのリスト・処理時間
+    """
+    if (jsonl_path is None) == (txt_dir is None):
+        raise ValueError('jsonl_path と txt_dir のどちらか一方を指定してください')
+
+    start = time.perf_counter()
+    files = collect_pdf_files(sources)
+    root = os.path.abspath(root) if root else source_root(sources)
+    if txt_dir:
+        outside = [path for path in files if os.path.commonpath([root, path]) != root]
+        if outside:
+            raise ValueError(f'基準のフォルダの外にあるPDFがあります: {outside[0]}（{root}）')
+
+    if jsonl_path:
+        previous = _read_previous_jsonl(jsonl_path)
+        unchanged = {path for path, stat in files.items()
+                     if previous.get(path) == (stat.st_mtime_ns, stat.st_size)}
+    else:
+        unchanged = set()
+        for path, stat in files.items():
+            try:
+                txt_stat = os.stat(_txt_path(txt_dir, path, root))
+            except OSError:
+                continue
+            if txt_stat.st_mtime_ns == stat.st_mtime_ns:
+                unchanged.add(path)
+    targets = [path for path in files if path not in unchanged]
+
+    summary = {'files': len(files), 'extracted': 0, 'unchanged': len(unchanged), 'errors': []}
+    output = None
+    if jsonl_path:
+        os.makedirs(os.path.dirname(os.path.abspath(jsonl_path)), exist_ok=True)
+        tmp_path = f'{jsonl_path}.tmp'
+        output = open(tmp_path, 'w', encoding='utf-8')
+    try:
+        if output is not None and unchanged:
+            # 変更のないファイルは前回の行をそのまま引き継ぐ
+            with open(jsonl_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        path = json.loads(line)['path']
+                    except (ValueError, KeyError):
+                        continue
+                    if path in unchanged:
+                        output.write(line if line.endswith('\n') else line + '\n')
+                        unchanged.discard(path)
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for path, pages, error in executor.map(extract_pdf_pages, targets, chunksize=4):
+                stat = files[path]
+                record = {'path': path, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size,
+                          'pages': len(pages), 'error': error}
+                if error:
+                    summary['errors'].append({'path': path, 'error': error})
+                else:
+                    summary['extracted'] += 1
+
+                if output is not None:
+                    output.write(json.dumps({**record, 'text': pages}, ensure_ascii=False) + '\n')
+                elif not error:
+                    txt_path = _txt_path(txt_dir, path, root)
+                    os.makedirs(os.path.dirname(txt_path), exist_ok=True)
+                    with open(f'{txt_path}.tmp', 'w', encoding='utf-8') as f:
+                        f.write(PAGE_SEPARATOR.join(pages))
+                    os.utime(f'{txt_path}.tmp', ns=(stat.st_atime_ns, stat.st_mtime_ns))
+                    os.replace(f'{txt_path}.tmp', txt_path)
+
+                if status_callback:
+                    status_callback(record)
+    finally:
+        if output is not None:
+            output.close()
+
+    if jsonl_path:
+        os.replace(tmp_path, jsonl_path)
+
+    summary['elapsed'] = round(time.perf_counter() - start, 3)
+    return summary
+
+
+def parse_args(argv=None):
+    """コマンドライン引数を解析する"""
+    parser = argparse.ArgumentParser(description='多数のPDFのテキストを並列で書き出します。')
+    parser.add_argument('sources', nargs='+', help='入力フォルダまたはglobパターン')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('-o', '--jsonl', help='JSONLの出力先 (1行に1ファイル、ページごとのテキストのリスト)')
+    group.add_argument('--txt-dir', help='.txt の出力先フォルダ (ページは改ページ文字で区切る)')
+    parser.add_argument('--root', help='.txt の相対パスの基準のフォルダ (省略時は入力フォルダの共通のフォルダ)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='ワーカープロセス数 (省略時はCPU数)')
+    parser.add_argument('--summary', help='サマリーJSONの出力先 (省略時は標準エラー出力)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """コマンドラインからテキストを書き出す"""
+    args = parse_args(argv)
+
+    def on_result(record):
+        if record['error']:
+            print(f"エラー: {record['path']}: {record['error']}", file=sys.stderr)
+
+    try:
+        summary = export_texts(args.sources, jsonl_path=args.jsonl, txt_dir=args.txt_dir, workers=args.jobs,
+                               status_callback=on_result, root=args.root)
+    except ValueError as e:
+        print(f'エラー: {e}', file=sys.stderr)
+        return 1
+
+    summary_json = json.dumps(summary, ensure_ascii=False, indent=2)
+    if args.summary:
+        with open(args.summary, 'w', encoding='utf-8') as f:
+            f.write(summary_json)
+    else:
+        print(summary_json, file=sys.stderr)
+
+    return 1 if summary['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,285 @@
+"""
+フォルダ内のPDFのテキストを全文検索するための索引
+
+PDFのテキストをページごとにプロセスプールで抽出し、SQLite の FTS5 に保存する。
+FTS5 の trigram トークナイザーを使うので、単語の区切りがない日本語も部分一致で検索できる。
+索引の更新では、更新日時かサイズが変わったPDFだけを抽出し直し、なくなったPDFは索引から削除する。
+
+例:
+    with PdfTextIndex() as index:
+        index.update('documents')
+        for hit in index.search('請求書'):
+            print(hit['path'], hit['page'], hit['snippet'])
+"""
+
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz
+
+# 索引の保存先（環境変数 PDF_TEXT_INDEX_DIR で変更できる）
+DEFAULT_INDEX_DIR = os.environ.get('PDF_TEXT_INDEX_DIR', os.path.join(os.path.expanduser('~'), '.pdf_text_index'))
+# 索引の形式を変えたら番号を上げる（古い索引は作り直される）
+_INDEX_VERSION = 1
+# この件数のPDFを抽出するごとにコミットする
+COMMIT_BATCH_SIZE = 50
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime_ns INTEGER,
+    size INTEGER,
+    page_count INTEGER,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS page_texts (
+    id INTEGER PRIMARY KEY,
+    doc_id INTEGER NOT NULL,
+    page INTEGER NOT NULL,
+    text TEXT
+);
+CREATE INDEX IF NOT EXISTS page_texts_doc ON page_texts (doc_id);
+'''
+
+# テキストは page_texts に1回だけ保存し、FTS5 には索引だけを持たせる（文書の削除は doc_id の索引で行える）
+_FTS_SCHEMA = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(
+    text, content='page_texts', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS page_texts_insert AFTER INSERT ON page_texts BEGIN
+    INSERT INTO pages_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS page_texts_delete AFTER DELETE ON page_texts BEGIN
+    INSERT INTO pages_fts (pages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+'''
+
+
+def default_index_path(index_dir=None):
+    """索引ファイルのパスを返す"""
+    return os.path.join(index_dir or DEFAULT_INDEX_DIR, 'pdf_text_index.sqlite')
+
+
+def extract_pdf_pages(file_path):
+    """
+    PDFのテキストをページごとに抽出する（ワーカープロセスで実行される）
+
+    Args:
+        file_path (str): PDFファイルのパス
+
+    Returns:
+        tuple: (パス, ページごとのテキストのリスト, エラー内容。抽出できた場合は None)
+    """
+    try:
+        with fitz.open(file_path) as pdf_document:
+            return file_path, [page.get_text() for page in pdf_document], None
+    except Exception as e:
+        return file_path, [], f'{type(e).__name__}: {e}'
+
+
+def iter_pdf_files(folder):
+    """
+    フォルダ以下のPDFファイルを os.scandir でたどって返すジェネレーター
+
+    Yields:
+        tuple: (絶対パス, stat)
+    """
+    stack = [os.path.abspath(folder)]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.name.lower().endswith('.pdf') and entry.is_file():
+                            yield entry.path, entry.stat()
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+
+
+def _quote_fts(query):
+    """検索語を FTS5 のフレーズとして扱えるように引用符で囲む"""
+    return '"' + query.replace('"', '""') + '"'
+
+
+def _escape_like(text):
+    """LIKE のワイルドカードをエスケープする（エスケープ文字は \\）"""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class PdfTextIndex:
+    """
+    PDFのテキストの全文検索索引
+
+    Args:
+        db_path (str): 索引ファイルのパス。省略した場合は default_index_path()
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or default_index_path()
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+
+        # 索引の更新は別のスレッドで行うので、接続はスレッドをまたいで使えるようにする
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if version != _INDEX_VERSION:
+            self.conn.executescript('''
+                DROP TABLE IF EXISTS pages_fts;
+                DROP TABLE IF EXISTS page_texts;
+                DROP TABLE IF EXISTS docs;
+            ''')
+            self.conn.execute(f'PRAGMA user_version={_INDEX_VERSION}')
+        self.conn.executescript(_SCHEMA)
+
+        try:
+            self.conn.executescript(_FTS_SCHEMA)
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            # FTS5 または trigram トークナイザーがないSQLite（LIKE で全体を調べる）
+            self.has_fts = False
+
+    def close(self):
+        """索引を閉じる"""
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _delete_doc(self, doc_id):
+        """文書とそのページを索引から削除する"""
+        self.conn.execute('DELETE FROM page_texts WHERE doc_id = ?', (doc_id,))
+        self.conn.execute('DELETE FROM docs WHERE id = ?', (doc_id,))
+
+    def update(self, folder, workers=None, progress_callback=None, cancel_event=None):
+        """
+        フォルダ以下のPDFの索引を更新する
+
+        Args:
+            folder (str): 索引を作るフォルダ
+            workers (int): 抽出に使うプロセス数。省略した場合はCPU数
+            progress_callback (function): (抽出したファイル数, 抽出するファイル数) を受け取るコールバック関数
+            cancel_event (threading.Event): セットされたら途中で終了する（抽出済みの分は保存される）
+
+        Returns:
+            dict: ファイル数・抽出したファイル数・削除したファイル数・エラーのファイル数・処理時間
+        """
+        start = time.perf_counter()
+        folder = os.path.abspath(folder)
+        prefix = os.path.join(folder, '')
+
+        # フォルダ以下の記録済みの文書（folder + os.sep で始まるパスを範囲検索する）
+        known = {path: (doc_id, mtime_ns, size) for doc_id, path, mtime_ns, size in self.conn.execute(
+            'SELECT id, path, mtime_ns, size FROM docs WHERE path >= ? AND path < ?',
+            (prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)))}
+
+        targets = {}
+        total_files = 0
+        for path, stat in iter_pdf_files(folder):
+            total_files += 1
+            record = known.pop(path, None)
+            if record is None or record[1:] != (stat.st_mtime_ns, stat.st_size):
+                targets[path] = stat
+
+        with self.conn:
+            for doc_id, _, _ in known.values():
+                self._delete_doc(doc_id)
+
+        extracted = 0
+        errors = 0
+        if targets:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = executor.map(extract_pdf_pages, list(targets), chunksize=4)
+                self.conn.execute('BEGIN')
+                try:
+                    for path, pages, error in results:
+                        stat = targets[path]
+                        row = self.conn.execute('SELECT id FROM docs WHERE path = ?', (path,)).fetchone()
+                        if row:
+                            self._delete_doc(row[0])
+                        doc_id = self.conn.execute(
+                            'INSERT INTO docs (path, mtime_ns, size, page_count, error) VALUES (?, ?, ?, ?, ?)',
+                            (path, stat.st_mtime_ns, stat.st_size, len(pages), error)).lastrowid
+                        self.conn.executemany('INSERT INTO page_texts (doc_id, page, text) VALUES (?, ?, ?)',
+                                              [(doc_id, number, text) for number, text in enumerate(pages, 1)])
+                        extracted += 1
+                        errors += error is not None
+
+                        if extracted % COMMIT_BATCH_SIZE == 0:
+                            self.conn.commit()
+                            self.conn.execute('BEGIN')
+                        if progress_callback:
+                            progress_callback(extracted, len(targets))
+                        if cancel_event is not None and cancel_event.is_set():
+                            executor.shutdown(cancel_futures=True)
+                            break
+                finally:
+                    self.conn.commit()
+
+        return {
+            'files': total_files,
+            'extracted': extracted,
+            'removed': len(known),
+            'errors': errors,
+            'elapsed': round(time.perf_counter() - start, 3),
+        }
+
+    def search(self, query, limit=100, folder=None):
+        """
+        テキストを検索する
+
+        Args:
+            query (str): 検索する文字列（部分一致）
+            limit (int): 返す結果の最大数
+            folder (str): このフォルダ以下のPDFだけを検索する（省略した場合はすべて）
+
+        Returns:
+            list: {'path', 'page', 'snippet'} の辞書のリスト
+        """
+        query = query.strip()
+        if not query:
+            return []
+
+        conditions = []
+        params = []
+        if self.has_fts and len(query) >= 3:
+            # trigram の索引は3文字以上の検索語で使える
+            source = 'pages_fts JOIN page_texts ON page_texts.id = pages_fts.rowid'
+            conditions.append('pages_fts MATCH ?')
+            params.append(_quote_fts(query))
+            snippet = "snippet(pages_fts, 0, '[', ']', '…', 16)"
+            order = 'ORDER BY rank'
+        else:
+            source = 'page_texts'
+            conditions.append("page_texts.text LIKE ? ESCAPE '\\'")
+            params.append(f'%{_escape_like(query)}%')
+            snippet = 'page_texts.text'
+            order = ''
+
+        if folder:
+            prefix = os.path.join(os.path.abspath(folder), '')
+            conditions.append('docs.path >= ? AND docs.path < ?')
+            params += [prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)]
+
+        sql = (f'SELECT docs.path, page_texts.page, {snippet} FROM {source} '
+               f'JOIN docs ON docs.id = page_texts.doc_id WHERE {" AND ".join(conditions)} {order} LIMIT ?')
+        hits = []
+        for path, page, snippet_text in self.conn.execute(sql, params + [limit]):
+            if snippet == 'page_texts.text':
+                # LIKE で検索したときは、一致した位置の前後を切り出す
+                position = max(snippet_text.lower().find(query.lower()), 0)
+                snippet_text = snippet_text[max(position - 30, 0):position + len(query) + 30]
+            hits.append({'path': path, 'page': page, 'snippet': ' '.join(snippet_text.split())})
+        return hits
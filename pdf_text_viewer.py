@@ -1,7 +1,22 @@
 import os
+import threading
+import time
+from collections import OrderedDict
+
 import fitz
 import PySimpleGUI as sg
 
+from pdf_text_index import PdfTextIndex
+
+# 最初にまとめて表示するページ数
+FIRST_PAGES = 3
+# 残りのページを画面に送る間隔（秒）
+PAGE_BATCH_INTERVAL = 0.2
+# テキストのキャッシュに保持する最大文字数
+TEXT_CACHE_MAX_CHARS = 50_000_000
+# 全文検索で表示する結果の最大数
+SEARCH_LIMIT = 200
+
 
 class GuiFrontend:
     def __init__(self):
@@ -13,6 +28,10 @@ class GuiFrontend:
             [sg.Text('フォルダを選択してください')],
             [sg.Input(key='-FOLDER-', enable_events=True), sg.FolderBrowse()],
             [sg.Listbox(values=[], size=(40, 20), key='-FILE_LIST-', enable_events=True)],
+            [sg.Text('フォルダ以下のPDFを全文検索')],
+            [sg.Input(key='-QUERY-', size=(30, 1)), sg.Button('検索', key='-SEARCH-', bind_return_key=True)],
+            [sg.Text('', key='-INDEX_STATUS-', size=(40, 1))],
+            [sg.Listbox(values=[], size=(40, 15), key='-HITS-', enable_events=True, horizontal_scroll=True)],
         ]
 
         return sg.Column(layout, vertical_alignment='t', size=(400, 800))
@@ -20,6 +39,7 @@ class GuiFrontend:
     def right_col(self):
         """右側の列を返す　テキスト表示画面"""
         layout = [
+            [sg.Text('', key='-STATUS-', size=(80, 1))],
             [sg.Multiline(size=(80, 80), key='-PDF_CONTENT-', disabled=True)],
         ]
 
@@ -40,26 +60,163 @@ class GuiFrontend:
                          finalize=True)
 
 
+class TextCache:
+    """
+    抽出したテキストを (パス, 更新日時) をキーに保持するLRUキャッシュ
+
+    合計の文字数が上限を超えたら、最も長く使われていないものから削除する。
+    """
+
+    def __init__(self, max_chars=TEXT_CACHE_MAX_CHARS):
+        self.max_chars = max_chars
+        self.total_chars = 0
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(file_path):
+        """キャッシュのキーを返す（ファイルが更新されるとキーが変わる）"""
+        return os.path.abspath(file_path), os.stat(file_path).st_mtime_ns
+
+    def get(self, key):
+        with self.lock:
+            text = self.items.get(key)
+            if text is not None:
+                self.items.move_to_end(key)
+            return text
+
+    def put(self, key, text):
+        with self.lock:
+            if key in self.items:
+                self.total_chars -= len(self.items.pop(key))
+            self.items[key] = text
+            self.total_chars += len(text)
+            while self.total_chars > self.max_chars and len(self.items) > 1:
+                _, removed = self.items.popitem(last=False)
+                self.total_chars -= len(removed)
+
+
 class PdfReader:
     def __init__(self):
         self.folder_path = None
         self.pdf_files = []
+        self.text_cache = TextCache()
+        # 表示中のファイルの番号（別のファイルを選んだら古い抽出結果を捨てるため）
+        self.generation = 0
+        self.cancel_event = None
+        self.text_index = None
+        self.index_cancel_event = None
+        self.hits = []
 
     def get_pdf_file_list(self):
         self.pdf_files = [file for file in os.listdir(self.folder_path) if file.lower().endswith('.pdf')]
 
+    def iter_pdf_pages(self, file_path, cancel_event=None):
+        """ページのテキストを1ページずつ返すジェネレーター"""
+        with fitz.open(file_path) as pdf_document:
+            for page_num in range(pdf_document.page_count):
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                yield pdf_document.load_page(page_num).get_text()
+
     def read_pdf_text(self, file_path):
-        pdf_text = ""
         try:
-            pdf_document = fitz.open(file_path)
-            num_pages = pdf_document.page_count
-            for page_num in range(num_pages):
-                page = pdf_document.load_page(page_num)
-                pdf_text += page.get_text()
+            key = self.text_cache.key(file_path)
+            pdf_text = self.text_cache.get(key)
+            if pdf_text is None:
+                pdf_text = "".join(self.iter_pdf_pages(file_path))
+                self.text_cache.put(key, pdf_text)
         except Exception as e:
             pdf_text = f"Error: {str(e)}"
         return pdf_text
 
+    def extract_worker(self, window, file_path, key, generation, cancel_event):
+        """
+        ページのテキストを抽出して画面に送る（ワーカースレッドで実行される）
+
+        最初の FIRST_PAGES ページはすぐに送り、残りは PAGE_BATCH_INTERVAL 秒ごとにまとめて送る。
+        最後まで抽出できたらキャッシュに保存する。
+        """
+        pages = []
+        batch = []
+        last_sent = time.monotonic()
+        try:
+            with fitz.open(file_path) as pdf_document:
+                total = pdf_document.page_count
+                for page_num in range(total):
+                    if cancel_event.is_set():
+                        return
+                    text = pdf_document.load_page(page_num).get_text()
+                    pages.append(text)
+                    batch.append(text)
+
+                    now = time.monotonic()
+                    if page_num + 1 == FIRST_PAGES or now - last_sent >= PAGE_BATCH_INTERVAL:
+                        window.write_event_value('-PAGES-', (generation, "".join(batch), page_num + 1, total))
+                        batch = []
+                        last_sent = now
+
+            if not cancel_event.is_set():
+                self.text_cache.put(key, "".join(pages))
+                window.write_event_value('-PAGES-', (generation, "".join(batch), total, total))
+        except Exception as e:
+            window.write_event_value('-PDF_ERROR-', (generation, f"Error: {str(e)}"))
+
+    def show_pdf(self, window, pdf_path):
+        """PDFのテキストを表示する（キャッシュにあればすぐに表示し、なければワーカースレッドで抽出する）"""
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+        self.generation += 1
+
+        try:
+            key = self.text_cache.key(pdf_path)
+        except OSError as e:
+            window['-PDF_CONTENT-'].update(f"Error: {str(e)}")
+            window['-STATUS-'].update('')
+            return
+
+        pdf_text = self.text_cache.get(key)
+        if pdf_text is not None:
+            window['-PDF_CONTENT-'].update(pdf_text)
+            window['-STATUS-'].update('')
+            return
+
+        window['-PDF_CONTENT-'].update('')
+        window['-STATUS-'].update('読み込み中...')
+        self.cancel_event = threading.Event()
+        threading.Thread(target=self.extract_worker,
+                         args=(window, pdf_path, key, self.generation, self.cancel_event),
+                         daemon=True).start()
+
+    def index_worker(self, window, folder, cancel_event):
+        """フォルダ以下のPDFの全文検索索引を更新する（ワーカースレッドで実行される）"""
+        def on_progress(done, total):
+            window.write_event_value('-INDEX_PROGRESS-', (folder, done, total))
+
+        try:
+            with PdfTextIndex() as text_index:
+                result = text_index.update(folder, progress_callback=on_progress, cancel_event=cancel_event)
+            window.write_event_value('-INDEX_DONE-', (folder, f"索引: {result['files']} 件のPDF"))
+        except Exception as e:
+            window.write_event_value('-INDEX_DONE-', (folder, f"索引の更新に失敗しました: {str(e)}"))
+
+    def start_indexing(self, window):
+        """選択したフォルダの索引の更新をバックグラウンドで始める"""
+        if self.index_cancel_event is not None:
+            self.index_cancel_event.set()
+        self.index_cancel_event = threading.Event()
+        window['-INDEX_STATUS-'].update('索引を更新中...')
+        threading.Thread(target=self.index_worker, args=(window, self.folder_path, self.index_cancel_event),
+                         daemon=True).start()
+
+    def search(self, window, query):
+        """全文検索して結果を表示する"""
+        if self.text_index is None:
+            self.text_index = PdfTextIndex()
+        self.hits = self.text_index.search(query, limit=SEARCH_LIMIT, folder=self.folder_path)
+        window['-HITS-'].update([
+            f"{os.path.relpath(hit['path'], self.folder_path)} p.{hit['page']}: {hit['snippet']}" for hit in self.hits])
+
     def run(self):
         gui_frontend = GuiFrontend()
         window = gui_frontend.window()
@@ -74,14 +231,53 @@ class PdfReader:
                 self.folder_path = values['-FOLDER-']
                 self.get_pdf_file_list()
                 window['-FILE_LIST-'].update(self.pdf_files)
+                self.start_indexing(window)
 
             elif event == '-FILE_LIST-':
-                selected_file = values['-FILE_LIST-'][0]
+                selected_file = values['-FILE_LIST-'][0] if values['-FILE_LIST-'] else None
                 if selected_file:
                     pdf_path = os.path.join(self.folder_path, selected_file)
-                    pdf_text = self.read_pdf_text(pdf_path)
-                    window['-PDF_CONTENT-'].update(pdf_text)
+                    self.show_pdf(window, pdf_path)
+
+            elif event == '-PAGES-':
+                generation, text, done, total = values[event]
+                if generation == self.generation:
+                    window['-PDF_CONTENT-'].update(text, append=True)
+                    window['-STATUS-'].update('' if done == total else f'読み込み中... {done} / {total} ページ')
+
+            elif event == '-SEARCH-':
+                if self.folder_path and values['-QUERY-'].strip():
+                    self.search(window, values['-QUERY-'])
+
+            elif event == '-HITS-':
+                selected = window['-HITS-'].get_indexes()
+                if selected:
+                    hit = self.hits[selected[0]]
+                    self.show_pdf(window, hit['path'])
+                    window['-STATUS-'].update(f"{os.path.basename(hit['path'])} の {hit['page']} ページに一致")
+
+            elif event == '-INDEX_PROGRESS-':
+                folder, done, total = values[event]
+                if folder == self.folder_path:
+                    window['-INDEX_STATUS-'].update(f'索引を更新中... {done} / {total}')
+
+            elif event == '-INDEX_DONE-':
+                folder, message = values[event]
+                if folder == self.folder_path:
+                    window['-INDEX_STATUS-'].update(message)
+
+            elif event == '-PDF_ERROR-':
+                generation, message = values[event]
+                if generation == self.generation:
+                    window['-PDF_CONTENT-'].update(message)
+                    window['-STATUS-'].update('')
 
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+        if self.index_cancel_event is not None:
+            self.index_cancel_event.set()
+        if self.text_index is not None:
+            self.text_index.close()
         window.close()
 
 
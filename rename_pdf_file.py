@@ -1,8 +1,24 @@
+import json
 import os
+import queue
+import threading
+from collections import OrderedDict
+from datetime import datetime
 
 import fitz
 import PySimpleGUI as sg
 
+from invoice_fields import FieldExtractor
+
+# 表示する画像の最大の横幅（ピクセル）
+RENDER_MAX_WIDTH = 680
+# 描画済みのページ画像（PNG）を保持するメモリの上限（バイト）
+RENDER_CACHE_BYTES = 64 * 1024 * 1024
+# フォルダを順に処理するときに、先に1ページ目を描画しておくファイル数
+QUEUE_PRERENDER_COUNT = 5
+# ファイル名の変更を記録するジャーナル（PDFと同じフォルダに作る）
+JOURNAL_NAME = '.rename_journal.jsonl'
+
 
 class GuiFrontend:
     """PDF RenameアプリのGUIフロントエンドを定義するクラス"""
@@ -22,6 +38,8 @@ class GuiFrontend:
              sg.FileBrowse(file_types=accepted_file_types, button_text='選択'),  # ファイル選択ダイアログを表示するボタン
              sg.Button('前へ'),  # 前のページに移動するボタン
              sg.Button('次へ')],  # 次のページに移動するボタン
+            [sg.Text('フォルダ'), sg.InputText(key='FOLDER_NAME', enable_events=True, disabled=True),  # フォルダのパス
+             sg.FolderBrowse(button_text='選択')],  # フォルダ内のPDFを順に処理する
             [sg.Image(data=None, key='IMAGE')],  # 画像を表示するためのイメージウィジェット
         ]
 
@@ -35,7 +53,9 @@ class GuiFrontend:
             [sg.Text('日　付'), sg.Input(key='date_input')],  # 日付の入力フィールド
             [sg.Text('取引先'), sg.Input(key='partner_input')],  # 取引先の入力フィールド
             [sg.Text('金　額'), sg.Input(key='amount_input')],  # 金額の入力フィールド
-            [sg.Button('実行', bind_return_key=True)],  # 実行ボタン
+            [sg.Button('実行', bind_return_key=True), sg.Button('元に戻す')],  # 実行ボタン、直前の変更を取り消すボタン
+            [sg.Text('', key='QUEUE_STATUS', size=(45, 1))],  # フォルダの処理状況
+            [sg.Text('', key='RENAME_STATUS', size=(45, 2))],  # ファイル名の変更結果
         ]
 
         return sg.Column(layout=layout, vertical_alignment='t', size=(400, 800))
@@ -55,46 +75,280 @@ class GuiFrontend:
                          finalize=True)
 
 
+class RenderCache:
+    """
+    描画済みのページ画像（PNGのバイト列）を (ドキュメント, ページ番号) をキーに保持するLRUキャッシュ
+
+    合計のバイト数が上限を超えたら、最も長く使われていないものから削除する。
+    """
+
+    def __init__(self, max_bytes=RENDER_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.items
+
+    def get(self, key):
+        with self.lock:
+            data = self.items.get(key)
+            if data is not None:
+                self.items.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        with self.lock:
+            if key in self.items:
+                self.total_bytes -= len(self.items.pop(key))
+            self.items[key] = data
+            self.total_bytes += len(data)
+            while self.total_bytes > self.max_bytes and len(self.items) > 1:
+                _, removed = self.items.popitem(last=False)
+                self.total_bytes -= len(removed)
+
+
 class GuiBackend:
     def __init__(self):
         self.doc = None
-        self.doc_list_tab = []
+        self.doc_key = None
+        self.render_cache = RenderCache()
+        # fitz のドキュメントは複数のスレッドから同時に使えないので、操作はこのロックの中で行う
+        self.fitz_lock = threading.Lock()
+        self.prefetch_queue = queue.Queue()
+        self.prefetch_thread = threading.Thread(target=self.prefetch_worker, daemon=True)
+        self.prefetch_thread.start()
+        self.thumbnail_queue = queue.Queue()
+        self.thumbnail_thread = threading.Thread(target=self.thumbnail_worker, daemon=True)
+        self.thumbnail_thread.start()
+
+    @staticmethod
+    def doc_key_of(doc_name):
+        """ドキュメントのキーを返す（ファイルが更新されたら別のドキュメントとして扱う）"""
+        return os.path.abspath(doc_name), os.stat(doc_name).st_mtime_ns
+
+    @staticmethod
+    def render_pixmap(page):
+        """横幅が RENDER_MAX_WIDTH 以下になる倍率でページを描画する"""
+        zoom = min(1.0, RENDER_MAX_WIDTH / page.rect.width) if page.rect.width else 1.0
+        return page.get_pixmap(alpha=False, matrix=fitz.Matrix(zoom, zoom))
 
     def set_doc(self, doc_name):
         """PDFドキュメントを設定する"""
-        self.doc = fitz.open(doc_name)
+        with self.fitz_lock:
+            if self.doc is not None:
+                self.doc.close()
+            self.doc = fitz.open(doc_name)
+            self.doc_key = self.doc_key_of(doc_name)
         file_name = os.path.basename(doc_name)
         return file_name
 
+    def close_doc(self):
+        """PDFドキュメントを閉じる"""
+        with self.fitz_lock:
+            if self.doc is not None:
+                self.doc.close()
+            self.doc = None
+            self.doc_key = None
+
     def get_page_count(self):
         """ページ数を返す"""
         return len(self.doc)
 
+    def render_page(self, doc_key, page_num):
+        """
+        ページを描画してPNGのバイト列を返す
+
+        描画する前に page.rect から倍率を決めるので、横幅が RENDER_MAX_WIDTH を超えるページも1回の描画で済む。
+        ドキュメントが切り替わっていた場合は None を返す。
+        """
+        with self.fitz_lock:
+            if doc_key != self.doc_key:
+                return None
+            pix = self.render_pixmap(self.doc[page_num])
+        # PNGへの変換はロックの外で行う
+        data = pix.tobytes()
+        self.render_cache.put((doc_key, page_num), data)
+        return data
+
     def get_page(self, page_num=0):
         """
         指定されたページ番号に対応するPDFのページを返す
         :param page_num: ページ番号 (デフォルト: 0)
         :return: ページの画像データ  (バイト列)
         """
+        doc_key = self.doc_key
+        data = self.render_cache.get((doc_key, page_num))
+        if data is None:
+            data = self.render_page(doc_key, page_num)
+
+        # 前後のページをバックグラウンドで描画しておく
+        page_count = self.get_page_count()
+        self.prefetch_queue.put((doc_key, [(page_num + 1) % page_count, (page_num - 1) % page_count]))
+        return data
+
+    def prefetch_worker(self):
+        """先読みの要求を順に処理する（バックグラウンドのスレッドで実行される）"""
+        while True:
+            request = self.prefetch_queue.get()
+            # たまった要求は最新のものだけを処理する
+            while not self.prefetch_queue.empty():
+                request = self.prefetch_queue.get_nowait()
+
+            doc_key, pages = request
+            for page_num in pages:
+                if doc_key != self.doc_key or not self.prefetch_queue.empty():
+                    break
+                if (doc_key, page_num) not in self.render_cache:
+                    try:
+                        self.render_page(doc_key, page_num)
+                    except Exception:
+                        # 先読みの失敗は表示するときに改めて描画するので無視する
+                        break
+
+    def prerender_first_pages(self, doc_names):
+        """これから開くファイルの1ページ目をバックグラウンドで描画しておく"""
+        self.thumbnail_queue.put(list(doc_names))
+
+    def thumbnail_worker(self):
+        """1ページ目の先読みの要求を順に処理する（バックグラウンドのスレッドで実行される）"""
+        while True:
+            doc_names = self.thumbnail_queue.get()
+            while not self.thumbnail_queue.empty():
+                doc_names = self.thumbnail_queue.get_nowait()
+
+            for doc_name in doc_names:
+                if not self.thumbnail_queue.empty():
+                    break
+                try:
+                    doc_key = self.doc_key_of(doc_name)
+                    if (doc_key, 0) in self.render_cache:
+                        continue
+                    with self.fitz_lock:
+                        with fitz.open(doc_name) as doc:
+                            pix = self.render_pixmap(doc[0])
+                    self.render_cache.put((doc_key, 0), pix.tobytes())
+                except Exception:
+                    # 開けないファイルは表示するときにエラーにする
+                    continue
 
-        # もし表示リストが存在しない場合、またはリストの長さがページ番号+1よりも短い場合
-        # またはリストの該当する位置がNoneである場合、表示リストを取得してリストに格納する
-        if len(self.doc_list_tab) < page_num + 1 or not self.doc_list_tab[page_num]:
-            self.doc_list_tab.extend([None] * (page_num + 1 - len(self.doc_list_tab)))
-            self.doc_list_tab[page_num] = self.doc[page_num].get_displaylist()
 
-        # 指定されたページ番号に対応する表示リストを取得する
-        doc_list = self.doc_list_tab[page_num]
+def read_journal(folder):
+    """
+    フォルダのジャーナルから、まだ取り消していない変更を古い順に返す
 
-        # 表示リストからピクセルマップを取得する
-        pix = doc_list.get_pixmap(alpha=False)
+    エラーのない変更を積み、エラーのない取り消しでその変更を除く。
+    変更後のファイルがもうないか、変更前の名前のファイルがある変更は取り消せないので除く。
 
-        # もしファイルのサイズの幅が680以上だったら、横幅が680以下になるように縮小する
-        if pix.width > 680:
-            zoom = 680 / pix.width
-            pix = doc_list.get_pixmap(alpha=False, matrix=fitz.Matrix(zoom, zoom))
+    Returns:
+        list: (変更前のパス, 変更後のパス) のリスト
+    """
+    done = []
+    try:
+        with open(os.path.join(folder, JOURNAL_NAME), encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get('error'):
+                    continue
+                if entry.get('action') == 'rename':
+                    done.append((entry['src'], entry['dst']))
+                elif entry.get('action') == 'undo':
+                    # 取り消しは (変更後のパス → 変更前のパス) として記録されている
+                    undone = (entry['dst'], entry['src'])
+                    for i in range(len(done) - 1, -1, -1):
+                        if done[i] == undone:
+                            del done[i]
+                            break
+    except OSError:
+        return []
+    return [(src, dst) for src, dst in done if os.path.exists(dst) and not os.path.exists(src)]
+
+
+class RenameCommitter:
+    """
+    ファイル名の変更をバックグラウンドのスレッドで順に行うクラス
+
+    変更と取り消しはPDFと同じフォルダのジャーナル（JOURNAL_NAME）に1行ずつ記録する。
+    フォルダを読み込むとジャーナルから取り消せる変更を復元するので、再起動しても元に戻せる。
+    結果は notify(イベント名, (変更前のパス, 変更後のパス, エラー内容)) で知らせる。
+    """
+
+    def __init__(self, notify):
+        self.notify = notify
+        self.queue = queue.Queue()
+        # 取り消せる変更 (変更前のパス, 変更後のパス) のスタック
+        self.done = []
+        self.thread = threading.Thread(target=self.worker, daemon=True)
+        self.thread.start()
+
+    def rename(self, src, dst):
+        """ファイル名の変更を予約する"""
+        self.queue.put(('rename', src, dst))
+
+    def undo(self):
+        """直前のファイル名の変更の取り消しを予約する"""
+        self.queue.put(('undo', None, None))
+
+    def load(self, folder):
+        """フォルダのジャーナルから、取り消せる変更の復元を予約する"""
+        self.queue.put(('load', folder, None))
+
+    def close(self):
+        """予約済みの変更をすべて行ってからスレッドを終了する"""
+        self.queue.put(None)
+        self.thread.join()
+
+    def worker(self):
+        """予約された変更を順に行う（バックグラウンドのスレッドで実行される）"""
+        while (item := self.queue.get()) is not None:
+            action, src, dst = item
+            if action == 'rename':
+                error = self.move(src, dst, action)
+                if error is None:
+                    self.done.append((src, dst))
+                self.notify('-RENAMED-', (src, dst, error))
+                continue
+
+            if action == 'load':
+                # このフォルダの変更はジャーナルの内容で置き換える（この実行中の変更もジャーナルに含まれる）
+                folder = os.path.abspath(src)
+                self.done = [(old, new) for old, new in self.done
+                             if os.path.dirname(os.path.abspath(new)) != folder] + read_journal(folder)
+                continue
 
-        return pix.tobytes()
+            if not self.done:
+                self.notify('-UNDONE-', (None, None, '取り消せる変更がありません'))
+                continue
+            src, dst = self.done.pop()
+            error = self.move(dst, src, action)
+            if error is not None:
+                self.done.append((src, dst))
+            self.notify('-UNDONE-', (src, dst, error))
+
+    @staticmethod
+    def move(src, dst, action):
+        """ファイル名を変更してジャーナルに記録し、失敗した場合はエラー内容を返す"""
+        try:
+            if os.path.exists(dst):
+                raise FileExistsError(f'同じ名前のファイルがあります: {os.path.basename(dst)}')
+            os.rename(src, dst)
+            error = None
+        except OSError as e:
+            error = str(e)
+
+        entry = {'time': datetime.now().isoformat(timespec='seconds'), 'action': action,
+                 'src': src, 'dst': dst, 'error': error}
+        try:
+            with open(os.path.join(os.path.dirname(dst), JOURNAL_NAME), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        except OSError:
+            pass
+        return error
 
 
 class PdfReader:
@@ -107,6 +361,12 @@ class PdfReader:
         self.page = 0
         self.total_page = 0
         self.doc_name = None
+        # フォルダを順に処理するときのファイルのリストと、表示中のファイルの位置
+        self.queue_files = []
+        self.queue_index = 0
+        self.committer = RenameCommitter(self.window.write_event_value)
+        # 日付・取引先・金額の抽出（バックグラウンドで行い、'-FIELDS-' で結果が届く）
+        self.extractor = FieldExtractor(self.window.write_event_value, fitz_lock=self.backend.fitz_lock)
 
     @staticmethod
     def get_next_page(page, total_count):
@@ -128,6 +388,50 @@ class PdfReader:
         else:
             return page
 
+    def open_doc(self, doc_name):
+        """PDFを開いて1ページ目を表示し、日付・取引先・金額の抽出を始める"""
+        self.doc_name = doc_name
+        for key in ('date_input', 'partner_input', 'amount_input'):
+            self.window[key].update(value='')
+        file_name = self.backend.set_doc(self.doc_name)  # ファイル名を取得
+        self.window['DOC_NAME'].update(value=file_name)  # ファイル名を表示
+        self.total_page = self.backend.get_page_count()
+        self.page = 0
+        self.extractor.request([self.doc_name])
+
+    def clear_doc(self):
+        """表示中のPDFを閉じて画面を空にする"""
+        self.backend.close_doc()  # ファイルを閉じる
+        self.doc_name = None
+        self.window['IMAGE'].update(data=None)
+        self.window['DOC_NAME'].update(value='')
+
+    def open_queue_file(self):
+        """フォルダの処理中のファイルを開き、続くファイルの1ページ目を先読みする"""
+        remaining = len(self.queue_files) - self.queue_index
+        if remaining <= 0:
+            self.clear_doc()
+            self.window['QUEUE_STATUS'].update('フォルダのファイルはすべて処理しました')
+            return False
+
+        self.backend.prerender_first_pages(
+            self.queue_files[self.queue_index + 1:self.queue_index + 1 + QUEUE_PRERENDER_COUNT])
+        self.open_doc(self.queue_files[self.queue_index])
+        self.window['QUEUE_STATUS'].update(f'{self.queue_index + 1} / {len(self.queue_files)} 件目（残り {remaining} 件）')
+        return True
+
+    def load_folder(self, folder):
+        """フォルダ内のPDFを順に処理する"""
+        self.queue_files = sorted(os.path.join(folder, name) for name in os.listdir(folder)
+                                  if name.lower().endswith('.pdf'))
+        self.queue_index = 0
+        # 以前の実行で変更したファイルも元に戻せるように、ジャーナルから取り消せる変更を復元する
+        self.committer.load(folder)
+        opened = self.open_queue_file()
+        # 続くファイルの項目も順に抽出しておき、次のファイルを開いたらすぐに入力できるようにする
+        self.extractor.request(self.queue_files[1:])
+        return opened
+
     def event_loop(self):
         """イベントループする"""
         next_page_event = ('次へ', 'MouseWheel:Down')
@@ -141,15 +445,54 @@ class PdfReader:
             if event == sg.WIN_CLOSED:
                 break
 
-            if event == 'DOC_NAME':
-                self.doc_name = values['DOC_NAME']
-                file_name = self.backend.set_doc(self.doc_name)  # ファイル名を取得
-                self.window['DOC_NAME'].update(value=file_name)  # ファイル名を表示
-
-                self.total_page = self.backend.get_page_count()
-                self.page = 0
+            if event == 'DOC_NAME' and values['DOC_NAME'] and os.path.isfile(values['DOC_NAME']):
+                # ファイルを選んだら、フォルダの処理をやめて1つのファイルを処理する
+                self.queue_files = []
+                self.window['QUEUE_STATUS'].update('')
+                self.open_doc(values['DOC_NAME'])
                 is_page_update = True
 
+            if event == 'FOLDER_NAME' and values['FOLDER_NAME']:
+                is_page_update = self.load_folder(values['FOLDER_NAME'])
+
+            # ファイル名の変更の結果（バックグラウンドのスレッドから届く）
+            if event == '-RENAMED-':
+                src, dst, error = values[event]
+                if error:
+                    sg.popup(f'ファイル名を変更できませんでした: {os.path.basename(src)}\n{error}', title='エラー')
+                    if self.queue_files:
+                        # 変更できなかったファイルはフォルダの最後にもう一度処理する
+                        self.queue_files.append(src)
+                        self.window['QUEUE_STATUS'].update(
+                            f'{self.queue_index + 1} / {len(self.queue_files)} 件目')
+                elif self.queue_files:
+                    self.window['RENAME_STATUS'].update(f'変更しました: {os.path.basename(dst)}')
+                else:
+                    sg.popup(f'ファイル名を変更しました！ {os.path.basename(dst)}', title='完了')
+
+            if event == '元に戻す':
+                self.committer.undo()
+
+            if event == '-UNDONE-':
+                src, dst, error = values[event]
+                if error:
+                    self.window['RENAME_STATUS'].update(f'取り消せませんでした: {error}')
+                else:
+                    self.window['RENAME_STATUS'].update(f'元に戻しました: {os.path.basename(src)}')
+                    if self.queue_files:
+                        # 元に戻したファイルをもう一度処理する
+                        self.queue_files.insert(self.queue_index, src)
+                        is_page_update = self.open_queue_file()
+
+            # 抽出した項目を、表示中のファイルのまだ入力されていない欄に入れる
+            if event == '-FIELDS-':
+                file_path, fields = values[event]
+                if file_path == self.doc_name:
+                    for key, field in (('date_input', 'date'), ('partner_input', 'partner'),
+                                       ('amount_input', 'amount')):
+                        if fields[field] and not values[key]:
+                            self.window[key].update(value=fields[field])
+
             # doc_nameが指定されていないときにイベントが発生したら、何もしない
             if event and not self.doc_name:
                 continue
@@ -188,18 +531,26 @@ class PdfReader:
                 # もし日付と相手と金額が入力されていたら、ファイル名を変更する
                 if date and partner and amount:
                     if self.doc_name:
-                        self.backend.doc.close()  # ファイルを閉じる
                         new_filename = f"{date}_{partner}_{amount}.pdf"
                         new_filepath = os.path.join(os.path.dirname(self.doc_name), new_filename)
 
-                        os.rename(self.doc_name, new_filepath)
-
-                        sg.popup(f'ファイル名を変更しました！ {new_filename}', title='完了')
-                        self.window['IMAGE'].update(data=None)
-                        self.window['DOC_NAME'].update(value='')
+                        # ファイルを閉じてから、名前の変更はバックグラウンドで行う
+                        src = self.doc_name
+                        self.extractor.learn(src, partner)  # 入力された取引先名を次回のために覚える
+                        self.clear_doc()
+                        self.committer.rename(src, new_filepath)
+
+                        # フォルダを処理中なら、すぐに次のファイルを表示する
+                        if self.queue_files:
+                            self.queue_index += 1
+                            if self.open_queue_file():
+                                self.window['IMAGE'].Update(data=self.backend.get_page(self.page))
                 else:
                     sg.popup('すべて入力してください')
 
+        self.committer.close()
+        self.window.close()
+
 
 def main():
     gui = PdfReader()
@@ -1,10 +1,13 @@
 import os
 import re
-from pathlib import PureWindowsPath, Path
+import threading
 
 import PySimpleGUI as sg
 import fitz
-import win32com.client as win32
+
+from invoice_fields import FieldExtractor
+from mail_dispatch import MailDispatcher, load_mail_config
+from pdf_rename_core import move_file, plan_rename, validate_fields
 
 
 class GuiFrontend:
@@ -42,6 +45,7 @@ class GuiFrontend:
             [sg.Text('不採用'), sg.Checkbox('', key='not_adopted_input')],  # 不採用を自動入力するかどうかのチェックボックス
             [sg.Button('リネーム実行', key='rename_button'),  # リネーム実行ボタン
              sg.Button('メール送信', key='send_email_button')],  # メール送信ボタン
+            [sg.Text('', key='MAIL_STATUS', size=(50, 2))],  # メール送信の状況
         ]
 
         return sg.Column(layout=layout, vertical_alignment='t', size=(400, 800))
@@ -66,10 +70,13 @@ class GuiBackend:
     def __init__(self):
         self.doc = None
         self.doc_list_tab = []
+        # 項目の抽出のスレッドと fitz を同時に使わないためのロック
+        self.fitz_lock = threading.Lock()
 
     def set_doc(self, doc_name):
         """PDFドキュメントを設定する"""
-        self.doc = fitz.open(doc_name)
+        with self.fitz_lock:
+            self.doc = fitz.open(doc_name)
         self.doc_list_tab = []  # 新しいPDFファイルを開く際に表示リストを初期化
         file_name = os.path.basename(doc_name)
         return file_name
@@ -85,24 +92,25 @@ class GuiBackend:
         :return: ページの画像データ  (バイト列)
         """
 
-        # もし表示リストが存在しない場合、またはリストの長さがページ番号+1よりも短い場合
-        # またはリストの該当する位置がNoneである場合、表示リストを取得してリストに格納する
-        if len(self.doc_list_tab) < page_num + 1 or not self.doc_list_tab[page_num]:
-            self.doc_list_tab.extend([None] * (page_num + 1 - len(self.doc_list_tab)))
-            self.doc_list_tab[page_num] = self.doc[page_num].get_displaylist()
+        with self.fitz_lock:
+            # もし表示リストが存在しない場合、またはリストの長さがページ番号+1よりも短い場合
+            # またはリストの該当する位置がNoneである場合、表示リストを取得してリストに格納する
+            if len(self.doc_list_tab) < page_num + 1 or not self.doc_list_tab[page_num]:
+                self.doc_list_tab.extend([None] * (page_num + 1 - len(self.doc_list_tab)))
+                self.doc_list_tab[page_num] = self.doc[page_num].get_displaylist()
 
-        # 指定されたページ番号に対応する表示リストを取得する
-        doc_list = self.doc_list_tab[page_num]
+            # 指定されたページ番号に対応する表示リストを取得する
+            doc_list = self.doc_list_tab[page_num]
 
-        # 表示リストからピクセルマップを取得する
-        pix = doc_list.get_pixmap(alpha=False)
+            # 表示リストからピクセルマップを取得する
+            pix = doc_list.get_pixmap(alpha=False)
 
-        # もしファイルのサイズの幅が680以上だったら、横幅が680以下になるように縮小する
-        if pix.width > 680:
-            zoom = 680 / pix.width
-            pix = doc_list.get_pixmap(alpha=False, matrix=fitz.Matrix(zoom, zoom))
+            # もしファイルのサイズの幅が680以上だったら、横幅が680以下になるように縮小する
+            if pix.width > 680:
+                zoom = 680 / pix.width
+                pix = doc_list.get_pixmap(alpha=False, matrix=fitz.Matrix(zoom, zoom))
 
-        return pix.tobytes()
+            return pix.tobytes()
 
 
 class PdfReader:
@@ -115,6 +123,11 @@ class PdfReader:
         self.page = 0
         self.total_page = 0
         self.doc_name = None
+        # ファイル名から読み取れないときに、PDFの内容から日付・取引先・金額を抽出する
+        self.extractor = FieldExtractor(self.window.write_event_value, fitz_lock=self.backend.fitz_lock)
+        # メールはバックグラウンドで送信し、'-MAIL_SENT-' で結果が届く
+        self.mailer = MailDispatcher.from_config(load_mail_config(), notify=self.window.write_event_value)
+        self.mail_pending = 0
 
     @staticmethod
     def get_next_page(page, total_count):
@@ -169,6 +182,30 @@ class PdfReader:
                         self.window['not_adopted_input'].update(value=True)
                     else:
                         self.window['not_adopted_input'].update(value=False)
+                else:
+                    # 整形済みのファイル名でなければ、PDFの内容からバックグラウンドで抽出する
+                    for key in ('date_input', 'partner_input', 'amount_input'):
+                        self.window[key].update(value='')
+                    self.extractor.request([self.doc_name])
+
+            # 抽出した項目を、表示中のファイルのまだ入力されていない欄に入れる
+            if event == '-FIELDS-':
+                file_path, fields = values[event]
+                if file_path == self.doc_name:
+                    for key, field in (('date_input', 'date'), ('partner_input', 'partner'),
+                                       ('amount_input', 'amount')):
+                        if fields[field] and not values[key]:
+                            self.window[key].update(value=fields[field])
+
+            # メール送信の結果（バックグラウンドのスレッドから届く）
+            if event == '-MAIL_SENT-':
+                files, error = values[event]
+                self.mail_pending -= len(files)
+                names = ', '.join(os.path.basename(file_path) for file_path in files)
+                if error:
+                    self.window['MAIL_STATUS'].update(f'メールを送信できませんでした: {names}\n{error}')
+                else:
+                    self.window['MAIL_STATUS'].update(f'メールを送信しました: {names}（送信待ち: {self.mail_pending} 件）')
 
             # doc_nameが指定されていないときにイベントが発生したら、何もしない
             if event and not self.doc_name:
@@ -201,6 +238,10 @@ class PdfReader:
                     renamed_file_path = os.path.join(os.path.dirname(new_filepath), new_filename)
                     self.send_email(renamed_file_path, values_dict)
 
+        # 予約済みのメールを送り終えてから閉じる
+        self.mailer.close()
+        self.window.close()
+
     @staticmethod
     def extract_info_from_filename(file_name):
         # ファイル名が「数値1_文字列1_数値2_文字列2_不」の場合
@@ -235,70 +276,56 @@ class PdfReader:
         return new_filename, new_filepath, values_dict
 
     def rename_pdf(self, date, partner, amount, section, not_adopted, save_folder):
-        """PDFをリネームする"""
-        if not date.isdigit() or len(date) != 8:
-            sg.popup('日付を8桁の数字で入力してください')
-            return
-
-        if not amount.isdigit():
-            sg.popup('金額を数字で入力してください')
-            return
-
-        if not section:
-            sg.popup('区分を入力してください')
-            return
-
-        # ファイル名の前の文字が '不' だった場合
-        if not_adopted and self.doc_name.startswith('不'):
-            adopted_text = ''  # 何もしない
-        else:
-            adopted_text = '_不' if not_adopted else ''
-
-        if date and partner and amount and section:
-            if self.doc_name:
-                self.backend.doc.close()  # ファイルを閉じる
-                new_filename = f'{date}_{partner}_{amount}_{section}{adopted_text}.pdf'
-
-                # pathlibを使用してパスを作成
-                new_filepath = PureWindowsPath(save_folder) / new_filename if save_folder else PureWindowsPath(
-                    self.doc_name).parent / new_filename
-
-                # ファイルの移動
-                Path(self.doc_name).rename(new_filepath)
-
-                sg.popup(f'ファイル名を変更しました！ {new_filename}', title='完了')
-                self.window['IMAGE'].update(data=None)
-                self.window['DOC_NAME'].update(value='')
-                return new_filename, str(new_filepath)
-        else:
-            sg.popup('すべて入力してください')
+        """
+        PDFをリネームする（検証と名前の組み立ては pdf_rename_core で行う）
 
-    @staticmethod
-    def send_email(file_path, values_list):
-        outlook = win32.Dispatch('Outlook.Application')
-        mail_item = outlook.CreateItem(0)  # メールアイテムを作成
-
-        mail_text = (
-            f'次のとおり電子取引データを送付するのでよろしくお願いします🌷 \n\n'
-            f'日　　付:{values_list["date"]}\n'
-            f'取引先名:{values_list["partner"]}\n'
-            f'金　　額:{values_list["amount"]}\n'
-            f'区　　分:{values_list["section"]}\n'
-        )
-
-        if values_list['not_adopted']:
-            mail_text += f'この{values_list["section"]}は採用されませんでした🙅‍\n'
-
-        mail_item.To = 'test@test.ne.jp'
-        mail_item.Subject = '電子取引データの送付について'  # 件名を設定
-        mail_item.Body = mail_text  # 本文を設定
-
-        # ファイルを添付
-        attachment = os.path.abspath(file_path)
-        mail_item.Attachments.Add(attachment)
-
-        # メールを表示（送信前確認）
-        mail_item.Display()
+        Returns:
+            tuple: (新しいファイル名, 新しいパス)。リネームしなかった場合は (None, None)
+        """
+        if not self.doc_name:
+            return None, None
+
+        errors = validate_fields(date, partner, amount, section)
+        if errors:
+            sg.popup(errors[0])
+            return None, None
+
+        new_filepath = plan_rename(self.doc_name, date, partner, amount, section, not_adopted, save_folder or None)
+        new_filename = os.path.basename(new_filepath)
+
+        self.extractor.learn(self.doc_name, partner)  # 入力された取引先名を次回のために覚える
+        if self.backend.doc is not None:
+            self.backend.doc.close()  # ファイルを閉じる
+            self.backend.doc = None
+
+        # ファイルの移動（別のドライブの保存先にも移動できる）
+        try:
+            move_file(self.doc_name, new_filepath)
+        except OSError as e:
+            sg.popup(f'ファイル名を変更できませんでした: {e}', title='エラー')
+            if os.path.exists(self.doc_name):
+                self.backend.set_doc(self.doc_name)  # 開き直して続けられるようにする
+            else:
+                # 元のファイルがなくなっていれば、開いていない状態に戻す
+                self.clear_doc()
+            return None, None
+
+        sg.popup(f'ファイル名を変更しました！ {new_filename}', title='完了')
+        # リネームしたファイルは開いていない状態にして、続けて押されてもリネームしない
+        self.clear_doc()
+        return new_filename, new_filepath
+
+    def clear_doc(self):
+        """開いているPDFの表示を消し、開いていない状態にする"""
+        self.doc_name = None
+        self.window['IMAGE'].update(data=None)
+        self.window['DOC_NAME'].update(value='')
+
+    def send_email(self, file_path, values_dict):
+        """メールの送信を予約する（送信は待たない）"""
+        self.mailer.submit(file_path, values_dict)
+        self.mail_pending += 1
+        self.window['MAIL_STATUS'].update(f'メール送信待ち: {self.mail_pending} 件')
 
 
 def main():
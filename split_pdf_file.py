@@ -1,40 +1,119 @@
 """
 同一ディレクトリにあるPDFファイルをページごとに分割する
-pip install PyPDF2
+pip install PyMuPDF  （または pip install PyPDF2）
+
+引数を指定すると、N ページごと・ページ範囲・しおり・白紙のページで分割できる。
+ファイルはプロセスプールで並列に分割し（ページ数の多いファイルはページ範囲ごとに分ける）、
+各ファイルは1回だけ開く。
+
+例:
+    python split_pdf_file.py
+    python split_pdf_file.py scans/*.pdf --every 10 -o split/ -j 8
+    python split_pdf_file.py book.pdf --bookmark --bookmark-level 2
+    python split_pdf_file.py batch_scan.pdf --blank --summary summary.json
+    python split_pdf_file.py report.pdf --ranges "1-3,4-10,11-"
 """
 
+import argparse
+import glob
+import json
+import os
+import sys
 from pathlib import Path
-import PyPDF2
 
+from pdf_split_engine import BACKENDS, BLANK_INK_RATIO, LARGE_FILE_PAGES, split_file, split_pdf_files
+
+
+def split_pdf(input_path, backend=None):
+    """
+    PDFファイルを1ページずつのファイルに分割する
 
-def split_pdf(input_path):
+    元のファイル名と同じ名前のフォルダに {ページ番号}_{元のファイル名}.pdf として保存する。
+
+    Args:
+        input_path (str): PDFファイルのパス
+        backend (str): 'fitz' または 'pypdf2'。省略した場合は使えるほう（fitz を優先）
+
+    Returns:
+        dict: {'input', 'segments', 'pages', 'error'}
+    """
     # 入力ファイルのPathオブジェクトを作成
     input_path = Path(input_path)
 
-    # 出力ディレクトリを作成（元のファイル名と同じ名前のディレクトリを作成）
+    # 出力ディレクトリ（元のファイル名と同じ名前のディレクトリ）
     output_dir = input_path.with_name(input_path.stem)
-    output_dir.mkdir(exist_ok=True)
 
-    # PDFファイルを開く
-    with input_path.open('rb') as file:
-        # PyPDF2のPdfReaderオブジェクトを作成
-        pdf_reader = PyPDF2.PdfReader(file)
+    # ファイルを1回だけ開いて、各ページを個別のPDFファイルとして保存
+    return split_file(str(input_path), str(output_dir), {'mode': 'page'}, backend)
 
-        # 各ページを個別のPDFファイルとして保存
-        for page_number in range(len(pdf_reader.pages)):
-            pdf_writer = PyPDF2.PdfWriter()
-            pdf_writer.add_page(pdf_reader.pages[page_number])
 
-            output_path = output_dir / f'{page_number + 1}_{input_path.stem}.pdf'
+def collect_input_files(sources):
+    """ファイル・フォルダ・globパターンから入力PDFファイルのリストを作成する"""
+    input_files = []
+    for source in sources:
+        if os.path.isdir(source):
+            input_files += sorted(str(path) for path in Path(source).iterdir() if path.suffix.lower() == '.pdf')
+        else:
+            input_files += sorted(glob.glob(source)) or [source]
+    return list(dict.fromkeys(input_files))
 
-            with output_path.open('wb') as output_file:
-                pdf_writer.write(output_file)
 
+def parse_args(argv=None):
+    """コマンドライン引数を解析する"""
+    parser = argparse.ArgumentParser(description='PDFファイルを分割します。')
+    parser.add_argument('sources', nargs='*', help='PDFファイル・フォルダ・globパターン (省略時はカレントディレクトリ)')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--every', type=int, help='N ページごとに分割する')
+    mode.add_argument('--ranges', help='指定したページ範囲で分割する (例: "1-3,4-10,11-")')
+    mode.add_argument('--bookmark', action='store_true', help='しおりの項目ごとに分割する')
+    mode.add_argument('--blank', action='store_true', help='白紙のページを区切りにして分割する (白紙のページは出力しない)')
+    parser.add_argument('--bookmark-level', type=int, default=1, help='区切りにするしおりの階層 (1 は最上位だけ)')
+    parser.add_argument('--blank-threshold', type=float, default=BLANK_INK_RATIO,
+                        help='白紙とみなすインクの割合 (0〜1)')
+    parser.add_argument('-o', '--output', help='出力先フォルダ (省略時は入力ファイルと同じフォルダ。ファイルごとのサブフォルダに保存)')
+    parser.add_argument('--backend', choices=BACKENDS, help='分割方法 (省略時は fitz があれば fitz)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='ワーカープロセス数 (省略時はCPU数)')
+    parser.add_argument('--large-file-pages', type=int, default=LARGE_FILE_PAGES,
+                        help='このページ数より多いファイルはページ範囲ごとに並列に処理する')
+    parser.add_argument('--summary', help='サマリーJSONの出力先')
+    return parser.parse_args(argv)
 
-if __name__ == '__main__':
-    # カレントディレクトリにある全てのPDFファイルを取得
-    pdf_files = [file for file in Path.cwd().iterdir() if file.suffix == '.pdf']
 
-    # 各PDFファイルを分割する
-    for pdf_file in pdf_files:
-        split_pdf(pdf_file)
+def main(argv=None):
+    """コマンドラインからPDFを分割する"""
+    args = parse_args(argv)
+
+    input_files = collect_input_files(args.sources or ['.'])
+    if not input_files:
+        print('分割するPDFがありません', file=sys.stderr)
+        return 1
+
+    if args.every:
+        mode = 'every'
+    elif args.ranges:
+        mode = 'ranges'
+    elif args.bookmark:
+        mode = 'bookmark'
+    elif args.blank:
+        mode = 'blank'
+    else:
+        mode = 'page'
+
+    def on_result(result):
+        status = f"エラー: {result['error']}" if result['error'] else f"{result['segments']} ファイル"
+        print(f"{result['input']}: {status}", file=sys.stderr)
+
+    summary = split_pdf_files(input_files, mode, output_root=args.output, workers=args.jobs, backend=args.backend,
+                              every=args.every or 1, ranges=args.ranges, bookmark_level=args.bookmark_level,
+                              ink_threshold=args.blank_threshold, large_file_pages=args.large_file_pages,
+                              status_callback=on_result)
+    print(f"{summary['files']} ファイル → {summary['segments']} ファイル, {summary['pages']} ページ "
+          f"({summary['backend']}, {summary['elapsed']} 秒)", file=sys.stderr)
+    if args.summary:
+        Path(args.summary).write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding='utf-8')
+    return 1 if summary['errors'] else 0
+
+
+if __name__ == '__main__':
+    # 引数がなければ従来どおりカレントディレクトリにある全てのPDFファイルを1ページずつに分割する
+    sys.exit(main())
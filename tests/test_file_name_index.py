@@ -0,0 +1,59 @@
+"""
+ファイル名の索引の検索が、フォルダをたどった結果と一致することを確かめるテスト
+
+FTS5 の trigram の索引は、3文字未満の固定の文字しかないパターンには何も返さないので、
+そのようなパターンでも索引なしの検索と同じ結果になることを確かめる。
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from copy_files_with_pattern import iter_matching_files  # noqa: E402
+from file_name_index import FileNameIndex  # noqa: E402
+
+FILE_NAMES = ['売上_2024.csv', '日本語.csv', '月次売上.csv', 'sales_2024.csv', 'memo.txt', os.path.join('sub', '売上.csv')]
+
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    """テスト用のファイルを作ったフォルダ（索引は一時フォルダに作る）"""
+    monkeypatch.setattr('file_name_index.DEFAULT_INDEX_DIR', str(tmp_path / 'index'))
+    root = tmp_path / 'files'
+    for name in FILE_NAMES:
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text('')
+    return str(root)
+
+
+def walk_search(root, match):
+    """フォルダをたどって、ファイル名が match に一致するファイルのパスを返す"""
+    return sorted(os.path.join(directory, name) for directory, _, names in os.walk(root) for name in names
+                  if match(name))
+
+
+@pytest.mark.parametrize('pattern, mode, match', [
+    ('売上', 'substring', lambda name: '売上' in name),
+    ('本語', 'substring', lambda name: '本語' in name),
+    ('日', 'substring', lambda name: '日' in name),
+    ('sales', 'substring', lambda name: 'sales' in name),
+    ('売*', 'glob', lambda name: name.startswith('売')),
+])
+def test_index_search_matches_walk(source, pattern, mode, match):
+    with FileNameIndex(source, db_path=os.path.join(os.path.dirname(source), 'index.sqlite')) as index:
+        index.refresh()
+        found = sorted(index.search(pattern, mode=mode))
+    assert found == walk_search(source, match)
+    assert found
+
+
+@pytest.mark.parametrize('patterns', [['売上'], ['本語', 'sales'], ['日']])
+def test_iter_matching_files_index_matches_walk(source, patterns):
+    indexed = sorted(iter_matching_files(patterns, [source], ['.csv'], use_index=True))
+    walked = sorted(iter_matching_files(patterns, [source], ['.csv'], use_index=False))
+    assert indexed == walked
+    assert indexed